@@ -0,0 +1,331 @@
+"""Headless benchmarks for the prompt builder hot paths (parse, init, assembly, presets)
+
+Runs scripts/b_prompt_builder.py against the stub gradio/modules packages in benchmarks/stubs
+on synthetic layouts, reporting time (best of N runs) and peak traced memory per phase.
+The layout lexer (B_Layout_Lexer.readLine) is timed next to the readLine it replaced (readLineReference).
+The import of the core package (lib_b_prompt_builder) is timed in fresh interpreters and must stay
+under import_time_max_ms without pulling in gradio or the webui modules (also checked by tests/test_import.py).
+Results are compared to benchmarks/baseline.json and any regression past the tolerances exits with 1.
+
+    python benchmarks/bench_b_prompt_builder.py [--sizes 10,1000,10000,100000] [--runs 3] [--save]
+
+Timings are machine dependent, so the baseline is per machine and not committed (it is git ignored):
+save it once with --save on a known good commit, then run without --save to compare a change against it.
+"""
+
+import argparse
+import gc
+import subprocess
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing
+
+path_bench = os.path.dirname(os.path.abspath(__file__))
+path_root = os.path.dirname(path_bench)
+path_script = os.path.join(path_root, "scripts", "b_prompt_builder.py")
+path_baseline = os.path.join(path_bench, "baseline.json")
+
+sizes_default = [10, 1000, 10000, 100000]
+
+tolerance_time = 1.5
+tolerance_time_min_ms = 1.0
+tolerance_memory = 1.25
+tolerance_memory_min_kib = 64.0
+
+import_time_max_ms = 50.0
+import_modules_forbidden = ["gradio", "modules"]
+
+dropdown_choice_count = 48
+preset_count_max = 20
+
+def writeConfig(path_base: str, layout: str, presets: str) -> str:
+    path_config = os.path.join(path_base, "scripts", "b_prompt_builder")
+    os.makedirs(path_config, exist_ok = True)
+    with open(os.path.join(path_config, "layout.txt"), "w", encoding = "utf8") as file:
+        file.write(layout)
+    with open(os.path.join(path_config, "presets.txt"), "w", encoding = "utf8") as file:
+        file.write(presets)
+    return path_config
+
+def buildLayout(prompt_count: int) -> str:
+    """One tab per 50 prompts: a SINGLE, an EDIT and a SELECT holding the rest as DUAL choices"""
+    lines: list[str] = []
+
+    tab = 0
+    remaining = prompt_count
+    while remaining > 0:
+        choice_count = max(0, min(dropdown_choice_count, remaining - 2))
+        lines.append(f"TAB Tab {tab}")
+        lines.append(f"\tSINGLE Single {tab} --pp single {tab} --sp 1.1")
+        lines.append(f"\tEDIT Edit {tab} --a left {tab} --b right {tab} --r 25")
+        lines.append(f"\tSELECT Dropdown {tab} --v Choice {tab}_0, Choice {tab}_1::sp 1.2")
+        for choice in range(choice_count):
+            lines.append(f"\t\tDUAL Choice {tab}_{choice} --pp choice {tab} {choice} --pn not {tab} {choice}")
+        lines.append("\tEND")
+        lines.append("END")
+
+        remaining -= choice_count + 2
+        tab += 1
+
+    lines.append(".")
+    return "\n".join(lines) + "\n"
+
+def buildPresets(prompt_count: int) -> str:
+    """One preset per 100 prompts up to preset_count_max (alternating additive), each setting a few neighbouring tabs"""
+    lines: list[str] = []
+
+    tab_count = -(-prompt_count // (dropdown_choice_count + 2))
+    for preset in range(max(1, min(preset_count_max, prompt_count // 100))):
+        lines.append(f"PRESET Preset {preset} --is_additive {preset % 2}")
+        for tab in range(preset, min(preset + 3, tab_count)):
+            lines.append(f"\tSET Single {tab} --pp preset {preset} --sp 1.3")
+            lines.append(f"\tSET Edit {tab} --r 75")
+            lines.append(f"\tSET Dropdown {tab} --v Choice {tab}_1, Choice {tab}_2::sn 1.1")
+        lines.append("END")
+
+    lines.append(".")
+    return "\n".join(lines) + "\n"
+
+def readLineReference(l: str) -> tuple[str, str, dict[str, str]]:
+    """B_UI_Master.readLine as it was before B_Layout_Lexer, kept to compare the lexer against (raises on an argument without a value)"""
+    l = l.strip()
+    
+    l_type: str = l
+    l_name: str = None
+    l_args: dict[str, str] = {}
+    
+    if len(l) > 0:
+        index = l.find(" ")
+        if index != -1:
+            l_type = l[:index]
+        
+        l = l[len(l_type) + 1:]
+        
+        l_arg_index = l.find("--")
+        if l_arg_index == -1:
+            l_name = l
+        elif l_arg_index > 0:
+            l_name = l[:l_arg_index - 1 if l_arg_index > -1 else len(l)]
+            l = l[len(l_name) + 1:]
+        
+        l_args = {}
+        for l_arg in l.split("--")[1:]:
+            l_arg_name = l_arg[:l_arg.index(" ")]
+            l_arg_value = l_arg[len(l_arg_name) + 1:].strip()
+            l_args[l_arg_name] = l_arg_value
+        
+    return l_type, l_name, l_args
+
+def benchmarkImport(runs: int) -> tuple[dict[str, dict[str, float]], list[str]]:
+    """Import the core in fresh interpreters (stubs not on the path) and report any UI module it loads"""
+    code = (
+        "import sys, time, json, tracemalloc\n"
+        "trace = sys.argv[1] == '1'\n"
+        "if trace: tracemalloc.start()\n"
+        "t = time.perf_counter()\n"
+        "import lib_b_prompt_builder\n"
+        "t = (time.perf_counter() - t) * 1000\n"
+        "peak = tracemalloc.get_traced_memory()[1] / 1024 if trace else 0\n"
+        f"loaded = [k for k in {import_modules_forbidden!r} if k in sys.modules]\n"
+        "print(json.dumps([t, peak, loaded]))\n"
+    )
+    
+    def _run(trace: bool) -> tuple[float, float, list[str]]:
+        output = subprocess.run([sys.executable, "-c", code, "1" if trace else "0"], cwd = path_root, capture_output = True, text = True, check = True).stdout
+        return json.loads(output)
+    
+    ms = min(_run(False)[0] for _ in range(runs))
+    _, peak_kib, loaded = _run(True)
+
+    return {"import lib_b_prompt_builder": {"ms": ms, "peak_kib": peak_kib}}, loaded
+
+def loadScript():
+    sys.path.insert(0, os.path.join(path_bench, "stubs"))
+    sys.path.insert(0, path_root)
+
+    # Script.b_ui_master is built at import: point it at an empty config
+    path_base = tempfile.mkdtemp(prefix = "b_bench_")
+    writeConfig(path_base, ".\n", ".\n")
+    os.environ["B_BENCH_BASEDIR"] = path_base
+
+    spec = importlib.util.spec_from_file_location("b_prompt_builder", path_script)
+    m = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(m)
+    return m
+
+def runPhases(m, path_base: str, layout: str, measure: typing.Callable[[str, typing.Callable[[], typing.Any]], typing.Any]) -> None:
+    m.B_Prompt_Map.clear()
+    m.B_UI_Map.clear()
+    m.b_path_base = path_base
+
+    # Parse and init are timed separately, so skip __init__ (which runs both)
+    b_ui_master = m.B_UI_Master.__new__(m.B_UI_Master)
+    b_ui_master.path_layout = os.path.join(path_base, "scripts", "b_prompt_builder", "layout.txt")
+    b_ui_master.path_presets = os.path.join(path_base, "scripts", "b_prompt_builder", "presets.txt")
+
+    def _readLines():
+        line_number = 0
+        for l in layout.splitlines():
+            line_number += 1
+            m.B_UI_Master.readLine(l, line_number)
+    measure("readLine", _readLines)
+
+    def _readLinesReference():
+        for l in layout.splitlines():
+            readLineReference(l)
+    measure("readLine (pre-lexer reference)", _readLinesReference)
+
+    m.use_layout_cache = False
+    measure("parseLayout", b_ui_master.parseLayout)
+
+    m.B_Prompt_Map.clear()
+    m.B_UI_Map.clear()
+    m.use_layout_cache = True
+    b_ui_master.readLines(b_ui_master.path_layout)
+    b_ui_master.layout = measure("parseLayout (cached)", b_ui_master.parseLayout)
+    b_ui_master.presets = measure("parsePresets", b_ui_master.parsePresets)
+    measure("resolve", m.B_Prompt_Map.resolve)
+
+    def _init():
+        m.B_UI_Container.initDeferredChildren(b_ui_master.layout)
+        for b_ui in b_ui_master.layout + b_ui_master.presets:
+            b_ui.init()
+    measure("init", _init)
+
+    def _selectAll():
+        for b_prompt in [b_prompt for b_prompt in m.B_Prompt_Map._map if b_prompt is not None]:
+            m.B_Prompt_Map.update(b_prompt)
+    _selectAll()
+    measure("buildPromptUpdate", m.B_Prompt_Map.buildPromptUpdate)
+
+    b_prompt_edit = m.B_Prompt_Map.get("Edit 0")
+    def _buildPromptUpdateIncremental():
+        for i in range(100):
+            b_prompt_edit.values.update("edit", i)
+            m.B_Prompt_Map.buildPromptUpdate()
+    measure("buildPromptUpdate (x100 after 1 change)", _buildPromptUpdateIncremental)
+
+    def _applyPresets():
+        for preset in b_ui_master.presets:
+            preset.apply()
+    measure("B_UI_Preset.apply (all)", _applyPresets)
+
+def benchmark(m, size: int, runs: int) -> dict[str, dict[str, float]]:
+    layout = buildLayout(size)
+    path_base = tempfile.mkdtemp(prefix = f"b_bench_{size}_")
+    writeConfig(path_base, layout, buildPresets(size))
+
+    results: dict[str, dict[str, float]] = {}
+
+    def _measureTime(phase: str, fn: typing.Callable[[], typing.Any]):
+        # Like timeit: collection pauses are the main source of noise between runs
+        gc.collect()
+        gc.disable()
+        try:
+            t = time.perf_counter()
+            value = fn()
+            t = (time.perf_counter() - t) * 1000
+        finally:
+            gc.enable()
+        result = results.setdefault(phase, {})
+        result["ms"] = min(result.get("ms", t), t)
+        return value
+
+    def _measureMemory(phase: str, fn: typing.Callable[[], typing.Any]):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        value = fn()
+        results[phase]["peak_kib"] = (tracemalloc.get_traced_memory()[1] - current) / 1024
+        return value
+
+    for _ in range(runs):
+        runPhases(m, path_base, layout, _measureTime)
+
+    # Separate pass: tracing slows allocations down too much to time under it
+    tracemalloc.start()
+    try:
+        runPhases(m, path_base, layout, _measureMemory)
+    finally:
+        tracemalloc.stop()
+
+    return results
+
+def compare(results: dict[str, dict[str, dict[str, float]]], baseline: dict[str, dict[str, dict[str, float]]]) -> list[str]:
+    regressions: list[str] = []
+    for size, phases in results.items():
+        for phase, result in phases.items():
+            result_base = baseline.get(size, {}).get(phase)
+            if result_base is None:
+                continue
+
+            ms, ms_base = result["ms"], result_base["ms"]
+            if ms > ms_base * tolerance_time and ms - ms_base > tolerance_time_min_ms:
+                regressions.append(f"{size} prompts / {phase}: {ms:.2f} ms vs {ms_base:.2f} ms baseline")
+
+            kib, kib_base = result["peak_kib"], result_base["peak_kib"]
+            if kib > kib_base * tolerance_memory and kib - kib_base > tolerance_memory_min_kib:
+                regressions.append(f"{size} prompts / {phase}: {kib:.0f} KiB peak vs {kib_base:.0f} KiB baseline")
+    return regressions
+
+def printResults(title: str, phases: dict[str, dict[str, float]]) -> None:
+    print(f"\n{title}")
+    for phase, result in phases.items():
+        print(f"  {phase:<42}{result['ms']:>12.2f} ms{result['peak_kib']:>12.0f} KiB")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description = "Benchmark the prompt builder hot paths")
+    parser.add_argument("--sizes", default = ",".join(map(str, sizes_default)), help = "comma separated prompt counts")
+    parser.add_argument("--runs", type = int, default = 3, help = "timed runs per size (best is kept)")
+    parser.add_argument("--save", action = "store_true", help = "store the results as the new baseline")
+    args = parser.parse_args()
+
+    results: dict[str, dict[str, dict[str, float]]] = {}
+    failures: list[str] = []
+
+    results["import"], loaded = benchmarkImport(max(5, args.runs))
+    printResults("import", results["import"])
+    result_import = results["import"]["import lib_b_prompt_builder"]
+    if len(loaded) > 0:
+        failures.append(f"import lib_b_prompt_builder: loads {', '.join(loaded)}")
+    if result_import["ms"] > import_time_max_ms:
+        failures.append(f"import lib_b_prompt_builder: {result_import['ms']:.2f} ms over the {import_time_max_ms:.0f} ms budget")
+
+    m = loadScript()
+
+    for size in map(int, args.sizes.split(",")):
+        results[str(size)] = benchmark(m, size, max(1, args.runs))
+        printResults(f"{size} prompts", results[str(size)])
+        phases = results[str(size)]
+        print(f"  {'readLine vs pre-lexer reference':<42}{phases['readLine']['ms'] / max(phases['readLine (pre-lexer reference)']['ms'], 1e-6):>12.2f} x")
+
+    baseline: dict[str, dict[str, dict[str, float]]] = {}
+    if os.path.isfile(path_baseline):
+        with open(path_baseline, "r", encoding = "utf8") as file:
+            baseline = json.load(file)
+
+    if args.save:
+        for size, phases in results.items():
+            baseline[size] = {phase: {k: round(v, 3) for k, v in result.items()} for phase, result in phases.items()}
+        with open(path_baseline, "w", encoding = "utf8") as file:
+            json.dump(baseline, file, indent = 4)
+        print(f"\nBaseline saved -> {path_baseline}")
+    elif len(baseline) == 0:
+        print("\nNo baseline to compare with on this machine (run with --save on a known good commit first)")
+
+    regressions = failures + (compare(results, baseline) if not args.save else [])
+    if len(regressions) > 0:
+        print("\nREGRESSION")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+
+    print("\nNo regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,9 @@
+"""Stand-in for gradio: the benchmarked paths (parse, init, assembly, presets) never build UI"""
+
+__version__ = "3.41.2"
+
+class Request:
+    session_hash: str = None
+
+def update(**kwargs):
+    return kwargs
@@ -0,0 +1,5 @@
+def process_images(p):
+    return p
+
+def fix_seed(p):
+    pass
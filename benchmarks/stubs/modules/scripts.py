@@ -0,0 +1,7 @@
+import os
+
+def basedir() -> str:
+    return os.environ["B_BENCH_BASEDIR"]
+
+class Script:
+    pass
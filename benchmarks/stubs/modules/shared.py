@@ -0,0 +1 @@
+state = None
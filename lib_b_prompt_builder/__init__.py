@@ -0,0 +1,11 @@
+"""Prompt builder core: prompt model, layout lexer and prompt assembly, importable without gradio or the webui"""
+
+from .common import printGeneral, printWarning, B_Symbols
+from .prompt import B_Value, B_Prompt, B_Prompt_Single, B_Prompt_Dual, B_Prompt_Edit, B_Prompt_Edit_Link, B_Prompt_Entries, B_Prompt_Entry, B_Prompt_State, B_Prompt_Map
+from .sampler import B_Sampler
+from .layout import B_Layout_Lexer, B_Layout_Cache
+from .tokens import B_Tokens
+from .tags import B_Tags
+from .events import B_Event_Stats, B_Events, B_Event_Profiler
+from .startup import B_Startup
+from .choices import B_Choice_File
@@ -0,0 +1,141 @@
+"""Dropdown choices read from a text file (one per line), indexed once so only the entries shown or selected are decoded"""
+
+import typing
+import collections
+import threading
+import bisect
+import os
+import random
+import re
+from array import array
+
+from .common import printWarning
+
+class B_Choice_File():
+    """Entries are the non-empty lines not starting with #, stripped; search is case-insensitive for ASCII"""
+    page_size: int = 100
+    _searches_max: int = 32 # Cached searches per file
+
+    _files: dict[str, "B_Choice_File"] = {}
+    _files_lock = threading.Lock()
+
+    _entry = re.compile(rb"^[ \t]*([^#\s][^\r\n]*?)[ \t]*\r?$", re.MULTILINE)
+
+    @staticmethod
+    def get(path: str) -> typing.Optional["B_Choice_File"]:
+        """Shared by every dropdown using the path, read and indexed again if the file changed since"""
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            printWarning(B_Choice_File, "get()", f"File not read ({type(e).__name__}) -> '{path}'")
+            return None
+
+        with B_Choice_File._files_lock:
+            choice_file = B_Choice_File._files.get(path)
+            if choice_file is None or choice_file.stat != (stat.st_mtime_ns, stat.st_size):
+                try:
+                    choice_file = B_Choice_File(path)
+                except OSError as e:
+                    printWarning(B_Choice_File, "get()", f"File not read ({type(e).__name__}) -> '{path}'")
+                    return None
+                B_Choice_File._files[path] = choice_file
+        return choice_file
+
+    def __init__(self, path: str):
+        self.path = path
+
+        # A copy rather than a mapping: a file truncated in place would make reads of a mapping fault (SIGBUS)
+        with open(path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            self.stat = stat.st_mtime_ns, stat.st_size
+            self.data: bytes = file.read()
+
+        # Byte offsets of each entry (the one index built, entries are decoded on demand)
+        self.starts: array = array("q")
+        self.ends: array = array("q")
+        for match in B_Choice_File._entry.finditer(self.data):
+            self.starts.append(match.start(1))
+            self.ends.append(match.end(1))
+
+        self._searches: collections.OrderedDict[str, array] = collections.OrderedDict() # Lowercase query -> entry indexes
+        self._searches_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def getEntry(self, i: int) -> str:
+        return self.data[self.starts[i]:self.ends[i]].decode("utf8", "replace").lstrip("\ufeff")
+
+    def find(self, entry: str) -> int:
+        """Index of an entry, -1 if not in the file"""
+        if len(entry) == 0:
+            return -1
+        match = re.search(rb"^[ \t]*(?:\xef\xbb\xbf)?" + re.escape(entry.encode("utf8")) + rb"[ \t]*\r?$", self.data, re.MULTILINE)
+        if match is None:
+            return -1
+        i = bisect.bisect_right(self.starts, match.end() - 1) - 1
+        return i if i >= 0 and self.starts[i] >= match.start() else -1
+
+    def search(self, query: str) -> array | range:
+        """Indexes of the entries containing query, in file order (all of them for an empty query);
+        a query extending a cached one (as when typing) only searches within its results"""
+        query = query.strip().lower()
+        if len(query) == 0:
+            return range(len(self))
+
+        indexes_within: array = None
+        with self._searches_lock:
+            indexes = self._searches.get(query)
+            if indexes is not None:
+                self._searches.move_to_end(query)
+                return indexes
+            for query_cached, indexes_cached in self._searches.items():
+                if query_cached in query and (indexes_within is None or len(indexes_cached) < len(indexes_within)):
+                    indexes_within = indexes_cached
+
+        pattern = re.compile(re.escape(query.encode("utf8")), re.IGNORECASE)
+        data = self.data
+        starts = self.starts
+        ends = self.ends
+        indexes = array("l")
+        if indexes_within is not None:
+            for i in indexes_within:
+                if pattern.search(data, starts[i], ends[i]) is not None:
+                    indexes.append(i)
+        else:
+            pos = 0
+            while True:
+                match = pattern.search(data, pos)
+                if match is None:
+                    break
+                i = bisect.bisect_right(starts, match.start()) - 1
+                if i >= 0 and match.end() <= ends[i]:
+                    indexes.append(i)
+                    pos = ends[i] # Next entry
+                else:
+                    pos = match.start() + 1 # Within a comment or blank
+
+        with self._searches_lock:
+            self._searches[query] = indexes
+            while len(self._searches) > B_Choice_File._searches_max:
+                self._searches.popitem(last = False)
+        return indexes
+
+    def getPage(self, query: str, page: int, page_size: int = None) -> tuple[list[str], int, int]:
+        """Entries of a page (from 1, clamped) of the search results; returns them, the page and the page count"""
+        indexes, page, pages = self.getPageIndexes(query, page, page_size)
+        return [self.getEntry(i) for i in indexes], page, pages
+    
+    def getPageIndexes(self, query: str, page: int, page_size: int = None) -> tuple[array | range, int, int]:
+        """As getPage(), with the indexes of the entries"""
+        if page_size is None or page_size <= 0:
+            page_size = B_Choice_File.page_size
+        indexes = self.search(query)
+        pages = max(1, -(-len(indexes) // page_size))
+        page = min(max(1, page), pages)
+        return indexes[(page - 1) * page_size:page * page_size], page, pages
+
+    def sample(self, rng: random.Random, count: int) -> list[str]:
+        """Distinct entries drawn uniformly"""
+        return [self.getEntry(i) for i in rng.sample(range(len(self)), min(count, len(self)))]
@@ -0,0 +1,56 @@
+"""Shared helpers of the prompt builder core"""
+
+import typing
+import threading
+
+b_folder_name_cache = ".cache"
+
+def printGeneral(message: str) -> None:
+    print(f"* B Prompt builder: {message}")
+
+def printWarning(type: type, name: str, message: str) -> None:
+    printGeneral(f"WARNING/{type.__name__}/{name}: {message}")
+
+class B_Symbols():
+    """Dense integer ids of names, assigned once per process (kept across reloads) so registries can be id-indexed lists"""
+    _ids: dict[str, int] = {}
+    _names: list[str] = []
+    _lock = threading.Lock()
+
+    @staticmethod
+    def intern(name: str) -> int:
+        i = B_Symbols._ids.get(name)
+        if i is None:
+            with B_Symbols._lock:
+                i = B_Symbols._ids.get(name)
+                if i is None:
+                    i = len(B_Symbols._names)
+                    B_Symbols._names.append(name)
+                    B_Symbols._ids[name] = i
+        return i
+    
+    @staticmethod
+    def get(name: str) -> int:
+        """-1 if the name was never interned"""
+        return B_Symbols._ids.get(name, -1)
+    
+    @staticmethod
+    def name(i: int) -> str:
+        return B_Symbols._names[i]
+    
+    @staticmethod
+    def count() -> int:
+        return len(B_Symbols._names)
+    
+    @staticmethod
+    def place(items: list, i: int, item: typing.Any) -> typing.Any:
+        """Store item at id i of an id-indexed list (growing it as needed), returns the item it replaced"""
+        if i >= len(items):
+            items.extend([None] * (B_Symbols.count() - len(items)))
+        item_prior = items[i]
+        items[i] = item
+        return item_prior
+    
+    @staticmethod
+    def lookup(items: list, i: int) -> typing.Any:
+        return items[i] if 0 <= i < len(items) else None
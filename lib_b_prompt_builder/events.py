@@ -0,0 +1,295 @@
+"""Opt-in instrumentation of UI event callbacks: latency and payload size histograms per event, exportable as Prometheus text or JSON,
+and cProfile captures of selected events"""
+
+import typing
+import functools
+import bisect
+import itertools
+import json
+import threading
+import time
+import os
+import re
+import fnmatch
+import cProfile
+
+from .common import printGeneral
+
+class B_Event_Stats():
+    __slots__ = ("event", "source", "count", "errors", "seconds", "seconds_buckets", "outputs", "outputs_touched", "payload", "payload_max", "payload_buckets")
+
+    def __init__(self, event: str, source: str):
+        self.event = event
+        self.source = source
+        self.count: int = 0
+        self.errors: int = 0
+        self.seconds: float = 0
+        self.seconds_buckets: list[int] = [0] * (len(B_Events.buckets_seconds) + 1) # Last one is +Inf
+        self.outputs: int = 0
+        self.outputs_touched: int = 0
+        self.payload: int = 0
+        self.payload_max: int = 0
+        self.payload_buckets: list[int] = [0] * (len(B_Events.buckets_payload) + 1)
+
+    def toDict(self) -> dict[str, typing.Any]:
+        return {
+            "event": self.event
+            , "source": self.source
+            , "count": self.count
+            , "errors": self.errors
+            , "seconds_sum": self.seconds
+            , "seconds_buckets": dict(zip([*map(str, B_Events.buckets_seconds), "+Inf"], itertools.accumulate(self.seconds_buckets)))
+            , "outputs_sum": self.outputs
+            , "outputs_touched_sum": self.outputs_touched
+            , "payload_bytes_sum": self.payload
+            , "payload_bytes_max": self.payload_max
+            , "payload_bytes_buckets": dict(zip([*map(str, B_Events.buckets_payload), "+Inf"], itertools.accumulate(self.payload_buckets)))
+        }
+
+class B_Events():
+    """Callbacks are only wrapped while enabled, so disabled instrumentation costs nothing per event"""
+    enabled: bool = False
+    metric_prefix: str = "b_prompt_builder_event"
+
+    buckets_seconds: tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+    buckets_payload: tuple[int, ...] = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+    _stats: dict[tuple[str, str], B_Event_Stats] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def getEventName(fn: typing.Callable) -> str:
+        """Class and name of a callback defined within a bind(), e.g. B_UI_Dropdown._updateSelections"""
+        parts = [part for part in getattr(fn, "__qualname__", repr(fn)).split(".") if part != "<locals>"]
+        return ".".join(parts[:1] + parts[-1:]) if len(parts) > 2 else ".".join(parts)
+
+    @staticmethod
+    def wrap(fn: typing.Callable, source: str = "", event: str = None) -> typing.Callable:
+        """Record wall time, outputs touched and payload size of each call of fn (fn itself while disabled)"""
+        key = (event if event is not None else B_Events.getEventName(fn), source if source is not None else "")
+
+        fn = B_Event_Profiler.wrap(fn, key)
+        if not B_Events.enabled:
+            return fn
+
+        @functools.wraps(fn)
+        def _fn(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                B_Events.record(key, time.perf_counter() - t, None, True)
+                raise
+            B_Events.record(key, time.perf_counter() - t, result)
+            return result
+        return _fn
+
+    @staticmethod
+    def record(key: tuple[str, str], seconds: float, result: typing.Any, error: bool = False) -> None:
+        outputs, outputs_touched, payload = B_Events.measure(result) if not error else (0, 0, 0)
+
+        stats = B_Events._stats.get(key)
+        if stats is None:
+            with B_Events._lock:
+                stats = B_Events._stats.setdefault(key, B_Event_Stats(*key))
+
+        with B_Events._lock:
+            stats.count += 1
+            stats.errors += int(error)
+            stats.seconds += seconds
+            stats.seconds_buckets[bisect.bisect_left(B_Events.buckets_seconds, seconds)] += 1
+            stats.outputs += outputs
+            stats.outputs_touched += outputs_touched
+            stats.payload += payload
+            stats.payload_max = max(stats.payload_max, payload)
+            stats.payload_buckets[bisect.bisect_left(B_Events.buckets_payload, payload)] += 1
+
+    @staticmethod
+    def measure(result: typing.Any) -> tuple[int, int, int]:
+        """Outputs, outputs actually changed (not an empty update) and JSON size of the updates a callback returned;
+        Gradio's own serialization is approximated, values JSON can't hold are counted as their text"""
+        if result is None:
+            return 0, 0, 0
+
+        values = result if isinstance(result, (list, tuple)) else [result]
+        outputs_touched = sum(1 for value in values if not B_Events.isEmptyUpdate(value))
+        try:
+            payload = len(json.dumps(values, default = B_Events._serializable, ensure_ascii = False).encode("utf8"))
+        except (TypeError, ValueError):
+            payload = len(str(values).encode("utf8"))
+        return len(values), outputs_touched, payload
+
+    @staticmethod
+    def isEmptyUpdate(value: typing.Any) -> bool:
+        return isinstance(value, dict) and all(k == "__type__" for k in value)
+
+    @staticmethod
+    def _serializable(value: typing.Any) -> typing.Any:
+        if hasattr(value, "tolist"):
+            return value.tolist()
+        if isinstance(value, (set, frozenset)):
+            return list(value)
+        return str(value)
+
+    @staticmethod
+    def getStats() -> list[B_Event_Stats]:
+        with B_Events._lock:
+            return sorted(B_Events._stats.values(), key = lambda stats: (stats.event, stats.source))
+
+    @staticmethod
+    def clear() -> None:
+        with B_Events._lock:
+            B_Events._stats.clear()
+
+    @staticmethod
+    def toJson() -> str:
+        return json.dumps(
+            {
+                "buckets_seconds": list(B_Events.buckets_seconds)
+                , "buckets_payload_bytes": list(B_Events.buckets_payload)
+                , "events": [stats.toDict() for stats in B_Events.getStats()]
+            }
+            , indent = 4
+            , ensure_ascii = False
+        )
+
+    @staticmethod
+    def toPrometheus() -> str:
+        """Prometheus text exposition format (for a node exporter textfile collector or a plain read)"""
+        prefix = B_Events.metric_prefix
+        stats_list = B_Events.getStats()
+        lines: list[str] = []
+
+        def _histogram(name: str, help: str, buckets: tuple, fn_counts: typing.Callable, fn_sum: typing.Callable):
+            lines.append(f"# HELP {prefix}_{name} {help}")
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            for stats in stats_list:
+                labels = B_Events.getLabels(stats)
+                for le, count in zip([*map(str, buckets), "+Inf"], itertools.accumulate(fn_counts(stats))):
+                    lines.append(f"{prefix}_{name}_bucket{{{labels},le=\"{le}\"}} {count}")
+                lines.append(f"{prefix}_{name}_sum{{{labels}}} {fn_sum(stats)}")
+                lines.append(f"{prefix}_{name}_count{{{labels}}} {stats.count}")
+
+        def _counter(name: str, help: str, fn_value: typing.Callable):
+            lines.append(f"# HELP {prefix}_{name} {help}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for stats in stats_list:
+                lines.append(f"{prefix}_{name}{{{B_Events.getLabels(stats)}}} {fn_value(stats)}")
+
+        _histogram("seconds", "Wall time of event callbacks", B_Events.buckets_seconds, lambda stats: stats.seconds_buckets, lambda stats: stats.seconds)
+        _histogram("payload_bytes", "JSON size of the updates returned by event callbacks", B_Events.buckets_payload, lambda stats: stats.payload_buckets, lambda stats: stats.payload)
+        _counter("outputs_total", "Output components of event callbacks", lambda stats: stats.outputs)
+        _counter("outputs_touched_total", "Output components event callbacks actually updated", lambda stats: stats.outputs_touched)
+        _counter("errors_total", "Event callbacks that raised", lambda stats: stats.errors)
+
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def getLabels(stats: B_Event_Stats) -> str:
+        def _escape(value: str) -> str:
+            return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        return f"event=\"{_escape(stats.event)}\",source=\"{_escape(stats.source)}\""
+
+    @staticmethod
+    def export(path_base: str) -> list[str]:
+        """Write <path_base>.prom and <path_base>.json, returns the paths written"""
+        paths: list[str] = []
+        for extension, fn in ((".prom", B_Events.toPrometheus), (".json", B_Events.toJson)):
+            path = path_base + extension
+            with open(path, "w", encoding = "utf8") as file:
+                file.write(fn())
+            paths.append(path)
+        return paths
+
+class B_Event_Profiler():
+    """cProfile captures of the next calls of selected event callbacks, saved as .prof files (for pstats or snakeviz);
+    configured from the environment so enabling it needs no edit of the script:
+
+    B_PROMPT_BUILDER_PROFILE = comma separated event patterns (fnmatch), e.g. _updateSelections or B_UI_Preset._apply@Some Preset
+    (1 for the default events); B_PROMPT_BUILDER_PROFILE_COUNT = calls captured per event and B_UI (default 5);
+    B_PROMPT_BUILDER_PROFILE_DIR = folder of the .prof files
+    """
+    env_events: str = "B_PROMPT_BUILDER_PROFILE"
+    env_count: str = "B_PROMPT_BUILDER_PROFILE_COUNT"
+    env_path: str = "B_PROMPT_BUILDER_PROFILE_DIR"
+
+    events_default: tuple[str, ...] = ("_updateSelections", "_apply", "_fnApply", "_randomize")
+
+    patterns: list[tuple[str, str]] = [] # Event and source pattern ("*" for any source)
+    count: int = 5
+    path: str = None
+
+    _captures: dict[tuple[str, str], int] = {} # Captures made per event and source
+    _lock = threading.Lock() # Held while capturing, only one profiler can run at a time
+    _file_name = re.compile(r"[^\w.-]+")
+
+    @staticmethod
+    def configure(environ: typing.Mapping[str, str], path_default: str) -> None:
+        value = environ.get(B_Event_Profiler.env_events, "").strip()
+        if len(value) == 0 or value == "0":
+            B_Event_Profiler.patterns = []
+            return
+
+        patterns = B_Event_Profiler.events_default if value == "1" else [pattern.strip() for pattern in value.split(",") if len(pattern.strip()) > 0]
+        B_Event_Profiler.patterns = []
+        for pattern in patterns:
+            event, _, source = pattern.partition("@")
+            B_Event_Profiler.patterns.append((event, source if len(source) > 0 else "*"))
+
+        try:
+            B_Event_Profiler.count = max(0, int(environ.get(B_Event_Profiler.env_count, B_Event_Profiler.count)))
+        except ValueError:
+            printGeneral(f"Invalid {B_Event_Profiler.env_count}, {B_Event_Profiler.count} calls are captured per event")
+        B_Event_Profiler.path = environ.get(B_Event_Profiler.env_path, path_default)
+        B_Event_Profiler._captures = {}
+
+        printGeneral(f"Profiling the next {B_Event_Profiler.count} calls of events {', '.join(patterns)} -> {B_Event_Profiler.path}")
+
+    @staticmethod
+    def isSelected(key: tuple[str, str]) -> bool:
+        """Event (matched with and without its class) and source match a pattern"""
+        event, source = key
+        name = event.rsplit(".", 1)[-1]
+        for pattern_event, pattern_source in B_Event_Profiler.patterns:
+            if (fnmatch.fnmatchcase(event, pattern_event) or fnmatch.fnmatchcase(name, pattern_event)) and fnmatch.fnmatchcase(source, pattern_source):
+                return True
+        return False
+
+    @staticmethod
+    def wrap(fn: typing.Callable, key: tuple[str, str]) -> typing.Callable:
+        """fn itself unless the event is selected"""
+        if len(B_Event_Profiler.patterns) == 0 or B_Event_Profiler.count == 0 or not B_Event_Profiler.isSelected(key):
+            return fn
+
+        @functools.wraps(fn)
+        def _fn(*args, **kwargs):
+            if B_Event_Profiler._captures.get(key, 0) >= B_Event_Profiler.count or not B_Event_Profiler._lock.acquire(blocking = False):
+                return fn(*args, **kwargs)
+
+            try:
+                capture = B_Event_Profiler._captures.get(key, 0) + 1
+                if capture > B_Event_Profiler.count:
+                    return fn(*args, **kwargs)
+                B_Event_Profiler._captures[key] = capture
+
+                profile = cProfile.Profile()
+                try:
+                    return profile.runcall(fn, *args, **kwargs)
+                finally:
+                    B_Event_Profiler.save(profile, key, capture)
+            finally:
+                B_Event_Profiler._lock.release()
+        return _fn
+
+    @staticmethod
+    def save(profile: cProfile.Profile, key: tuple[str, str], capture: int) -> None:
+        event, source = key
+        name = B_Event_Profiler._file_name.sub("_", f"{event}-{source}" if len(source) > 0 else event)
+        path = os.path.join(B_Event_Profiler.path, f"{name}-{capture}.prof")
+        try:
+            os.makedirs(B_Event_Profiler.path, exist_ok = True)
+            profile.dump_stats(path)
+        except OSError as e:
+            printGeneral(f"Event profile not saved ({type(e).__name__}) -> {path}")
+            return
+        printGeneral(f"Event profile saved ({capture}/{B_Event_Profiler.count}) -> {path}")
@@ -0,0 +1,136 @@
+"""Layout/preset file lexer and on-disk token cache"""
+
+import typing
+import os
+import io
+import hashlib
+import pickle
+
+from .common import b_folder_name_cache, printWarning
+
+class B_Layout_Lexer():
+    _arg_prefix: str = " --"
+
+    @staticmethod
+    def readLine(l: str, line_number: int = 0) -> tuple[str, str, dict[str, str]]:
+        """Split a line into its type, name and '--' arguments in a single left-to-right scan"""
+        l_line = l.strip()
+        if len(l_line) == 0:
+            return "", None, {}
+        
+        l_parts = l_line.split(B_Layout_Lexer._arg_prefix)
+
+        l_type, _, l_name = l_parts[0].partition(" ")
+        l_name = l_name.strip()
+        l_args: dict[str, str] = {}
+
+        if len(l_parts) > 1:
+            if len(l_name) == 0:
+                l_name = None
+            
+            position = len(l_parts[0]) + len(B_Layout_Lexer._arg_prefix)
+            for l_part in l_parts[1:]:
+                l_arg_name, _, l_arg_value = l_part.partition(" ")
+                
+                if len(l_arg_name) == 0:
+                    B_Layout_Lexer._printError(l, line_number, position, "Missing argument name")
+                else:
+                    if l_arg_name in l_args:
+                        B_Layout_Lexer._printError(l, line_number, position, f"Duplicate argument -> '{l_arg_name}'")
+                    l_args[l_arg_name] = l_arg_value.strip()
+                
+                position += len(l_part) + len(B_Layout_Lexer._arg_prefix)
+        
+        return l_type, l_name, l_args
+    
+    @staticmethod
+    def tokenize(data: bytes) -> list[tuple[int, str, str, dict[str, str]]]:
+        """Tokenize every line up to the '.' terminator, keeping commented out lines as '#' entries"""
+        lines: list[tuple[int, str, str, dict[str, str]]] = []
+        line_number: int = 0
+        
+        for l in io.TextIOWrapper(io.BytesIO(data)):
+            line_number += 1
+
+            if l.lstrip().startswith("#"):
+                lines.append((line_number, "#", None, {}))
+                continue
+            
+            l_type, l_name, l_args = B_Layout_Lexer.readLine(l, line_number)
+            
+            if len(l_type) == 0:
+                continue
+            
+            if l_type == ".":
+                break
+            
+            lines.append((line_number, l_type, l_name, l_args))
+        
+        return lines
+    
+    @staticmethod
+    def _printError(l: str, line_number: int, position: int, message: str):
+        column = len(l) - len(l.lstrip()) + position + 1
+        printWarning(B_Layout_Lexer, f"@{line_number}:{column}", message)
+
+class B_Layout_Cache():
+    """Tokenized layout/preset lines stored next to their source file, keyed by size, mtime and content hash"""
+    _version: int = 2
+
+    @staticmethod
+    def getPath(path: str) -> str:
+        return os.path.join(os.path.dirname(path), b_folder_name_cache, f"{os.path.basename(path)}.cache")
+    
+    @staticmethod
+    def read(path: str, fn_tokenize: typing.Callable[[bytes], list]) -> list:
+        stat = os.stat(path)
+        path_cache = B_Layout_Cache.getPath(path)
+        
+        cache = B_Layout_Cache._load(path_cache)
+        if cache is not None and cache["size"] == stat.st_size and cache["mtime"] == stat.st_mtime_ns:
+            return cache["lines"]
+        
+        with open(path, "rb") as file:
+            data = file.read()
+        digest = hashlib.sha256(data).hexdigest()
+        
+        if cache is not None and cache["size"] == len(data) and cache["hash"] == digest:
+            lines = cache["lines"]
+        else:
+            lines = fn_tokenize(data)
+        
+        B_Layout_Cache._save(path_cache, {
+            "version": B_Layout_Cache._version
+            , "size": len(data)
+            , "mtime": stat.st_mtime_ns
+            , "hash": digest
+            , "lines": lines
+        })
+        
+        return lines
+    
+    @staticmethod
+    def _load(path_cache: str) -> dict[str, typing.Any] | None:
+        if not os.path.isfile(path_cache):
+            return None
+        
+        try:
+            with open(path_cache, "rb") as file_cache:
+                cache = pickle.load(file_cache)
+            if type(cache) is dict and cache.get("version") == B_Layout_Cache._version and type(cache.get("lines")) is list:
+                return cache
+        except Exception as e:
+            printWarning(B_Layout_Cache, "_load()", f"Unreadable cache, parsing source instead -> '{path_cache}' ({e})")
+        
+        return None
+    
+    @staticmethod
+    def _save(path_cache: str, cache: dict[str, typing.Any]):
+        try:
+            os.makedirs(os.path.dirname(path_cache), exist_ok = True)
+            path_cache_tmp = f"{path_cache}.tmp"
+            with open(path_cache_tmp, "wb") as file_cache:
+                pickle.dump(cache, file_cache, protocol = pickle.HIGHEST_PROTOCOL)
+            os.replace(path_cache_tmp, path_cache)
+        except OSError as e:
+            printWarning(B_Layout_Cache, "_save()", f"Could not write cache -> '{path_cache}' ({e})")
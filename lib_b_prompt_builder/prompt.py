@@ -0,0 +1,1287 @@
+"""Prompt model (values, prompts) and the incremental prompt assembler"""
+
+import typing
+import bisect
+import contextlib
+import contextvars
+import itertools
+import threading
+import operator
+import sys
+
+from array import array
+
+from abc import ABC, abstractmethod
+
+from .common import printWarning, B_Symbols
+from .tags import B_Tags
+
+class B_Value():
+    __slots__ = ("value_default", "_value", "_version", "owner", "shared")
+
+    _versions = itertools.count(1) # Unique across sessions so builds cached on a prompt are valid for all of them
+
+    def __init__(self, value_default, owner: typing.Any = None, shared: bool = False):
+        self.value_default = value_default
+        self._value = self.buildDefaultValue()
+        self._version: int = 0
+
+        self.owner: typing.Any = owner
+        self.shared = shared # Default read by every prompt not storing its own value (see B_Prompt.Values.stored)
+    
+    @property
+    def value(self):
+        state = B_Prompt_State._current.get()
+        if state is not None:
+            value = state.values.get(self)
+            if value is not None:
+                return value[0]
+        return self._value
+    
+    @property
+    def version(self) -> int:
+        state = B_Prompt_State._current.get()
+        if state is not None:
+            value = state.values.get(self)
+            if value is not None:
+                return value[1]
+        return self._version
+    
+    def buildDefaultValue(self):
+        return self.value_default
+    
+    def update(self, value):
+        if value == self.value:
+            return
+        self.set(value)
+        self.onChange()
+    
+    def set(self, value):
+        if self.shared:
+            printWarning(type(self), "set()", f"Shared default value can't be set -> '{value}'")
+            return
+        
+        state = B_Prompt_State._current.get()
+        if state is None:
+            self._value, self._version = value, next(B_Value._versions)
+        else:
+            state.values[self] = value, next(B_Value._versions)
+    
+    def reset(self):
+        self.update(self.buildDefaultValue())
+    
+    def reinit(self, value_default, keep_current: bool = False):
+        self.value_default = value_default
+        if not keep_current:
+            self.reset()
+        else:
+            self.set(self.value)
+    
+    def onChange(self):
+        if self.owner is not None:
+            B_Prompt_Map.invalidate(self.owner)
+
+class B_Prompt(ABC):
+    __slots__ = ("name", "id", "meta", "values", "build_cache", "refs")
+
+    _reference_prefix: str = "${" # ${Other Prompt}, replaced by the output of that prompt
+    _reference_keys: tuple[str, ...] = ("prompt", "prompt_negative", "prompt_a", "prompt_b", "prefix", "postfix")
+
+    class Meta():
+        """Display flags, shared by all prompts with the same ones (copy before changing, then intern again)"""
+        __slots__ = ("name_visible", "prompt_visible", "prompt_enable", "prompt_negative_visible", "prompt_negative_enable", "negative_visible", "prompt_edit_visible")
+
+        _interned: dict[tuple, "B_Prompt.Meta"] = {}
+        _key = operator.attrgetter(*__slots__)
+
+        def __init__(
+                self
+                , prompt_enable: bool = False
+                , negative_enable: bool = False
+                , prompt_negative_enable: bool = False
+                , prompt_edit_enable: bool = False
+            ):
+            self.name_visible = True
+
+            self.prompt_visible = prompt_enable
+            self.prompt_enable = prompt_enable
+
+            self.prompt_negative_visible = prompt_negative_enable
+            self.prompt_negative_enable = prompt_negative_enable
+            
+            self.negative_visible = negative_enable
+            self.prompt_edit_visible = prompt_edit_enable
+        
+        def __copy__(self):
+            meta = B_Prompt.Meta()
+            for k in B_Prompt.Meta.__slots__:
+                setattr(meta, k, getattr(self, k))
+            return meta
+        
+        def interned(self) -> "B_Prompt.Meta":
+            return B_Prompt.Meta._interned.setdefault(B_Prompt.Meta._key(self), self)
+    
+    class Values():
+        """Values of a prompt; fields at their default read a shared B_Value until they are first set (through update() or stored())"""
+        __slots__ = ("prompt", "emphasis", "negative", "prompt_negative", "emphasis_negative", "edit", "prompt_a", "prompt_b", "prefix", "postfix", "owner")
+
+        _store_lock = threading.Lock()
+
+        class Defaults():
+            prompt: str = ""
+
+            emphasis: float = 1
+            emphasis_min: float = 0
+            emphasis_step: float = 0.1
+
+            edit: int = 50
+            edit_min: int = 0
+            edit_max: int = 100
+            edit_step: int = 1
+
+            negative: bool = False
+        
+        class Keys():
+            prompt = "pp"
+            prompt_negative = "pn"
+            emphasis = "sp"
+            emphasis_negative = "sn"
+            negative = "n"
+            prompt_a = "a"
+            prompt_b = "b"
+            edit = "r"
+            prefix = "prefix"
+            postfix = "postfix"
+        
+        _defaults: dict[str, typing.Any] = {
+            "prompt": Defaults.prompt
+            , "emphasis": Defaults.emphasis
+            , "negative": Defaults.negative
+            , "prompt_negative": Defaults.prompt
+            , "emphasis_negative": Defaults.emphasis
+            , "edit": Defaults.edit
+            , "prompt_a": Defaults.prompt
+            , "prompt_b": Defaults.prompt
+            , "prefix": Defaults.prompt
+            , "postfix": Defaults.prompt
+        }
+        _unset: dict[str, B_Value] = {name: B_Value(value, shared = True) for name, value in _defaults.items()}
+        
+        @staticmethod
+        def _fromArgs(args: dict[str, str]):
+            prompt = args.get(B_Prompt.Values.Keys.prompt)
+            emphasis = args.get(B_Prompt.Values.Keys.emphasis)
+            prompt_negative = args.get(B_Prompt.Values.Keys.prompt_negative)
+            emphasis_negative = args.get(B_Prompt.Values.Keys.emphasis_negative)
+            negative = args.get(B_Prompt.Values.Keys.negative)
+            edit = args.get(B_Prompt.Values.Keys.edit)
+            return B_Prompt.Values(
+                prompt = prompt if prompt is not None else None
+                , emphasis = float(emphasis) if emphasis is not None else None
+                , negative = bool(int(negative)) if negative is not None else None
+                , prompt_negative = prompt_negative if prompt_negative is not None else None
+                , emphasis_negative = float(emphasis_negative) if emphasis_negative is not None else None
+                , edit = int(edit) if edit is not None else None
+            )
+        
+        def _updateOrResetValue(self, name: str, value_new: typing.Any, resetIfNone: bool):
+            if value_new is not None:
+                self.update(name, value_new)
+            elif resetIfNone:
+                getattr(self, name).reset()
+        
+        @staticmethod
+        def compilePatch(args: dict[str, str]) -> tuple | None:
+            """Parse args once into the values they set (prompt, emphasis, prompt_negative, emphasis_negative, negative, edit; None = not set)"""
+            if len(args) == 0:
+                return None
+            
+            values_new = B_Prompt.Values._fromArgs(args)
+            if values_new is None:
+                return None
+            
+            return (
+                values_new.prompt.value
+                , values_new.emphasis.value
+                , values_new.prompt_negative.value
+                , values_new.emphasis_negative.value
+                , values_new.negative.value
+                , values_new.edit.value
+            )
+
+        def __init__(
+                self
+                , prompt: str = Defaults.prompt
+                , emphasis: float = Defaults.emphasis
+                , negative: bool = Defaults.negative
+                , prompt_negative: str = Defaults.prompt
+                , emphasis_negative: float = Defaults.emphasis
+                , prompt_a: str = Defaults.prompt
+                , prompt_b: str = Defaults.prompt
+                , edit: int = Defaults.edit
+                , prefix: str = Defaults.prompt
+                , postfix: str = Defaults.prompt
+            ):
+            self.owner: typing.Any = None
+            self.prompt = self._init("prompt", prompt)
+            self.emphasis = self._init("emphasis", emphasis)
+            self.negative = self._init("negative", negative)
+            self.prompt_negative = self._init("prompt_negative", prompt_negative)
+            self.emphasis_negative = self._init("emphasis_negative", emphasis_negative)
+            self.edit = self._init("edit", edit)
+            self.prompt_a = self._init("prompt_a", prompt_a)
+            self.prompt_b = self._init("prompt_b", prompt_b)
+            self.prefix = self._init("prefix", prefix)
+            self.postfix = self._init("postfix", postfix)
+        
+        @staticmethod
+        def _init(name: str, value: typing.Any) -> B_Value:
+            b_value = B_Prompt.Values._unset[name]
+            if value == b_value.value_default and value is not None:
+                return b_value
+            return B_Value(sys.intern(value) if type(value) is str else value)
+        
+        def stored(self, name: str) -> B_Value:
+            """Value of a field to hold on to or to set, stored first if the field still reads the shared default"""
+            b_value: B_Value = getattr(self, name)
+            if not b_value.shared:
+                return b_value
+            
+            with B_Prompt.Values._store_lock:
+                b_value = getattr(self, name)
+                if b_value.shared:
+                    b_value = B_Value(B_Prompt.Values._defaults[name], self.owner)
+                    setattr(self, name, b_value)
+            return b_value
+        
+        def update(self, name: str, value: typing.Any):
+            b_value: B_Value = getattr(self, name)
+            if b_value.shared and value == b_value.value:
+                return
+            self.stored(name).update(value)
+        
+        def setOwner(self, owner: typing.Any):
+            self.owner = owner
+            for name, b_value_shared in B_Prompt.Values._unset.items():
+                b_value = getattr(self, name)
+                if b_value is not b_value_shared:
+                    b_value.owner = owner
+        
+        def updateFromArgs(self, args: dict[str, str], resetIfNone: bool = False):
+            self.applyPatch(self.compilePatch(args), resetIfNone)
+        
+        def applyPatch(self, patch: tuple | None, resetIfNone: bool = False):
+            if patch is None:
+                return
+            
+            prompt, emphasis, prompt_negative, emphasis_negative, negative, edit = patch
+            self._updateOrResetValue("prompt", prompt, resetIfNone)
+            self._updateOrResetValue("emphasis", emphasis, resetIfNone)
+            self._updateOrResetValue("prompt_negative", prompt_negative, resetIfNone)
+            self._updateOrResetValue("emphasis_negative", emphasis_negative, resetIfNone)
+            self._updateOrResetValue("negative", negative, resetIfNone)
+            self._updateOrResetValue("edit", edit, resetIfNone)
+
+    class Fn():
+        @staticmethod
+        def sanitized(prompt: str) -> str:
+            return prompt.strip() if prompt is not None else ""
+        
+        @staticmethod
+        def added(promptExisting: str, promptToAdd: str, use_space: bool = False) -> str:
+            if len(promptToAdd) > 0:
+                if len(promptExisting) > 0:
+                    promptExisting += (", " if not use_space else " ") + promptToAdd
+                else:
+                    promptExisting = promptToAdd
+            
+            return promptExisting
+        
+        @staticmethod
+        def decorated(prompt: str, prefix: str = "", postfix: str = "") -> str:
+            if len(prompt) > 0:
+                if len(prefix) > 0:
+                    prompt = f"{prefix} {prompt}"
+                if len(postfix) > 0:
+                    prompt = f"{prompt} {postfix}"
+            
+            return prompt
+        
+        @staticmethod
+        def emphasized(prompt: str, emphasis: float) -> str:
+            if len(prompt) == 0 or emphasis == B_Prompt.Values.Defaults.emphasis_min:
+                return ""
+            
+            if emphasis != 1:
+                prompt = f"({prompt}:{emphasis})"
+            
+            return prompt
+        
+        @staticmethod
+        def references(prompt: str) -> list[str]:
+            """Names referenced as ${name}"""
+            names: list[str] = []
+            for part in prompt.split(B_Prompt._reference_prefix)[1:]:
+                name, sep, _ = part.partition("}")
+                if len(sep) > 0:
+                    names.append(name.strip())
+            return names
+        
+        @staticmethod
+        def referenced(prompt: str, outputs: dict[str, str]) -> str:
+            """Replace each ${name} by outputs[name], references to other names are kept as written"""
+            if B_Prompt._reference_prefix not in prompt:
+                return prompt
+            
+            head, *parts = prompt.split(B_Prompt._reference_prefix)
+            result: list[str] = [head]
+            for part in parts:
+                name, sep, text = part.partition("}")
+                output = outputs.get(name.strip()) if len(sep) > 0 else None
+                result.append(output + text if output is not None else B_Prompt._reference_prefix + part)
+            return "".join(result)
+    
+    @staticmethod
+    @abstractmethod
+    def _fromArgs(name: str, args: dict[str, str]):
+        pass
+    
+    def __init__(self, name: str, meta: Meta, values: Values, register: bool = True):
+        self.name = name
+        self.id = B_Symbols.intern(name)
+        self.meta = meta.interned()
+        self.values = values
+
+        self.build_cache: tuple[tuple, tuple[str, str]] = None, ("", "")
+        self.refs: tuple[int, ...] = () # Ids of the prompts referenced in its layout text, set by B_Prompt_Map.resolve()
+
+        if register:
+            B_Prompt_Map.add(self)
+
+        self.values.setOwner(self)
+    
+    def reset(self):
+        if self.meta.prompt_enable:
+            self.values.prompt.reset()
+        self.values.emphasis.reset()
+        self.values.negative.reset()
+        if self.meta.prompt_negative_enable:
+            self.values.prompt_negative.reset()
+        self.values.emphasis_negative.reset()
+        self.values.edit.reset()
+        #! not rendered in UI:
+        # self.values.prompt_a.reset()
+        # self.values.prompt_b.reset()
+        # self.values.prefix.reset()
+        # self.values.postfix.reset()
+    
+    def clear(self):
+        if self.meta.prompt_enable:
+            self.values.update("prompt", B_Prompt.Values.Defaults.prompt)
+        self.values.update("emphasis", B_Prompt.Values.Defaults.emphasis)
+        self.values.update("negative", B_Prompt.Values.Defaults.negative)
+        if self.meta.prompt_negative_enable:
+            self.values.update("prompt_negative", B_Prompt.Values.Defaults.prompt)
+        self.values.update("emphasis_negative", B_Prompt.Values.Defaults.emphasis)
+        self.values.update("edit", B_Prompt.Values.Defaults.edit)
+        #! not rendered in UI:
+        # self.values.prompt_a.update(B_Prompt.Values.Defaults.prompt)
+        # self.values.prompt_b.update(B_Prompt.Values.Defaults.prompt)
+        # self.values.prefix.update(B_Prompt.Values.Defaults.prompt)
+        # self.values.postfix.update(B_Prompt.Values.Defaults.prompt)
+    
+    def build(self) -> tuple[str, str]:
+        key = self.buildKey()
+        refs = self.refs
+        if len(refs) > 0:
+            refs_output = tuple(B_Prompt_Map.buildReference(b_prompt_id) for b_prompt_id in refs)
+            key = key, refs_output
+        
+        build_key, build_output = self.build_cache
+        if key != build_key:
+            build_output = self.buildOutput()
+            if len(refs) > 0:
+                build_output = tuple(
+                    B_Prompt.Fn.referenced(output, {B_Symbols.name(b_prompt_id): ref_output[i] for b_prompt_id, ref_output in zip(refs, refs_output)})
+                    for i, output in enumerate(build_output)
+                )
+            self.build_cache = key, build_output #! one assignment, sessions may build concurrently
+        return build_output
+    
+    def getReferences(self) -> list[str]:
+        """Names referenced (as ${name}) in the text of its values as declared in the layout"""
+        names: list[str] = []
+        for k in B_Prompt._reference_keys:
+            value = getattr(self.values, k).value_default
+            if B_Prompt._reference_prefix in value:
+                names += B_Prompt.Fn.references(value)
+        return names
+    
+    @abstractmethod
+    def buildKey(self) -> tuple:
+        """Versions of every value the output of buildOutput() depends on"""
+        pass
+    
+    @abstractmethod
+    def buildOutput(self) -> tuple[str, str]:
+        pass
+
+class B_Prompt_Single(B_Prompt):
+    __slots__ = ()
+
+    @staticmethod
+    def _fromArgs(name: str, args: dict[str, str]):
+        return B_Prompt_Single(
+            name
+            , args.get(B_Prompt.Values.Keys.prompt, B_Prompt.Values.Defaults.prompt)
+            , float(args.get(B_Prompt.Values.Keys.emphasis, B_Prompt.Values.Defaults.emphasis))
+            , bool(int(args.get(B_Prompt.Values.Keys.negative, int(B_Prompt.Values.Defaults.negative))))
+            , args.get(B_Prompt.Values.Keys.prefix, B_Prompt.Values.Defaults.prompt)
+            , args.get(B_Prompt.Values.Keys.postfix, B_Prompt.Values.Defaults.prompt)
+        )
+    
+    def __init__(
+            self
+            , name: str
+            , prompt = B_Prompt.Values.Defaults.prompt
+            , emphasis = B_Prompt.Values.Defaults.emphasis
+            , negative = B_Prompt.Values.Defaults.negative
+            , prefix = B_Prompt.Values.Defaults.prompt
+            , postfix = B_Prompt.Values.Defaults.prompt
+            , register: bool = True
+        ):
+        super().__init__(
+            name
+            , B_Prompt.Meta(
+                prompt_enable = True
+                , negative_enable = True
+            )
+            , B_Prompt.Values(
+                prompt = prompt
+                , emphasis = emphasis
+                , negative = negative
+                , prefix = prefix
+                , postfix = postfix
+            )
+            , register
+        )
+    
+    def buildKey(self) -> tuple:
+        return (
+            self.values.prompt.version
+            , self.values.prefix.version
+            , self.values.postfix.version
+            , self.values.emphasis.version
+            , self.values.negative.version
+        )
+    
+    def buildOutput(self) -> tuple[str, str]:
+        prompt = B_Prompt.Fn.emphasized(
+            B_Prompt.Fn.decorated(
+                B_Prompt.Fn.sanitized(self.values.prompt.value)
+                , B_Prompt.Fn.sanitized(self.values.prefix.value)
+                , B_Prompt.Fn.sanitized(self.values.postfix.value)
+            )
+            , self.values.emphasis.value
+        )
+        if not self.values.negative.value:
+            return prompt, ""
+        else:
+            return "", prompt
+
+class B_Prompt_Dual(B_Prompt):
+    __slots__ = ()
+
+    @staticmethod
+    def _fromArgs(name: str, args: dict[str, str]):
+        return B_Prompt_Dual(
+            name
+            , args.get(B_Prompt.Values.Keys.prompt, B_Prompt.Values.Defaults.prompt)
+            , float(args.get(B_Prompt.Values.Keys.emphasis, B_Prompt.Values.Defaults.emphasis))
+            , args.get(B_Prompt.Values.Keys.prompt_negative, B_Prompt.Values.Defaults.prompt)
+            , float(args.get(B_Prompt.Values.Keys.emphasis_negative, B_Prompt.Values.Defaults.emphasis))
+        )
+    
+    def __init__(
+            self
+            , name: str
+            , prompt = B_Prompt.Values.Defaults.prompt
+            , emphasis = B_Prompt.Values.Defaults.emphasis
+            , prompt_negative = B_Prompt.Values.Defaults.prompt
+            , emphasis_negative = B_Prompt.Values.Defaults.emphasis
+        ):
+        super().__init__(
+            name
+            , B_Prompt.Meta(
+                prompt_enable = True
+                , prompt_negative_enable = True
+            )
+            , B_Prompt.Values(
+                prompt = prompt
+                , emphasis = emphasis
+                , prompt_negative = prompt_negative
+                , emphasis_negative = emphasis_negative
+            )
+        )
+    
+    def buildKey(self) -> tuple:
+        return (
+            self.values.prompt.version
+            , self.values.prompt_negative.version
+            , self.values.prefix.version
+            , self.values.postfix.version
+            , self.values.emphasis.version
+            , self.values.emphasis_negative.version
+        )
+    
+    def buildOutput(self) -> tuple[str, str]:
+        prompt = B_Prompt.Fn.emphasized(
+            B_Prompt.Fn.decorated(
+                B_Prompt.Fn.sanitized(self.values.prompt.value)
+                , B_Prompt.Fn.sanitized(self.values.prefix.value)
+                , B_Prompt.Fn.sanitized(self.values.postfix.value)
+            )
+            , self.values.emphasis.value
+        )
+        prompt_negative = B_Prompt.Fn.emphasized(
+            B_Prompt.Fn.decorated(
+                B_Prompt.Fn.sanitized(self.values.prompt_negative.value)
+                , B_Prompt.Fn.sanitized(self.values.prefix.value)
+                , B_Prompt.Fn.sanitized(self.values.postfix.value)
+            )
+            , self.values.emphasis_negative.value
+        )
+        return prompt, prompt_negative
+
+class B_Prompt_Edit(B_Prompt):
+    __slots__ = ()
+
+    @staticmethod
+    def _fromArgs(name: str, args: dict[str, str]):
+        return B_Prompt_Edit(
+            name
+            , args.get(B_Prompt.Values.Keys.prompt_a, B_Prompt.Values.Defaults.prompt)
+            , args.get(B_Prompt.Values.Keys.prompt_b, B_Prompt.Values.Defaults.prompt)
+            , int(args.get(B_Prompt.Values.Keys.edit, B_Prompt.Values.Defaults.edit))
+            , bool(int(args.get(B_Prompt.Values.Keys.negative, int(B_Prompt.Values.Defaults.negative))))
+        )
+    
+    @staticmethod
+    def _build(
+        prompt_a: str
+        , prompt_b: str
+        , prefix: str
+        , postfix: str
+        , edit: int
+        , negative: bool
+    ) -> tuple[str, str]:
+        prompt_a = B_Prompt.Fn.decorated(
+            B_Prompt.Fn.sanitized(prompt_a)
+            , B_Prompt.Fn.sanitized(prefix)
+            , B_Prompt.Fn.sanitized(postfix)
+        )
+        prompt_b = B_Prompt.Fn.decorated(
+            B_Prompt.Fn.sanitized(prompt_b)
+            , B_Prompt.Fn.sanitized(prefix)
+            , B_Prompt.Fn.sanitized(postfix)
+        )
+
+        value = float(edit)
+        value = value / B_Prompt.Values.Defaults.edit_max
+        value = round(1 - value, 2)
+
+        prompt: str = None
+        if value == 1:
+            prompt = prompt_a
+        elif value == 0:
+            prompt = prompt_b
+        else:
+            prompt = f"[{prompt_a}:{prompt_b}:{value}]"
+        
+        if not negative:
+            return prompt, ""
+        else:
+            return "", prompt
+    
+    def __init__(
+            self
+            , name: str
+            , prompt_a: str
+            , prompt_b: str
+            , edit = B_Prompt.Values.Defaults.edit
+            , negative = B_Prompt.Values.Defaults.negative
+        ):
+        super().__init__(
+            name
+            , B_Prompt.Meta(
+                negative_enable = True
+                , prompt_edit_enable = True
+            )
+            , B_Prompt.Values(
+                negative = negative
+                , prompt_a = prompt_a
+                , prompt_b = prompt_b
+                , edit = edit
+            )
+        )
+    
+    def buildKey(self) -> tuple:
+        return (
+            self.values.prompt_a.version
+            , self.values.prompt_b.version
+            , self.values.prefix.version
+            , self.values.postfix.version
+            , self.values.edit.version
+            , self.values.negative.version
+        )
+    
+    def buildOutput(self) -> tuple[str, str]:
+        return B_Prompt_Edit._build(
+            self.values.prompt_a.value
+            , self.values.prompt_b.value
+            , self.values.prefix.value
+            , self.values.postfix.value
+            , self.values.edit.value
+            , self.values.negative.value
+        )
+
+class B_Prompt_Edit_Link(B_Prompt):
+    __slots__ = ("link_name", "link_id")
+
+    @staticmethod
+    def _fromArgs(name: str, args: dict[str, str]):
+        return B_Prompt_Edit_Link(
+            name
+            , args["link"]
+            , args.get(B_Prompt.Values.Keys.prompt_a, B_Prompt.Values.Defaults.prompt)
+            , args.get(B_Prompt.Values.Keys.prompt_b, B_Prompt.Values.Defaults.prompt)
+            , bool(int(args.get(B_Prompt.Values.Keys.negative, int(B_Prompt.Values.Defaults.negative))))
+        )
+    
+    def __init__(
+            self
+            , name: str
+            , link_name: str
+            , prompt_a: str
+            , prompt_b: str
+            , negative = B_Prompt.Values.Defaults.negative
+        ):
+        super().__init__(
+            name
+            , B_Prompt.Meta(
+                negative_enable = True
+            )
+            , B_Prompt.Values(
+                negative = negative
+                , prompt_a = prompt_a
+                , prompt_b = prompt_b
+            )
+        )
+
+        self.link_name = link_name
+        self.link_id = B_Symbols.intern(link_name)
+    
+    def buildKey(self) -> tuple:
+        b_prompt_link = self.getLink()
+        return (
+            self.values.prompt_a.version
+            , self.values.prompt_b.version
+            , self.values.prefix.version
+            , self.values.postfix.version
+            , self.values.negative.version
+            , id(b_prompt_link)
+            , b_prompt_link.values.edit.version if b_prompt_link is not None else -1
+        )
+    
+    def buildOutput(self) -> tuple[str, str]:
+        b_prompt_link = self.getLink()
+
+        if b_prompt_link is None:
+            printWarning(type(self), f"{self.name} - build()", f"Linked prompt not found -> '{self.link_name}'")
+            return "", "" #!
+        
+        return B_Prompt_Edit._build(
+            self.values.prompt_a.value
+            , self.values.prompt_b.value
+            , self.values.prefix.value
+            , self.values.postfix.value
+            , b_prompt_link.values.edit.value
+            , self.values.negative.value
+        )
+    
+    def getLink(self) -> B_Prompt_Edit | None:
+        return B_Prompt_Map.getById(self.link_id)
+
+class B_Prompt_Entries(B_Prompt):
+    """Entries of a list too long to make each a prompt (the lines of a choice file), assembled in one place of the order;
+    the entries selected are kept per state by index, an entry is only made a prompt (B_Prompt_Entry) to be shown or edited"""
+    __slots__ = ("fn_entry", "fn_init", "entries", "generation", "lock")
+
+    #!
+    @staticmethod
+    def _fromArgs(name: str, args: dict[str, str]):
+        return B_Prompt_Entries(
+            name
+            , prefix = args.get(B_Prompt.Values.Keys.prefix, B_Prompt.Values.Defaults.prompt)
+            , postfix = args.get(B_Prompt.Values.Keys.postfix, B_Prompt.Values.Defaults.prompt)
+        )
+    
+    def __init__(
+            self
+            , name: str
+            , fn_entry: typing.Callable[[int], str] = None
+            , prefix = B_Prompt.Values.Defaults.prompt
+            , postfix = B_Prompt.Values.Defaults.prompt
+        ):
+        super().__init__(
+            name
+            , B_Prompt.Meta()
+            , B_Prompt.Values(
+                prefix = prefix
+                , postfix = postfix
+            )
+        )
+
+        self.fn_entry = fn_entry # Index -> text of the entry
+        self.fn_init: typing.Callable[["B_Prompt_Entry"], None] = None # Called on an entry just made a prompt
+        self.entries: dict[int, "B_Prompt_Entry"] = {} # By index, those made prompts so far
+        self.generation: int = 0 # Bumped when the list changed, indexes selected before no longer apply
+        self.lock = threading.Lock()
+    
+    def getEntry(self, index: int) -> "B_Prompt_Entry":
+        """Entry made a prompt the first time (with its values in the shared state)"""
+        b_prompt = self.entries.get(index)
+        if b_prompt is not None:
+            return b_prompt
+        
+        with self.lock:
+            b_prompt = self.entries.get(index)
+            if b_prompt is None:
+                with B_Prompt_State.use(None):
+                    b_prompt = B_Prompt_Entry(self, index, self.fn_entry(index))
+                    if self.fn_init is not None:
+                        self.fn_init(b_prompt)
+                b_prompt.values.setOwner(self)
+                self.entries[index] = b_prompt
+        return b_prompt
+    
+    def getSelected(self) -> tuple[int, ...]:
+        """Indexes of the entries selected in the current state, ascending"""
+        generation, indexes = B_Prompt_State.current().entries.get(self.id, (self.generation, ()))
+        return indexes if generation == self.generation else ()
+    
+    def isSelectedEntry(self, index: int) -> bool:
+        indexes = self.getSelected()
+        j = bisect.bisect_left(indexes, index)
+        return j < len(indexes) and indexes[j] == index
+    
+    def select(self, index: int, selected: bool) -> None:
+        indexes = self.getSelected()
+        j = bisect.bisect_left(indexes, index)
+        if (j < len(indexes) and indexes[j] == index) == selected:
+            return
+        self.setSelected(indexes[:j] + (index,) + indexes[j:] if selected else indexes[:j] + indexes[j + 1:])
+    
+    def setSelected(self, indexes: typing.Iterable[int]) -> None:
+        indexes = tuple(sorted(set(indexes)))
+        if indexes == self.getSelected():
+            return
+        
+        state = B_Prompt_State.current()
+        state.entries[self.id] = self.generation, indexes
+        B_Prompt_Map.invalidate(self)
+        state.select(self.id, len(indexes) > 0)
+    
+    def reload(self) -> None:
+        """The list changed: entries made prompts are dropped, as are the selections of every state"""
+        with self.lock:
+            self.entries = {}
+            self.generation += 1
+        B_Prompt_Map._layout_version += 1 # Every state drops the fragments it assembled
+    
+    def buildKey(self) -> tuple:
+        indexes = self.getSelected()
+        entries = self.entries
+        return (
+            self.generation
+            , indexes
+            , tuple(entries[i].buildKey() if i in entries else None for i in indexes)
+            , self.values.prefix.version
+            , self.values.postfix.version
+        )
+    
+    def buildOutput(self) -> tuple[str, str]:
+        prefix = B_Prompt.Fn.sanitized(self.values.prefix.value)
+        postfix = B_Prompt.Fn.sanitized(self.values.postfix.value)
+
+        prompts: list[str] = []
+        prompts_negative: list[str] = []
+        for i in self.getSelected():
+            b_prompt = self.entries.get(i)
+            if b_prompt is not None:
+                prompt, prompt_negative = b_prompt.build()
+            else:
+                prompt, prompt_negative = B_Prompt.Fn.decorated(B_Prompt.Fn.sanitized(self.fn_entry(i)), prefix, postfix), ""
+            
+            if len(prompt) > 0:
+                prompts.append(prompt)
+            if len(prompt_negative) > 0:
+                prompts_negative.append(prompt_negative)
+        return ", ".join(prompts), ", ".join(prompts_negative)
+
+class B_Prompt_Entry(B_Prompt_Single):
+    """Entry of a B_Prompt_Entries made a prompt, not registered: selected through it, and changes of its values are its changes"""
+    __slots__ = ("entries", "index")
+
+    def __init__(self, entries: B_Prompt_Entries, index: int, name: str):
+        self.entries = entries
+        self.index = index
+
+        super().__init__(name, name, register = False)
+
+class B_Prompt_State():
+    """Mutable prompt state of a session (values, selection and assembly caches) while the prompts and their order stay shared;
+    the shared state keeps its values in B_Value itself, other states only hold the values they changed"""
+    _shared: "B_Prompt_State" = None
+    _current: contextvars.ContextVar["B_Prompt_State"] = contextvars.ContextVar("b_prompt_state", default = None)
+
+    @staticmethod
+    def current() -> "B_Prompt_State":
+        state = B_Prompt_State._current.get()
+        if state is None:
+            state = B_Prompt_State._shared
+        if state.layout_version != B_Prompt_Map._layout_version:
+            state.sync()
+        return state
+    
+    @staticmethod
+    @contextlib.contextmanager
+    def use(state: typing.Optional["B_Prompt_State"]):
+        """Make state the current one (the shared one if None) within this context"""
+        token = B_Prompt_State._current.set(state)
+        try:
+            yield state
+        finally:
+            B_Prompt_State._current.reset(token)
+    
+    @staticmethod
+    def getView(key: int, value_shared: typing.Any) -> typing.Any:
+        """State of a view object (by a key it keeps for its lifetime) in the current state; value_shared is the one the object keeps for the shared state"""
+        state = B_Prompt_State._current.get()
+        if state is None:
+            return value_shared
+        return state.views.get(key, value_shared)
+    
+    @staticmethod
+    def setView(key: int, value: typing.Any) -> bool:
+        """Returns False for the shared state, where the object keeps the value itself"""
+        state = B_Prompt_State._current.get()
+        if state is None:
+            return False
+        state.views[key] = value
+        return True
+    
+    def __init__(self):
+        self.values: dict[B_Value, tuple[typing.Any, int]] = {}
+        self.views: dict[int, typing.Any] = {} # State of view objects, by key
+        self.ids: array = B_Prompt_Map._ids
+        self.ids_known: int = len(self.ids)
+        self.selected: array = array("l") # Sorted positions (in B_Prompt_Map._ids)
+        self.fragments: dict[int, tuple[str, str]] = {} # By prompt id
+        self.result: tuple[str, str] = None
+        self.touched: set[int] = set() # Ids of prompts changed (values or selection) since they were last reset
+        self.normalize: bool = False # Drop duplicate tags on assembly (see B_Tags)
+        self.entries: dict[int, tuple[int, tuple[int, ...]]] = {} # By B_Prompt_Entries id: its generation and the indexes selected
+        self.layout_version: int = B_Prompt_Map._layout_version
+    
+    def fork(self) -> "B_Prompt_State":
+        """Copy of this state, reading the values it didn't change from the shared state"""
+        if self.layout_version != B_Prompt_Map._layout_version:
+            self.sync()
+        
+        state = B_Prompt_State()
+        state.values = dict(self.values)
+        state.views = dict(self.views)
+        state.ids = self.ids
+        state.ids_known = self.ids_known
+        state.selected = array("l", self.selected)
+        state.fragments = dict(self.fragments)
+        state.result = self.result
+        state.touched = set(self.touched)
+        state.normalize = self.normalize
+        state.entries = dict(self.entries)
+        state.layout_version = self.layout_version
+        return state
+    
+    def sync(self):
+        """Follow prompts added, removed or reordered (on the shared state) since this state was last used"""
+        if self is not B_Prompt_State._shared:
+            shared = B_Prompt_State._shared
+            selected = set(self.ids[i] for i in self.selected)
+            known = set(self.ids[:self.ids_known])
+            for i in shared.selected:
+                b_prompt_id = shared.ids[i]
+                if b_prompt_id not in known:
+                    selected.add(b_prompt_id)
+            
+            self.selected = array("l", (i for i, b_prompt_id in enumerate(B_Prompt_Map._ids) if b_prompt_id in selected and B_Prompt_Map._order[b_prompt_id] == i))
+            self.values = {b_value: value for b_value, value in self.values.items() if B_Prompt_Map._map[b_value.owner.id] is b_value.owner}
+            self.fragments = {}
+            self.result = None
+        
+        self.ids = B_Prompt_Map._ids
+        self.ids_known = len(self.ids)
+        self.layout_version = B_Prompt_Map._layout_version
+    
+    def isSelected(self, b_prompt_id: int) -> bool:
+        i = B_Prompt_Map._order[b_prompt_id]
+        if i < 0:
+            return False
+        j = bisect.bisect_left(self.selected, i)
+        return j < len(self.selected) and self.selected[j] == i
+    
+    def select(self, b_prompt_id: int, selected: bool) -> bool:
+        """Returns True if the selection changed"""
+        i = B_Prompt_Map._order[b_prompt_id]
+        if i < 0:
+            return False
+        j = bisect.bisect_left(self.selected, i)
+        if (j < len(self.selected) and self.selected[j] == i) == selected:
+            return False
+        if selected:
+            self.selected.insert(j, i)
+        else:
+            del self.selected[j]
+        self.result = None
+        return True
+
+class B_Prompt_Map():
+    _map: list[B_Prompt | None] = [] # By id (see B_Symbols)
+
+    # Assembly order (shared, selections and caches are kept per B_Prompt_State)
+    _order: array = array("l") # Id -> position in _ids, -1 if not ordered
+    _ids: array = array("l")
+    _layout_version: int = 0 # Bumped whenever prompts are added, removed or reordered
+
+    # Dependency graph (EDIT_LINK -> EDIT and ${} references), resolved again whenever the layout changed
+    _dependents: dict[int, list[int]] = {} # Id -> ids of the prompts depending on it directly
+    _dependents_all: dict[int, list[int]] = {} # Id -> ids of the prompts depending on it transitively, in topological order (cached)
+    _rank: dict[int, int] = {} # Id -> topological position (dependencies first)
+    _graph_version: int = -1
+    
+    @staticmethod
+    def clear():
+        B_Prompt_Map._map = []
+        B_Prompt_Map._order = array("l")
+        B_Prompt_Map._ids = array("l")
+        B_Prompt_Map._layout_version += 1
+        B_Prompt_State._shared = B_Prompt_State()
+    
+    @staticmethod
+    def add(b_prompt: B_Prompt):
+        state = B_Prompt_State._shared
+        if B_Symbols.place(B_Prompt_Map._map, b_prompt.id, b_prompt) is not None:
+            printWarning(B_Prompt_Map, "add()", f"Duplicate name -> '{b_prompt.name}'")
+            state.select(b_prompt.id, False)
+        
+        order = B_Prompt_Map._order
+        if b_prompt.id >= len(order):
+            order.extend(itertools.repeat(-1, B_Symbols.count() - len(order)))
+        if order[b_prompt.id] < 0:
+            order[b_prompt.id] = len(B_Prompt_Map._ids)
+            B_Prompt_Map._ids.append(b_prompt.id)
+        
+        state.fragments.pop(b_prompt.id, None)
+        B_Prompt_Map._layout_version += 1
+        state.sync()
+    
+    @staticmethod
+    def remove(b_prompt: B_Prompt):
+        """Unregister a prompt; its slot in the assembly order is dropped by the next reorder() (added again, it gets a new one)"""
+        if B_Prompt_Map.getById(b_prompt.id) is not b_prompt:
+            return
+        
+        state = B_Prompt_State._shared
+        state.select(b_prompt.id, False)
+        B_Prompt_Map._map[b_prompt.id] = None
+        B_Prompt_Map._order[b_prompt.id] = -1
+        state.fragments.pop(b_prompt.id, None)
+        state.touched.discard(b_prompt.id)
+        B_Prompt_Map._layout_version += 1
+        state.sync()
+    
+    @staticmethod
+    def reorder(ids: list[int]):
+        """Set the assembly order to the given registered prompt ids, keeping selections"""
+        state = B_Prompt_State._shared
+        selected = set(B_Prompt_Map._ids[i] for i in state.selected)
+        
+        B_Prompt_Map._ids = array("l", (b_prompt_id for b_prompt_id in dict.fromkeys(ids) if B_Prompt_Map._map[b_prompt_id] is not None))
+        B_Prompt_Map._order = array("l", itertools.repeat(-1, len(B_Prompt_Map._map)))
+        for i, b_prompt_id in enumerate(B_Prompt_Map._ids):
+            B_Prompt_Map._order[b_prompt_id] = i
+        state.selected = array("l", (i for i, b_prompt_id in enumerate(B_Prompt_Map._ids) if b_prompt_id in selected))
+        state.result = None
+        B_Prompt_Map._layout_version += 1
+        state.sync()
+    
+    @staticmethod
+    def resolve():
+        """Build the dependency graph of the registered prompts; dangling and cyclic references are rejected (left as text)"""
+        dependencies: dict[int, list[int]] = {}
+        for b_prompt in B_Prompt_Map._map:
+            if b_prompt is None:
+                continue
+            
+            b_prompt_dependencies: list[int] = []
+            if isinstance(b_prompt, B_Prompt_Edit_Link):
+                b_prompt.link_id = B_Symbols.intern(b_prompt.link_name)
+                if isinstance(B_Prompt_Map.getById(b_prompt.link_id), B_Prompt_Edit):
+                    b_prompt_dependencies.append(b_prompt.link_id)
+                else:
+                    printWarning(type(b_prompt), f"{b_prompt.name} - resolve()", f"Linked prompt not found -> '{b_prompt.link_name}'")
+            
+            refs: list[int] = []
+            for name in b_prompt.getReferences():
+                b_prompt_ref = B_Prompt_Map.get(name)
+                if b_prompt_ref is None:
+                    printWarning(type(b_prompt), f"{b_prompt.name} - resolve()", f"Invalid reference -> '${{{name}}}'")
+                    continue
+                if b_prompt_ref.id not in refs:
+                    refs.append(b_prompt_ref.id)
+            b_prompt.refs = tuple(refs)
+            b_prompt_dependencies += refs
+            
+            if len(b_prompt_dependencies) > 0:
+                dependencies[b_prompt.id] = b_prompt_dependencies
+        
+        # Depth-first over dependencies: the post-order is topological, an edge back into the path closes a cycle
+        rank: dict[int, int] = {}
+        visiting: set[int] = set()
+        for b_prompt_id_root in dependencies:
+            if b_prompt_id_root in rank:
+                continue
+            
+            stack: list[tuple[int, typing.Iterator[int]]] = [(b_prompt_id_root, iter(list(dependencies[b_prompt_id_root])))]
+            visiting.add(b_prompt_id_root)
+            while len(stack) > 0:
+                b_prompt_id, it = stack[-1]
+                b_prompt_id_dependency = next(it, None)
+                if b_prompt_id_dependency is None:
+                    stack.pop()
+                    visiting.discard(b_prompt_id)
+                    rank[b_prompt_id] = len(rank)
+                elif b_prompt_id_dependency in visiting:
+                    B_Prompt_Map._reject(B_Prompt_Map._map[b_prompt_id], b_prompt_id_dependency)
+                    dependencies[b_prompt_id].remove(b_prompt_id_dependency)
+                elif b_prompt_id_dependency not in rank:
+                    stack.append((b_prompt_id_dependency, iter(list(dependencies.get(b_prompt_id_dependency, ())))))
+                    visiting.add(b_prompt_id_dependency)
+        
+        dependents: dict[int, list[int]] = {}
+        for b_prompt_id, b_prompt_dependencies in dependencies.items():
+            for b_prompt_id_dependency in b_prompt_dependencies:
+                dependents.setdefault(b_prompt_id_dependency, []).append(b_prompt_id)
+        
+        B_Prompt_Map._dependents = dependents
+        B_Prompt_Map._dependents_all = {}
+        B_Prompt_Map._rank = rank
+        B_Prompt_Map._graph_version = B_Prompt_Map._layout_version
+
+        # Other states drop their fragments when they follow the layout change (see B_Prompt_State.sync)
+        B_Prompt_State._shared.fragments = {}
+        B_Prompt_State._shared.result = None
+    
+    @staticmethod
+    def _reject(b_prompt: B_Prompt, b_prompt_id_dependency: int):
+        """Drop the edge of a cycle from b_prompt to the prompt it depends on"""
+        printWarning(type(b_prompt), f"{b_prompt.name} - resolve()", f"Cyclic reference -> '{B_Symbols.name(b_prompt_id_dependency)}'")
+        if b_prompt_id_dependency in b_prompt.refs:
+            b_prompt.refs = tuple(b_prompt_id for b_prompt_id in b_prompt.refs if b_prompt_id != b_prompt_id_dependency)
+        else:
+            b_prompt.link_id = -1
+    
+    @staticmethod
+    def getDependents(b_prompt_id: int) -> list[int]:
+        """Ids of the prompts depending on it transitively, in topological order"""
+        if B_Prompt_Map._graph_version != B_Prompt_Map._layout_version:
+            B_Prompt_Map.resolve()
+        
+        b_prompt_ids = B_Prompt_Map._dependents_all.get(b_prompt_id)
+        if b_prompt_ids is None:
+            found: set[int] = set()
+            stack = [b_prompt_id]
+            while len(stack) > 0:
+                for b_prompt_id_dependent in B_Prompt_Map._dependents.get(stack.pop(), ()):
+                    if b_prompt_id_dependent not in found:
+                        found.add(b_prompt_id_dependent)
+                        stack.append(b_prompt_id_dependent)
+            b_prompt_ids = sorted(found, key = B_Prompt_Map._rank.__getitem__)
+            B_Prompt_Map._dependents_all[b_prompt_id] = b_prompt_ids
+        return b_prompt_ids
+    
+    @staticmethod
+    def buildReference(b_prompt_id: int) -> tuple[str, str]:
+        b_prompt = B_Prompt_Map.getById(b_prompt_id)
+        return b_prompt.build() if b_prompt is not None else ("", "")
+    
+    @staticmethod
+    def update(b_prompt: B_Prompt | None, remove: bool = False):
+        if b_prompt is None:
+            return
+        
+        if isinstance(b_prompt, B_Prompt_Entry):
+            b_prompt.entries.select(b_prompt.index, not remove)
+            return
+        
+        state = B_Prompt_State.current()
+        if state.select(b_prompt.id, not remove):
+            state.touched.add(b_prompt.id)
+    
+    @staticmethod
+    def invalidate(b_prompt: B_Prompt):
+        """Drop the cached build of a prompt and of its transitive dependents so the next assembly rebuilds them"""
+        if B_Prompt_Map.getById(b_prompt.id) is None:
+            return
+        
+        state = B_Prompt_State.current()
+        state.touched.add(b_prompt.id)
+        for b_prompt_id in itertools.chain((b_prompt.id,), B_Prompt_Map.getDependents(b_prompt.id)):
+            state.fragments.pop(b_prompt_id, None)
+            if state.result is not None and state.isSelected(b_prompt_id):
+                state.result = None
+    
+    @staticmethod
+    def touch(b_prompt: B_Prompt):
+        if isinstance(b_prompt, B_Prompt_Entry):
+            b_prompt = b_prompt.entries
+        B_Prompt_State.current().touched.add(b_prompt.id)
+    
+    @staticmethod
+    def untouch(b_prompts: list[B_Prompt] = None):
+        """Forget changes of prompts just reset (of all prompts if None)"""
+        state = B_Prompt_State.current()
+        if b_prompts is None:
+            state.touched = set()
+            return
+        for b_prompt in b_prompts:
+            state.touched.discard(b_prompt.id)
+    
+    @staticmethod
+    def getTouched() -> set[int]:
+        return set(B_Prompt_State.current().touched)
+    
+    @staticmethod
+    def get(b_prompt_name: str) -> B_Prompt | None:
+        return B_Symbols.lookup(B_Prompt_Map._map, B_Symbols.get(b_prompt_name))
+    
+    @staticmethod
+    def getById(b_prompt_id: int) -> B_Prompt | None:
+        return B_Symbols.lookup(B_Prompt_Map._map, b_prompt_id)
+    
+    @staticmethod
+    def isSelected(b_prompt: B_Prompt | None):
+        if isinstance(b_prompt, B_Prompt_Entry):
+            return b_prompt.entries.isSelectedEntry(b_prompt.index)
+        return b_prompt is not None and B_Prompt_Map.getById(b_prompt.id) is not None and B_Prompt_State.current().isSelected(b_prompt.id)
+    
+    @staticmethod
+    def getSelection() -> list[B_Prompt]:
+        """Prompts selected, the entries selected of a B_Prompt_Entries made prompts in its place"""
+        b_prompts: list[B_Prompt] = []
+        for i in B_Prompt_State.current().selected:
+            b_prompt = B_Prompt_Map._map[B_Prompt_Map._ids[i]]
+            if isinstance(b_prompt, B_Prompt_Entries):
+                b_prompts += [b_prompt.getEntry(j) for j in b_prompt.getSelected()]
+            else:
+                b_prompts.append(b_prompt)
+        return b_prompts
+    
+    @staticmethod
+    def getSelectionBetween(b_prompt_first: B_Prompt, b_prompt_last: B_Prompt) -> list[B_Prompt]:
+        """Prompts selected from one to another in the assembly order, without going over those not selected"""
+        selected = B_Prompt_State.current().selected
+        j = bisect.bisect_left(selected, B_Prompt_Map._order[b_prompt_first.id])
+        k = bisect.bisect_right(selected, B_Prompt_Map._order[b_prompt_last.id])
+        return [B_Prompt_Map._map[B_Prompt_Map._ids[i]] for i in selected[j:k]]
+    
+    @staticmethod
+    def setSelection(b_prompts: list[B_Prompt]):
+        state = B_Prompt_State.current()
+        entries_selected: dict[int, list[int]] = {}
+        for b_prompt in b_prompts:
+            if isinstance(b_prompt, B_Prompt_Entry):
+                entries_selected.setdefault(b_prompt.entries.id, []).append(b_prompt.index)
+        for b_prompt_id in set(state.entries).union(entries_selected):
+            b_prompt = B_Prompt_Map.getById(b_prompt_id)
+            if isinstance(b_prompt, B_Prompt_Entries):
+                b_prompt.setSelected(entries_selected.get(b_prompt_id, ()))
+        b_prompts = [b_prompt for b_prompt in b_prompts if not isinstance(b_prompt, B_Prompt_Entry)]
+        b_prompts += [b_prompt for b_prompt in map(B_Prompt_Map.getById, entries_selected) if b_prompt is not None]
+        
+        selected = sorted(set(B_Prompt_Map._order[b_prompt.id] for b_prompt in b_prompts if B_Prompt_Map.getById(b_prompt.id) is b_prompt))
+        changed = set(state.selected).symmetric_difference(selected)
+        if len(changed) == 0:
+            return
+        
+        state.touched.update(B_Prompt_Map._ids[i] for i in changed)
+        state.selected = array("l", selected)
+        state.result = None
+    
+    @staticmethod
+    def deselectAll():
+        state = B_Prompt_State.current()
+        if len(state.selected) == 0:
+            return
+        
+        state.touched.update(B_Prompt_Map._ids[i] for i in state.selected)
+        state.selected = array("l")
+        state.result = None
+    
+    @staticmethod
+    def setNormalize(normalize: bool):
+        state = B_Prompt_State.current()
+        if state.normalize != normalize:
+            state.normalize = normalize
+            state.result = None
+    
+    @staticmethod
+    def buildPromptFragments() -> tuple[list[str], list[str]]:
+        """Non-empty outputs of the selected prompts in assembly order, without duplicate tags if normalized (what buildPromptUpdate() joins)"""
+        state = B_Prompt_State.current()
+        if B_Prompt_Map._graph_version != B_Prompt_Map._layout_version:
+            B_Prompt_Map.resolve()
+        
+        prompts: list[str] = []
+        prompts_negative: list[str] = []
+        
+        for i in state.selected:
+            b_prompt_id = B_Prompt_Map._ids[i]
+            fragment = state.fragments.get(b_prompt_id)
+            if fragment is None:
+                b_prompt = B_Prompt_Map._map[b_prompt_id]
+                if b_prompt is None:
+                    continue #! removed by a reload in progress
+                fragment = b_prompt.build()
+                state.fragments[b_prompt_id] = fragment
+            
+            b_prompt_positive, b_prompt_negative = fragment
+            if len(b_prompt_positive) > 0:
+                prompts.append(b_prompt_positive)
+            if len(b_prompt_negative) > 0:
+                prompts_negative.append(b_prompt_negative)
+        
+        if state.normalize:
+            return B_Tags.normalized(prompts), B_Tags.normalized(prompts_negative)
+        return prompts, prompts_negative
+    
+    @staticmethod
+    def buildPromptUpdate() -> list[str]:
+        state = B_Prompt_State.current()
+        if state.result is None or B_Prompt_Map._graph_version != B_Prompt_Map._layout_version:
+            prompts, prompts_negative = B_Prompt_Map.buildPromptFragments()
+            state.result = ", ".join(prompts), ", ".join(prompts_negative)
+        
+        return list(state.result)
+
+B_Prompt_Map.clear()
@@ -0,0 +1,55 @@
+"""Seeded weighted sampling"""
+
+import random
+import heapq
+
+class B_Sampler():
+    """Weighted sampling of indexes in O(1) per draw using an alias table (Vose)"""
+
+    def __init__(self, weights: list[float]):
+        self.weights: list[float] = list(weights)
+        self.indexes: list[int] = [i for i, w in enumerate(weights) if w > 0]
+        
+        n = len(self.indexes)
+        self.prob: list[float] = [1.0] * n
+        self.alias: list[int] = list(range(n))
+        if n == 0:
+            return
+        
+        total = sum(weights[i] for i in self.indexes)
+        scaled = [weights[i] * n / total for i in self.indexes]
+        small = [j for j, w in enumerate(scaled) if w < 1]
+        large = [j for j, w in enumerate(scaled) if w >= 1]
+        while len(small) > 0 and len(large) > 0:
+            j_small, j_large = small.pop(), large.pop()
+            self.prob[j_small] = scaled[j_small]
+            self.alias[j_small] = j_large
+            scaled[j_large] -= 1 - scaled[j_small]
+            (small if scaled[j_large] < 1 else large).append(j_large)
+    
+    def __len__(self) -> int:
+        return len(self.indexes)
+    
+    def sample(self, rng: random.Random) -> int:
+        j = rng.randrange(len(self.indexes))
+        return self.indexes[j if rng.random() < self.prob[j] else self.alias[j]]
+    
+    def sampleDistinct(self, rng: random.Random, k: int) -> list[int]:
+        """Draw k distinct indexes, rejecting repeats while k is small relative to the population"""
+        weights = self.weights
+        k = min(k, len(self.indexes))
+        if k * 2 > len(self.indexes):
+            # Dense draw: weighted keys over the whole population (Efraimidis-Spirakis)
+            return heapq.nlargest(k, self.indexes, key = lambda i: rng.random() ** (1 / weights[i]))
+        
+        selected: dict[int, None] = {}
+        attempts = 0
+        while len(selected) < k:
+            attempts += 1
+            if attempts > k * 32:
+                # Heavily skewed weights: finish with a dense draw over what is left
+                remaining = [i for i in self.indexes if i not in selected]
+                selected.update(dict.fromkeys(heapq.nlargest(k - len(selected), remaining, key = lambda i: rng.random() ** (1 / weights[i]))))
+                break
+            selected[self.sample(rng)] = None
+        return list(selected)
@@ -0,0 +1,140 @@
+"""Opt-in startup profiler: time and UI components/listeners created per startup phase, diffed against a saved JSON baseline"""
+
+import typing
+import contextlib
+import json
+import os
+import time
+
+from .common import printGeneral
+
+class B_Startup():
+    enabled: bool = False
+    tolerance: float = 1.25 # Flagged when above baseline * tolerance...
+    tolerance_min_ms: float = 5.0 # ...and (for time) more than this above it
+
+    fn_count: typing.Callable[[], tuple[int, int] | None] = None # Components and listeners created so far, None if unknown
+
+    _sections: dict[str, list] = {} # Path -> [ms, components, listeners] (or None when unknown), in the order first entered
+    _path: list[str] = []
+    _t: float = None
+    _null = contextlib.nullcontext()
+
+    @staticmethod
+    def section(name: str | None) -> typing.ContextManager:
+        """Time a phase (or a part of the current one) of startup, nothing while disabled or without a name"""
+        if not B_Startup.enabled or name is None:
+            return B_Startup._null
+        return B_Startup._section(name)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _section(name: str):
+        if B_Startup._t is None:
+            B_Startup._t = time.perf_counter()
+        B_Startup._path.append(name)
+        path = "/".join(B_Startup._path)
+        entry = B_Startup._sections.get(path)
+        if entry is None:
+            entry = B_Startup._sections[path] = [0.0, 0, 0]
+
+        counts = B_Startup.getCounts()
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry[0] += (time.perf_counter() - t) * 1000
+            counts_after = B_Startup.getCounts()
+            B_Startup._path.pop()
+
+            for i in (1, 2):
+                if counts is None or counts_after is None or entry[i] is None:
+                    entry[i] = None
+                else:
+                    entry[i] += counts_after[i - 1] - counts[i - 1]
+
+    @staticmethod
+    def getCounts() -> tuple[int, int] | None:
+        if B_Startup.fn_count is None:
+            return None
+        try:
+            return B_Startup.fn_count()
+        except Exception:
+            return None
+
+    @staticmethod
+    def getResults() -> dict[str, dict[str, typing.Any]]:
+        return {
+            path: {"ms": round(ms, 3), "components": components, "listeners": listeners}
+            for path, (ms, components, listeners) in B_Startup._sections.items()
+        }
+
+    @staticmethod
+    def getReport() -> list[str]:
+        """One line per section, indented by depth"""
+        lines: list[str] = []
+        if B_Startup._t is not None:
+            lines.append(f"Startup profile: {(time.perf_counter() - B_Startup._t) * 1000:.0f} ms since the first phase")
+        for path, result in B_Startup.getResults().items():
+            depth = path.count("/")
+            counts = "" if result["components"] is None else f" · {result['components']} components, {result['listeners']} listeners"
+            lines.append(f"{'  ' * (depth + 1)}{path.rsplit('/', 1)[-1]}: {result['ms']:.1f} ms{counts}")
+        return lines
+
+    @staticmethod
+    def compare(baseline: dict[str, dict[str, typing.Any]]) -> list[str]:
+        """Sections above their baseline past the tolerances, sections new since the baseline are not compared"""
+        regressions: list[str] = []
+        for path, result in B_Startup.getResults().items():
+            result_baseline = baseline.get(path)
+            if result_baseline is None:
+                continue
+            for k, unit, minimum in (("ms", " ms", B_Startup.tolerance_min_ms), ("components", "", 0), ("listeners", "", 0)):
+                value = result.get(k)
+                value_baseline = result_baseline.get(k)
+                if value is None or value_baseline is None:
+                    continue
+                if value > value_baseline * B_Startup.tolerance and value - value_baseline > minimum:
+                    regressions.append(f"{path} {k}: {value_baseline:g}{unit} -> {value:g}{unit}")
+        return regressions
+
+    @staticmethod
+    def finish(path_baseline: str, save: bool = False) -> list[str]:
+        """Print the report and any regressions against the baseline file, which is written if missing (or if save);
+        returns the regressions"""
+        if not B_Startup.enabled or len(B_Startup._sections) == 0:
+            return []
+
+        for line in B_Startup.getReport():
+            printGeneral(line)
+
+        regressions: list[str] = []
+        baseline: dict[str, typing.Any] = None
+        if os.path.isfile(path_baseline):
+            try:
+                with open(path_baseline, "r", encoding = "utf8") as file_baseline:
+                    baseline = json.load(file_baseline)
+            except (OSError, ValueError) as e:
+                printGeneral(f"Startup profile: baseline not read ({type(e).__name__}) -> {path_baseline}")
+
+        if baseline is not None:
+            regressions = B_Startup.compare(baseline.get("sections", {}))
+            for regression in regressions:
+                printGeneral(f"Startup regression: {regression}")
+            if len(regressions) == 0:
+                printGeneral("Startup profile: no regressions against the baseline")
+
+        if baseline is None or save:
+            os.makedirs(os.path.dirname(path_baseline), exist_ok = True)
+            with open(path_baseline, "w", encoding = "utf8") as file_baseline:
+                json.dump({"sections": B_Startup.getResults()}, file_baseline, indent = 4, ensure_ascii = False)
+            printGeneral(f"Startup profile: baseline saved -> {path_baseline}")
+
+        B_Startup.clear()
+        return regressions
+
+    @staticmethod
+    def clear() -> None:
+        B_Startup._sections = {}
+        B_Startup._path = []
+        B_Startup._t = None
@@ -0,0 +1,73 @@
+"""Tag normalization stage of prompt assembly: drops duplicate tags across fragments and merges their emphasis"""
+
+class B_Tags():
+    separator: str = ","
+
+    @staticmethod
+    def split(fragment: str) -> list[str]:
+        """Tags separated by top level commas (not within (), [] or {}, escaped brackets are text)"""
+        tags: list[str] = []
+        depth: int = 0
+        start: int = 0
+        escaped: bool = False
+
+        for i, c in enumerate(fragment):
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c in "([{":
+                depth += 1
+            elif c in ")]}":
+                depth = max(0, depth - 1)
+            elif c == B_Tags.separator and depth == 0:
+                tags.append(fragment[start:i].strip())
+                start = i + 1
+
+        tags.append(fragment[start:].strip())
+        return [tag for tag in tags if len(tag) > 0]
+
+    @staticmethod
+    def parse(tag: str) -> tuple[str, float]:
+        """Text and emphasis of a tag, (text:emphasis) being the only form read as emphasis"""
+        if len(tag) > 2 and tag[0] == "(" and tag[-1] == ")" and not tag.endswith("\\)"):
+            text, sep, weight = tag[1:-1].rpartition(":")
+            if len(sep) > 0 and B_Tags.split(text) == [text.strip()] and "(" not in weight:
+                try:
+                    return text.strip(), float(weight)
+                except ValueError:
+                    pass
+        return tag, 1.0
+
+    @staticmethod
+    def getKey(text: str) -> str:
+        return " ".join(text.lower().split())
+
+    @staticmethod
+    def normalized(fragments: list[str]) -> list[str]:
+        """Fragments without the tags found earlier (regardless of case and whitespace), in linear time;
+        a tag found with different emphasis keeps its first place with the one furthest from 1"""
+        entries: dict[str, list] = {} # Key -> [text, emphasis, tag as written (None once merged)]
+        tags: list[tuple[int, str]] = [] # Fragment index and key of each tag found first
+
+        for i, fragment in enumerate(fragments):
+            for tag in B_Tags.split(fragment):
+                text, emphasis = B_Tags.parse(tag)
+                key = B_Tags.getKey(text)
+                entry = entries.get(key)
+                if entry is None:
+                    entries[key] = [text, emphasis, tag]
+                    tags.append((i, key))
+                else:
+                    if abs(emphasis - 1) > abs(entry[1] - 1):
+                        entry[1] = emphasis
+                        entry[2] = None
+
+        fragments_normalized: list[list[str]] = [[] for _ in fragments]
+        for i, key in tags:
+            text, emphasis, tag = entries[key]
+            if tag is None:
+                tag = f"({text}:{emphasis})" if emphasis != 1 else text
+            fragments_normalized[i].append(tag)
+
+        return [", ".join(tags_fragment) for tags_fragment in fragments_normalized if len(tags_fragment) > 0]
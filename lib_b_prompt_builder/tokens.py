@@ -0,0 +1,98 @@
+"""CLIP token counts of prompt fragments and their packing into conditioning chunks"""
+
+import typing
+import functools
+import re
+import threading
+
+from .common import printGeneral
+
+class B_Tokens():
+    """Counts with the CLIP tokenizer if transformers has it available offline, otherwise estimates them"""
+    chunk_size: int = 75 # Tokens per conditioning chunk of the webui
+    break_prompt: str = "BREAK"
+
+    tokenizer_name: str = "openai/clip-vit-large-patch14"
+    _tokenizer: typing.Any = None
+    _tokenizer_loaded: bool = False
+    _tokenizer_lock = threading.Lock()
+
+    _break = re.compile(r"\s*\bBREAK\b\s*")
+    _weight = re.compile(r":\s*-?\d*\.?\d+\s*(?=[)\]])") # (x:1.2) and [a:b:0.5]
+    _estimate = re.compile(r"[^\W\d_]+|\d|[^\w\s]")
+    _syntax = str.maketrans("()[]:|", "      ")
+
+    @staticmethod
+    def getTokenizer() -> typing.Any:
+        if not B_Tokens._tokenizer_loaded:
+            with B_Tokens._tokenizer_lock:
+                if not B_Tokens._tokenizer_loaded:
+                    try:
+                        from transformers import CLIPTokenizer
+                        B_Tokens._tokenizer = CLIPTokenizer.from_pretrained(B_Tokens.tokenizer_name, local_files_only = True)
+                    except Exception as e:
+                        printGeneral(f"Token counts are estimated, no offline CLIP tokenizer ({type(e).__name__})")
+                    B_Tokens._tokenizer_loaded = True
+        return B_Tokens._tokenizer
+
+    @staticmethod
+    def setTokenizer(tokenizer: typing.Any):
+        """Anything with tokenize(text) -> list, None to estimate"""
+        B_Tokens._tokenizer = tokenizer
+        B_Tokens._tokenizer_loaded = True
+        B_Tokens.count.cache_clear()
+
+    @staticmethod
+    @functools.lru_cache(maxsize = 8192)
+    def count(fragment: str) -> int:
+        """Tokens of a fragment (without BREAK) once emphasis and prompt editing syntax is stripped"""
+        text = B_Tokens._weight.sub(" ", fragment).translate(B_Tokens._syntax)
+        tokenizer = B_Tokens.getTokenizer()
+        if tokenizer is not None:
+            return len(tokenizer.tokenize(text))
+
+        # CLIP has most words as single tokens, splits long ones and gives each digit and punctuation mark its own
+        return sum(-(-len(word) // 8) if word[0].isalpha() else 1 for word in B_Tokens._estimate.findall(text))
+
+    @staticmethod
+    def span(fragment: str) -> tuple[int, int]:
+        """Chunks a fragment spans starting on a new one and the tokens in its last chunk"""
+        chunks: int = 0
+        fill: int = 0
+        for part in B_Tokens._break.split(fragment):
+            tokens = B_Tokens.count(part)
+            part_chunks = max(1, -(-tokens // B_Tokens.chunk_size))
+            chunks += part_chunks
+            fill = tokens - (part_chunks - 1) * B_Tokens.chunk_size
+        return chunks, fill
+
+    @staticmethod
+    def measure(prompt: str) -> tuple[int, int]:
+        """Tokens and chunks of a prompt as written"""
+        if len(prompt.strip()) == 0:
+            return 0, 1
+        return sum(B_Tokens.count(part) for part in B_Tokens._break.split(prompt)), B_Tokens.span(prompt)[0]
+
+    @staticmethod
+    def pack(fragments: list[str], breaks: typing.Container[int] = ()) -> tuple[str, int]:
+        """Join fragments with commas in their order, starting a new chunk (BREAK) only before a fragment that would cross
+        a chunk boundary and before the indexes in breaks; returns the prompt and the chunks it takes"""
+        prompt: str = ""
+        chunks: int = 0
+        fill: int = 0
+
+        for i, fragment in enumerate(fragments):
+            fragment_chunks, fragment_fill = B_Tokens.span(fragment)
+            if len(prompt) == 0:
+                prompt = fragment
+            elif i not in breaks and fragment_chunks == 1 and fill + 1 + fragment_fill <= B_Tokens.chunk_size:
+                prompt = f"{prompt}, {fragment}"
+                fill += 1 + fragment_fill
+                continue
+            else:
+                prompt = f"{prompt} {B_Tokens.break_prompt} {fragment}"
+
+            chunks += fragment_chunks
+            fill = fragment_fill
+
+        return prompt, max(1, chunks)
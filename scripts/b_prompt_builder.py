@@ -4,10 +4,41 @@ import os
 import typing
 import random
 import json
+import contextlib
+import contextvars
+import copy
+import itertools
+import threading
+import collections
+import time
 
 from abc import ABC, abstractmethod
-from modules import scripts
-from modules.processing import process_images
+from modules import scripts, shared
+from modules.processing import process_images, fix_seed
+
+from lib_b_prompt_builder import (
+    printGeneral
+    , printWarning
+    , B_Symbols
+    , B_Value
+    , B_Prompt
+    , B_Prompt_Single
+    , B_Prompt_Dual
+    , B_Prompt_Edit
+    , B_Prompt_Edit_Link
+    , B_Prompt_Entries
+    , B_Prompt_Entry
+    , B_Prompt_State
+    , B_Prompt_Map
+    , B_Sampler
+    , B_Layout_Lexer
+    , B_Layout_Cache
+    , B_Tokens
+    , B_Events
+    , B_Event_Profiler
+    , B_Startup
+    , B_Choice_File
+)
 
 b_path_base = scripts.basedir()
 b_file_name_config = "ui-config.json"
@@ -15,14 +46,30 @@ b_folder_name_scripts = "scripts"
 b_folder_name_script_config = "b_prompt_builder"
 b_file_name_layout = "layout.txt"
 b_file_name_presets = "presets.txt"
+b_file_name_startup_baseline = "startup_baseline.json"
 
 break_prompt = "BREAK"
 
-is_gradio_3 = True #! improve implementation
+is_gradio_3 = int(gr.__version__.split(".")[0]) < 4 # Gradio 3 updates through component.update, Gradio 4 through the component constructors
 b_tagged_ignore = False
 b_validate_skip = False #! unused
 show_presets = False
 use_alt_color_prompt_name = True
+use_layout_cache = True
+lazy_containers: int = 0 # Default for TAB/ACCORDION --lazy: 0 = build on startup, 1 = build on first open, 2 = also prewarm after page load
+compact_containers = False # Default for TAB/ACCORDION/GROUP --compact: show their prompts as toggle chips sharing one prompt UI instead of a prompt UI each
+matrix_images_kept: int = 64 # Most recent images of a prompt matrix run returned to the UI (all are saved as usual), 0 = all
+hot_reload = False # Watch layout.txt/presets.txt and rebuild changed top level TAB/ACCORDION blocks in place (Gradio 4 only, requires gr.render; ignored on Gradio 3)
+hot_reload_interval: float = 2 # Seconds between file checks (requires gr.Timer, otherwise use the Settings button)
+event_stats = False # Record wall time, outputs touched and payload size of every event callback, saved from the Settings button as event_stats.prom/.json
+startup_profile: int = 0 # 0 = off, 1 = print time and components/listeners per startup phase and top level item, and flag regressions against startup_baseline.json (saved if missing), 2 = also save it again
+
+B_Events.enabled = event_stats
+B_Event_Profiler.configure(os.environ, os.path.join(b_path_base, b_folder_name_scripts, b_folder_name_script_config, "profiles")) # See B_Event_Profiler for the variables
+B_Startup.enabled = startup_profile > 0
+
+#! the core package stays loaded across a webui "Reload UI" while this script runs again
+B_Prompt_Map.clear()
 
 def getColorKeys() -> list[str]:
     return [
@@ -50,457 +97,157 @@ def getColorKeys() -> list[str]:
         , "Two-tone"
     ]
 
-def printGeneral(message: str) -> None:
-    print(f"* B Prompt builder: {message}")
+class B_Session():
+    """Per browser session prompt state, and record of the component properties last sent to (or received from) the client, used to skip unchanged output updates"""
+    _sessions: collections.OrderedDict[str, "B_Session"] = collections.OrderedDict() # Least recently used first
+    _sessions_expired: collections.OrderedDict[str, None] = collections.OrderedDict() # Of sessions dropped while their page may still be open
+    _sessions_ttl: float = 24 * 60 * 60 # Seconds a session is kept without any event
+    _sessions_max: int = 1024 # Past this the least recently used sessions expire early
+    _sessions_expired_max: int = 16384
+    _sessions_lock = threading.Lock() # Held only to add and drop sessions
 
-def printWarning(type: type, name: str, message: str) -> None:
-    printGeneral(f"WARNING/{type.__name__}/{name}: {message}")
+    _current: contextvars.ContextVar["B_Session"] = contextvars.ContextVar("b_session", default = None)
+    _inputs: contextvars.ContextVar[dict[int, typing.Any]] = contextvars.ContextVar("b_session_inputs", default = None)
 
-class B_Value():
-    def __init__(self, value_default):
-        self.value_default = value_default
-        self.value = self.buildDefaultValue()
-    
-    def buildDefaultValue(self):
-        return self.value_default
-    
-    def update(self, value):
-        self.value = value
-    
-    def reset(self):
-        self.value = self.buildDefaultValue()
-    
-    def reinit(self, value_default, keep_current: bool = False):
-        self.value_default = value_default
-        if not keep_current:
-            self.reset()
+    _unknown = object()
 
-class B_Prompt(ABC):
-    class Meta():
-        def __init__(
-                self
-                , prompt_enable: bool = False
-                , negative_enable: bool = False
-                , prompt_negative_enable: bool = False
-                , prompt_edit_enable: bool = False
-            ):
-            self.name_visible = True
-
-            self.prompt_visible = prompt_enable
-            self.prompt_enable = prompt_enable
-
-            self.prompt_negative_visible = prompt_negative_enable
-            self.prompt_negative_enable = prompt_negative_enable
-            
-            self.negative_visible = negative_enable
-            self.prompt_edit_visible = prompt_edit_enable
-    
-    class Values():
-        class Defaults():
-            prompt: str = ""
-
-            emphasis: float = 1
-            emphasis_min: float = 0
-            emphasis_step: float = 0.1
-
-            edit: int = 50
-            edit_min: int = 0
-            edit_max: int = 100
-            edit_step: int = 1
-
-            negative: bool = False
-        
-        class Keys():
-            prompt = "pp"
-            prompt_negative = "pn"
-            emphasis = "sp"
-            emphasis_negative = "sn"
-            negative = "n"
-            prompt_a = "a"
-            prompt_b = "b"
-            edit = "r"
-            prefix = "prefix"
-            postfix = "postfix"
-        
-        @staticmethod
-        def _fromArgs(args: dict[str, str]):
-            prompt = args.get(B_Prompt.Values.Keys.prompt)
-            emphasis = args.get(B_Prompt.Values.Keys.emphasis)
-            prompt_negative = args.get(B_Prompt.Values.Keys.prompt_negative)
-            emphasis_negative = args.get(B_Prompt.Values.Keys.emphasis_negative)
-            negative = args.get(B_Prompt.Values.Keys.negative)
-            edit = args.get(B_Prompt.Values.Keys.edit)
-            return B_Prompt.Values(
-                prompt = prompt if prompt is not None else None
-                , emphasis = float(emphasis) if emphasis is not None else None
-                , negative = bool(int(negative)) if negative is not None else None
-                , prompt_negative = prompt_negative if prompt_negative is not None else None
-                , emphasis_negative = float(emphasis_negative) if emphasis_negative is not None else None
-                , edit = int(edit) if edit is not None else None
-            )
-        
-        @staticmethod
-        def _updateOrResetValue(b_value: B_Value, b_value_new: B_Value, resetIfNone: bool):
-            if b_value_new.value is not None:
-                b_value.update(b_value_new.value)
-            elif resetIfNone:
-                b_value.reset()
-
-        def __init__(
-                self
-                , prompt: str = Defaults.prompt
-                , emphasis: float = Defaults.emphasis
-                , negative: bool = Defaults.negative
-                , prompt_negative: str = Defaults.prompt
-                , emphasis_negative: float = Defaults.emphasis
-                , prompt_a: str = Defaults.prompt
-                , prompt_b: str = Defaults.prompt
-                , edit: int = Defaults.edit
-                , prefix: str = Defaults.prompt
-                , postfix: str = Defaults.prompt
-            ):
-            self.prompt = B_Value(prompt)
-            self.emphasis = B_Value(emphasis)
-            self.negative = B_Value(negative)
-            self.prompt_negative = B_Value(prompt_negative)
-            self.emphasis_negative = B_Value(emphasis_negative)
-            self.edit = B_Value(edit)
-            self.prompt_a = B_Value(prompt_a)
-            self.prompt_b = B_Value(prompt_b)
-            self.prefix = B_Value(prefix)
-            self.postfix = B_Value(postfix)
-        
-        def updateFromArgs(self, args: dict[str, str], resetIfNone: bool = False):
-            if len(args) == 0:
-                return
-            
-            values_new = self._fromArgs(args)
-            if values_new is None:
-                return
-            
-            self._updateOrResetValue(self.prompt, values_new.prompt, resetIfNone)
-            self._updateOrResetValue(self.emphasis, values_new.emphasis, resetIfNone)
-            self._updateOrResetValue(self.prompt_negative, values_new.prompt_negative, resetIfNone)
-            self._updateOrResetValue(self.emphasis_negative, values_new.emphasis_negative, resetIfNone)
-            self._updateOrResetValue(self.negative, values_new.negative, resetIfNone)
-            self._updateOrResetValue(self.edit, values_new.edit, resetIfNone)
-
-    class Fn():
-        @staticmethod
-        def sanitized(prompt: str) -> str:
-            return prompt.strip() if prompt is not None else ""
-        
-        @staticmethod
-        def added(promptExisting: str, promptToAdd: str, use_space: bool = False) -> str:
-            if len(promptToAdd) > 0:
-                if len(promptExisting) > 0:
-                    promptExisting += (", " if not use_space else " ") + promptToAdd
-                else:
-                    promptExisting = promptToAdd
-            
-            return promptExisting
-        
-        @staticmethod
-        def decorated(prompt: str, prefix: str = "", postfix: str = "") -> str:
-            if len(prompt) > 0:
-                if len(prefix) > 0:
-                    prompt = f"{prefix} {prompt}"
-                if len(postfix) > 0:
-                    prompt = f"{prompt} {postfix}"
-            
-            return prompt
-        
-        @staticmethod
-        def emphasized(prompt: str, emphasis: float) -> str:
-            if len(prompt) == 0 or emphasis == B_Prompt.Values.Defaults.emphasis_min:
-                return ""
-            
-            if emphasis != 1:
-                prompt = f"({prompt}:{emphasis})"
-            
-            return prompt
-    
     @staticmethod
-    @abstractmethod
-    def _fromArgs(name: str, args: dict[str, str]):
-        pass
-    
-    def __init__(self, name: str, meta: Meta, values: Values):
-        self.name = name
-        self.meta = meta
-        self.values = values
-
-        B_Prompt_Map.add(self)
-    
-    def reset(self):
-        if self.meta.prompt_enable:
-            self.values.prompt.reset()
-        self.values.emphasis.reset()
-        self.values.negative.reset()
-        if self.meta.prompt_negative_enable:
-            self.values.prompt_negative.reset()
-        self.values.emphasis_negative.reset()
-        self.values.edit.reset()
-        #! not rendered in UI:
-        # self.values.prompt_a.reset()
-        # self.values.prompt_b.reset()
-        # self.values.prefix.reset()
-        # self.values.postfix.reset()
-    
-    def clear(self):
-        if self.meta.prompt_enable:
-            self.values.prompt.update(B_Prompt.Values.Defaults.prompt)
-        self.values.emphasis.update(B_Prompt.Values.Defaults.emphasis)
-        self.values.negative.update(B_Prompt.Values.Defaults.negative)
-        if self.meta.prompt_negative_enable:
-            self.values.prompt_negative.update(B_Prompt.Values.Defaults.prompt)
-        self.values.emphasis_negative.update(B_Prompt.Values.Defaults.emphasis)
-        self.values.edit.update(B_Prompt.Values.Defaults.edit)
-        #! not rendered in UI:
-        # self.values.prompt_a.update(B_Prompt.Values.Defaults.prompt)
-        # self.values.prompt_b.update(B_Prompt.Values.Defaults.prompt)
-        # self.values.prefix.update(B_Prompt.Values.Defaults.prompt)
-        # self.values.postfix.update(B_Prompt.Values.Defaults.prompt)
+    def wrap(fn: typing.Callable, source: str = "") -> typing.Callable:
+        """Wrap an event callback so that the updates it returns are diffed against its session (and instrumented, if enabled, under the name of its B_UI)"""
+        def _fn(request: gr.Request, *inputValues):
+            with B_Session.use(request.session_hash if request is not None else None) as session:
+                with session.lock if session is not None else contextlib.nullcontext():
+                    return fn(*inputValues)
+        return B_Events.wrap(_fn, source, B_Events.getEventName(fn))
     
-    @abstractmethod
-    def build(self) -> tuple[str, str]:
-        pass
-
-class B_Prompt_Single(B_Prompt):
     @staticmethod
-    def _fromArgs(name: str, args: dict[str, str]):
-        return B_Prompt_Single(
-            name
-            , args.get(B_Prompt.Values.Keys.prompt, B_Prompt.Values.Defaults.prompt)
-            , float(args.get(B_Prompt.Values.Keys.emphasis, B_Prompt.Values.Defaults.emphasis))
-            , bool(int(args.get(B_Prompt.Values.Keys.negative, int(B_Prompt.Values.Defaults.negative))))
-            , args.get(B_Prompt.Values.Keys.prefix, B_Prompt.Values.Defaults.prompt)
-            , args.get(B_Prompt.Values.Keys.postfix, B_Prompt.Values.Defaults.prompt)
-        )
-    
-    def __init__(
-            self
-            , name: str
-            , prompt = B_Prompt.Values.Defaults.prompt
-            , emphasis = B_Prompt.Values.Defaults.emphasis
-            , negative = B_Prompt.Values.Defaults.negative
-            , prefix = B_Prompt.Values.Defaults.prompt
-            , postfix = B_Prompt.Values.Defaults.prompt
-        ):
-        super().__init__(
-            name
-            , B_Prompt.Meta(
-                prompt_enable = True
-                , negative_enable = True
-            )
-            , B_Prompt.Values(
-                prompt = prompt
-                , emphasis = emphasis
-                , negative = negative
-                , prefix = prefix
-                , postfix = postfix
-            )
-        )
+    @contextlib.contextmanager
+    def use(session_hash: str | None):
+        """Make the session (and its prompt state) the current one within this context, the shared state is used without a session"""
+        session = B_Session.get(session_hash)
+        token_session = B_Session._current.set(session)
+        token_inputs = B_Session._inputs.set({})
+        token_state = B_Prompt_State._current.set(session.state if session is not None else None)
+        try:
+            yield session
+        finally:
+            B_Prompt_State._current.reset(token_state)
+            B_Session._inputs.reset(token_inputs)
+            B_Session._current.reset(token_session)
     
-    def build(self) -> tuple[str, str]:
-        prompt = B_Prompt.Fn.emphasized(
-            B_Prompt.Fn.decorated(
-                B_Prompt.Fn.sanitized(self.values.prompt.value)
-                , B_Prompt.Fn.sanitized(self.values.prefix.value)
-                , B_Prompt.Fn.sanitized(self.values.postfix.value)
-            )
-            , self.values.emphasis.value
-        )
-        if not self.values.negative.value:
-            return prompt, ""
-        else:
-            return "", prompt
-
-class B_Prompt_Dual(B_Prompt):
     @staticmethod
-    def _fromArgs(name: str, args: dict[str, str]):
-        return B_Prompt_Dual(
-            name
-            , args.get(B_Prompt.Values.Keys.prompt, B_Prompt.Values.Defaults.prompt)
-            , float(args.get(B_Prompt.Values.Keys.emphasis, B_Prompt.Values.Defaults.emphasis))
-            , args.get(B_Prompt.Values.Keys.prompt_negative, B_Prompt.Values.Defaults.prompt)
-            , float(args.get(B_Prompt.Values.Keys.emphasis_negative, B_Prompt.Values.Defaults.emphasis))
-        )
+    def get(session_hash: str | None) -> typing.Optional["B_Session"]:
+        if session_hash is None or len(session_hash) == 0:
+            return None
+        
+        time_now = time.monotonic()
+        session = B_Session._sessions.get(session_hash)
+        if session is not None:
+            session.time_used = time_now
+            try:
+                B_Session._sessions.move_to_end(session_hash)
+            except KeyError:
+                pass
+            return session
+        
+        with B_Session._sessions_lock:
+            session = B_Session._sessions.get(session_hash)
+            if session is None:
+                session = B_Session(session_hash in B_Session._sessions_expired)
+                
+                # Expire the sessions idle for too long (and the least recently used ones past the cap)
+                while len(B_Session._sessions) > 0:
+                    session_hash_oldest, session_oldest = next(iter(B_Session._sessions.items()))
+                    if len(B_Session._sessions) < B_Session._sessions_max and time_now - session_oldest.time_used < B_Session._sessions_ttl:
+                        break
+                    del B_Session._sessions[session_hash_oldest]
+                    B_Session._sessions_expired[session_hash_oldest] = None
+                while len(B_Session._sessions_expired) > B_Session._sessions_expired_max:
+                    B_Session._sessions_expired.popitem(last = False)
+                
+                B_Session._sessions[session_hash] = session
+        
+        return session
     
-    def __init__(
-            self
-            , name: str
-            , prompt = B_Prompt.Values.Defaults.prompt
-            , emphasis = B_Prompt.Values.Defaults.emphasis
-            , prompt_negative = B_Prompt.Values.Defaults.prompt
-            , emphasis_negative = B_Prompt.Values.Defaults.emphasis
-        ):
-        super().__init__(
-            name
-            , B_Prompt.Meta(
-                prompt_enable = True
-                , prompt_negative_enable = True
-            )
-            , B_Prompt.Values(
-                prompt = prompt
-                , emphasis = emphasis
-                , prompt_negative = prompt_negative
-                , emphasis_negative = emphasis_negative
-            )
-        )
+    @staticmethod
+    def drop(session_hash: str | None) -> None:
+        """Forget a session whose page was closed"""
+        if session_hash is None:
+            return
+        with B_Session._sessions_lock:
+            B_Session._sessions.pop(session_hash, None)
+            B_Session._sessions_expired.pop(session_hash, None)
     
-    def build(self) -> tuple[str, str]:
-        prompt = B_Prompt.Fn.emphasized(
-            B_Prompt.Fn.decorated(
-                B_Prompt.Fn.sanitized(self.values.prompt.value)
-                , B_Prompt.Fn.sanitized(self.values.prefix.value)
-                , B_Prompt.Fn.sanitized(self.values.postfix.value)
-            )
-            , self.values.emphasis.value
-        )
-        prompt_negative = B_Prompt.Fn.emphasized(
-            B_Prompt.Fn.decorated(
-                B_Prompt.Fn.sanitized(self.values.prompt_negative.value)
-                , B_Prompt.Fn.sanitized(self.values.prefix.value)
-                , B_Prompt.Fn.sanitized(self.values.postfix.value)
-            )
-            , self.values.emphasis_negative.value
-        )
-        return prompt, prompt_negative
-
-class B_Prompt_Edit(B_Prompt):
     @staticmethod
-    def _fromArgs(name: str, args: dict[str, str]):
-        return B_Prompt_Edit(
-            name
-            , args.get(B_Prompt.Values.Keys.prompt_a, B_Prompt.Values.Defaults.prompt)
-            , args.get(B_Prompt.Values.Keys.prompt_b, B_Prompt.Values.Defaults.prompt)
-            , int(args.get(B_Prompt.Values.Keys.edit, B_Prompt.Values.Defaults.edit))
-            , bool(int(args.get(B_Prompt.Values.Keys.negative, int(B_Prompt.Values.Defaults.negative))))
-        )
+    def setInputValues(gr_components: list[typing.Any], inputValues: tuple):
+        inputs = B_Session._inputs.get()
+        if inputs is None:
+            return
+        for gr_component, value in zip(gr_components, inputValues):
+            inputs[gr_component._id] = value
     
     @staticmethod
-    def _build(
-        prompt_a: str
-        , prompt_b: str
-        , prefix: str
-        , postfix: str
-        , edit: int
-        , negative: bool
-    ) -> tuple[str, str]:
-        prompt_a = B_Prompt.Fn.decorated(
-            B_Prompt.Fn.sanitized(prompt_a)
-            , B_Prompt.Fn.sanitized(prefix)
-            , B_Prompt.Fn.sanitized(postfix)
-        )
-        prompt_b = B_Prompt.Fn.decorated(
-            B_Prompt.Fn.sanitized(prompt_b)
-            , B_Prompt.Fn.sanitized(prefix)
-            , B_Prompt.Fn.sanitized(postfix)
-        )
-
-        value = float(edit)
-        value = value / B_Prompt.Values.Defaults.edit_max
-        value = round(1 - value, 2)
-
-        prompt: str = None
-        if value == 1:
-            prompt = prompt_a
-        elif value == 0:
-            prompt = prompt_b
-        else:
-            prompt = f"[{prompt_a}:{prompt_b}:{value}]"
+    def getUpdate(gr_component: typing.Any, fn_update: typing.Callable, props: dict[str, typing.Any], props_input: dict[str, typing.Any] = None) -> typing.Any:
+        """Build an update holding only the properties the client doesn't show yet; props_input are user editable and only known when received as input by the current event"""
+        session = B_Session._current.get()
+        if session is None:
+            return fn_update(**props, **(props_input if props_input is not None else {}))
         
-        if not negative:
-            return prompt, ""
-        else:
-            return "", prompt
-    
-    def __init__(
-            self
-            , name: str
-            , prompt_a: str
-            , prompt_b: str
-            , edit = B_Prompt.Values.Defaults.edit
-            , negative = B_Prompt.Values.Defaults.negative
-        ):
-        super().__init__(
-            name
-            , B_Prompt.Meta(
-                negative_enable = True
-                , prompt_edit_enable = True
-            )
-            , B_Prompt.Values(
-                negative = negative
-                , prompt_a = prompt_a
-                , prompt_b = prompt_b
-                , edit = edit
-            )
-        )
+        changed: dict[str, typing.Any] = {}
+
+        known = session.props.get(gr_component._id)
+        if known is None:
+            known = session.props[gr_component._id] = {}
+        for k, v in props.items():
+            v_known = known.get(k, B_Session._unknown)
+            if v_known is B_Session._unknown and session.trust_initial:
+                v_known = getattr(gr_component, k, B_Session._unknown)
+            if v_known is B_Session._unknown or v_known != v:
+                changed[k] = v
+                known[k] = v
+        
+        if props_input is not None:
+            inputs = B_Session._inputs.get()
+            value_input = inputs.get(gr_component._id, B_Session._unknown)
+            for k, v in props_input.items():
+                if value_input is B_Session._unknown or value_input != v:
+                    changed[k] = v
+                    inputs[gr_component._id] = v
+        
+        if len(changed) == 0:
+            return gr.update()
+        
+        return fn_update(**changed)
     
-    def build(self) -> tuple[str, str]:
-        return B_Prompt_Edit._build(
-            self.values.prompt_a.value
-            , self.values.prompt_b.value
-            , self.values.prefix.value
-            , self.values.postfix.value
-            , self.values.edit.value
-            , self.values.negative.value
-        )
-
-class B_Prompt_Edit_Link(B_Prompt):
     @staticmethod
-    def _fromArgs(name: str, args: dict[str, str]):
-        return B_Prompt_Edit_Link(
-            name
-            , args["link"]
-            , args.get(B_Prompt.Values.Keys.prompt_a, B_Prompt.Values.Defaults.prompt)
-            , args.get(B_Prompt.Values.Keys.prompt_b, B_Prompt.Values.Defaults.prompt)
-            , bool(int(args.get(B_Prompt.Values.Keys.negative, int(B_Prompt.Values.Defaults.negative))))
-        )
+    def forget(gr_ids: range) -> None:
+        """Drop what the current session knows of components no longer in its page (by their ids, see Context.id)"""
+        session = B_Session._current.get()
+        if session is None or len(gr_ids) == 0:
+            return
+        for k in [k for k in list(session.props) if k in gr_ids]:
+            session.props.pop(k, None)
     
-    def __init__(
-            self
-            , name: str
-            , link_name: str
-            , prompt_a: str
-            , prompt_b: str
-            , negative = B_Prompt.Values.Defaults.negative
-        ):
-        super().__init__(
-            name
-            , B_Prompt.Meta(
-                negative_enable = True
-            )
-            , B_Prompt.Values(
-                negative = negative
-                , prompt_a = prompt_a
-                , prompt_b = prompt_b
-            )
-        )
+    def __init__(self, expired: bool = False):
+        # Properties of a component not updated yet in this session are read from the component itself (as sent on page load),
+        # unless the session expired before and the client may show anything
+        self.trust_initial = not expired
+        self.props: dict[int, dict[str, typing.Any]] = {} # By component id (gr_component._id, stable unlike id())
+        self.time_used = time.monotonic()
+        self.lock = threading.RLock() # Events of a session run one at a time (a click may reach a listener per render of the content it acts on)
 
-        self.link_name = link_name
-    
-    def build(self) -> tuple[str, str]:
-        b_prompt_link = self.getLink()
+        # A session expired before no longer has the prompt state its page shows, which can't be rebuilt from the inputs of an event
+        self.expired = expired
 
-        if b_prompt_link is None:
-            printWarning(type(self), f"{self.name} - build()", f"Linked prompt not found -> '{self.link_name}'")
-            return "", "" #!
-        
-        return B_Prompt_Edit._build(
-            self.values.prompt_a.value
-            , self.values.prompt_b.value
-            , self.values.prefix.value
-            , self.values.postfix.value
-            , b_prompt_link.values.edit.value
-            , self.values.negative.value
-        )
-    
-    def getLink(self) -> B_Prompt_Edit | None:
-        return B_Prompt_Map.get(self.link_name)
+        # Deferred containers rendered in its page: container uid -> (renders requested, version last rendered, ids of the components built)
+        self.renders: dict[int, tuple[int, int, range]] = {}
+
+        # Selections and values start from the shared (initial) ones and are only written here
+        self.state = B_Prompt_State._shared.fork()
 
 class B_UI(ABC):
+    _uids = itertools.count()
+
     @staticmethod
     @abstractmethod
     def _fromArgs(args: dict[str, str], name: str = None):
@@ -509,6 +256,9 @@ class B_UI(ABC):
     
     def __init__(self, name: str):
         self.name = name
+        self.id = B_Symbols.intern(name)
+        self.uid = next(B_UI._uids) # Per instance (id is per name), kept by the copies rendered from it
+        self.origin: B_UI = self # Layout B_UI of a rendered copy
     
     def init(self) -> None:
         pass
@@ -539,16 +289,33 @@ class B_UI(ABC):
     def getOutputUpdate(self) -> list:
         return []
 
-    def updateRandom(self, currentValues: tuple) -> int:
+    def updateRandom(self, currentValues: tuple, rng: random.Random = None) -> int:
         offset = self.update(currentValues)
-        self.randomize()
+        self.randomize(rng)
         return offset
     
-    def randomize(self) -> None:
+    def randomize(self, rng: random.Random = None) -> None:
         pass
 
     def applyPresetMapping(self, args: dict[str, str], additive: bool):
+        self.applyPresetPatch(self.compilePresetMapping(args), additive)
+    
+    def compilePresetMapping(self, args: dict[str, str]) -> typing.Any:
+        """Parse preset args once into a patch for applyPresetPatch"""
+        return None
+    
+    def applyPresetPatch(self, patch: typing.Any, additive: bool) -> None:
         pass
+    
+    def getChildren(self) -> list["B_UI"]:
+        return []
+    
+    def copyForRender(self) -> "B_UI":
+        """Copy sharing the state, to build the content of a deferred container into per render"""
+        return copy.copy(self)
+    
+    def getPrompts(self) -> list[B_Prompt]:
+        return []
 
 class B_UI_Preset(B_UI):
     @staticmethod
@@ -563,9 +330,16 @@ class B_UI_Preset(B_UI):
 
         self.additive = additive
         
-        self.mappings: dict[str, dict[str, str]] = {}
+        self.mappings: dict[int, dict[str, str]] = {} # By B_UI id
+
+        # Compiled on init and again whenever B_UI_Map changes
+        self.plan: list[tuple[B_UI, typing.Any]] = None
+        self.plan_version: int = -1
 
         self.gr_button: typing.Any = None
+    
+    def init(self) -> None:
+        self.compile()
 
     def build(self) -> None:
         self.gr_button = gr.Button(self.name)
@@ -574,52 +348,87 @@ class B_UI_Preset(B_UI):
         b_ui_list: list[B_UI] = []
         inputs: list[typing.Any] = []
         outputs: list[typing.Any] = []
+        uids: set[int] = None # Deferred containers showing mapped B_UIs, updated by their renders (all of them if not additive)
         if self.additive:
+            uids = set()
             for k in self.mappings:
-                b_ui = B_UI_Map._map[k]
+                b_ui = B_UI_Map.getBuilt(k)
+                if b_ui is None or b_ui in b_ui_list:
+                    continue
+                if b_ui in B_UI_Map._built_deferred:
+                    uids.add(b_ui.uid)
+                    uids.update(b_ui_nested.uid for b_ui_nested in b_ui.getDescendants() if isinstance(b_ui_nested, B_UI_Container))
+                    continue
                 b_ui_list.append(b_ui)
                 inputs += b_ui.getInput()
                 outputs += b_ui.getOutput()
         else:
-            b_ui_list = list(B_UI_Map._map.values())
+            b_ui_list = list(B_UI_Map._built)
             inputs = B_UI_Map._inputs
             outputs = B_UI_Map._outputs
 
-        def _apply(*inputValues):
+        outputs_count = [len(b_ui.getOutput()) for b_ui in b_ui_list]
+
+        def _applyAction(*inputValues) -> set[B_UI]:
             offset: int = 0
             for b_ui in b_ui_list:
                 offset += b_ui.update(inputValues[offset:])
-            
-            self.apply()
+            return self.apply()
+        
+        def _apply(*inputValues):
+            b_ui_applied = _applyAction(*inputValues)
+            b_ui_applied.update([B_UI_Map.getBuilt(b_ui.id) for b_ui in b_ui_applied]) # Or the B_UIs showing them
             
             updates = []
-            for b_ui in b_ui_list:
-                updates += b_ui.getOutputUpdate()
+            for b_ui, count in zip(b_ui_list, outputs_count):
+                if b_ui in b_ui_applied:
+                    updates += b_ui.getOutputUpdate()
+                else:
+                    updates += [gr.update()] * count
             return updates + B_Prompt_Map.buildPromptUpdate()
         self.gr_button.click(
-            fn = _apply
+            fn = B_Session.wrap(_apply, self.name)
             , inputs = inputs
             , outputs = outputs + [gr_prompt, gr_prompt_negative]
         )
+        B_UI_Map.addAction(self.gr_button, _applyAction, inputs, True, uids)
 
     def getGrForWebUI(self) -> list[typing.Any]:
         return [self.gr_button]
     
     def addMapping(self, name: str, args: dict[str, str]):
-        if name in self.mappings:
+        i = B_Symbols.intern(name)
+        if i in self.mappings:
             printWarning(type(self), f"{self.name} - addMapping()", f"Duplicate name -> '{name}'")
-        self.mappings[name] = args
+        self.mappings[i] = args
+    
+    def compile(self):
+        """Parse the mappings once into patches bound to their targets"""
+        self.plan = []
+        for k, args in self.mappings.items():
+            b_ui = B_UI_Map.getById(k)
+            if b_ui is None:
+                printWarning(type(self), f"{self.name} - compile()", f"Invalid name -> '{B_Symbols.name(k)}'")
+                continue
+            self.plan.append((b_ui, b_ui.compilePresetMapping(args)))
+        
+        self.plan_version = B_UI_Map._version
     
-    def apply(self):
-        if self.additive:
-            for k in self.mappings:
-                B_UI_Map._map[k].applyPresetMapping(self.mappings[k], True)
-        else:
-            for k in B_UI_Map._map:
-                if k in self.mappings:
-                    B_UI_Map._map[k].applyPresetMapping(self.mappings[k], False)
-                else:
-                    B_UI_Map._map[k].reset() #!
+    def apply(self) -> set[B_UI]:
+        """Returns the B_UIs changed"""
+        if self.plan is None or self.plan_version != B_UI_Map._version:
+            self.compile()
+        
+        b_ui_applied: set[B_UI] = set()
+        
+        if not self.additive:
+            b_ui_applied = B_UI_Map.resetChanged(self.mappings)
+        
+        for b_ui, patch in self.plan:
+            b_ui.applyPresetPatch(patch, self.additive)
+            b_ui_applied.add(b_ui)
+        
+        return b_ui_applied
 
 class B_UI_Separator(B_UI):
     #!
@@ -649,7 +458,7 @@ class B_UI_Prompt(B_UI):
     def __init__(self, name: str = "Prompt", b_prompt: B_Prompt = None):
         super().__init__(name)
 
-        self.b_prompt = b_prompt
+        self._b_prompt = b_prompt
 
         self.gr_container: typing.Any = None
 
@@ -674,10 +483,21 @@ class B_UI_Prompt(B_UI):
         self.outputs_override: list[typing.Any] = []
         self.fn_updates_override: typing.Callable[[], list] = None
     
+    @property
+    def b_prompt(self) -> B_Prompt | None:
+        """Prompt shown; per session for prompt UIs editing the choices of a dropdown or the prompts of a compact container"""
+        return B_Prompt_State.getView(self.uid, self._b_prompt)
+    
+    @b_prompt.setter
+    def b_prompt(self, b_prompt: B_Prompt | None):
+        if not B_Prompt_State.setView(self.uid, b_prompt):
+            self._b_prompt = b_prompt
+    
     def init(self) -> None:
         #! activate on prompt map
         if self.b_prompt is not None:
             B_Prompt_Map.update(self.b_prompt)
+            B_UI_Map.add(self)
 
     def build(self) -> None:
         meta, values, name, visible, enabled_button_remove = self.getUpdateValues()
@@ -746,7 +566,7 @@ class B_UI_Prompt(B_UI):
         
         #! register on ui map
         if self.b_prompt is not None:
-            B_UI_Map.add(self)
+            B_UI_Map.addBuilt(self)
     
     def bind(self, gr_prompt: typing.Any, gr_prompt_negative: typing.Any) -> None:
         def _fnBuildUpdates(remove: bool = False):
@@ -756,7 +576,7 @@ class B_UI_Prompt(B_UI):
             
             B_Prompt_Map.update(self.b_prompt, remove)
             return (
-                [gr_button_remove_update(interactive = not remove)] if self.fn_updates_override is None else self.fn_updates_override()
+                [B_Session.getUpdate(self.gr_button_remove, gr_button_remove_update, { "interactive": not remove })] if self.fn_updates_override is None else self.fn_updates_override()
             ) + B_Prompt_Map.buildPromptUpdate()
         
         outputs = (
@@ -767,7 +587,7 @@ class B_UI_Prompt(B_UI):
             self.update(inputValues)
             return _fnBuildUpdates()
         applyArgs = {
-            "fn": _fnApply
+            "fn": B_Session.wrap(_fnApply, self.name)
             , "inputs": self.getInput()
             , "outputs": outputs
         }
@@ -781,7 +601,7 @@ class B_UI_Prompt(B_UI):
         def _fnRemove():
             return _fnBuildUpdates(True)
         self.gr_button_remove.click(
-            fn = _fnRemove
+            fn = B_Session.wrap(_fnRemove, self.name)
             , outputs = outputs
         )
     
@@ -826,13 +646,15 @@ class B_UI_Prompt(B_UI):
         negative = bool(inputValues[offset])
         offset += 1
 
+        B_Session.setInputValues(self.getInput(), inputValues[:offset])
+
         if self.b_prompt is not None:
-            self.b_prompt.values.prompt.update(prompt)
-            self.b_prompt.values.emphasis.update(emphasis)
-            self.b_prompt.values.negative.update(negative)
-            self.b_prompt.values.prompt_negative.update(prompt_negative)
-            self.b_prompt.values.emphasis_negative.update(emphasis_negative)
-            self.b_prompt.values.edit.update(edit)
+            self.b_prompt.values.update("prompt", prompt)
+            self.b_prompt.values.update("emphasis", emphasis)
+            self.b_prompt.values.update("negative", negative)
+            self.b_prompt.values.update("prompt_negative", prompt_negative)
+            self.b_prompt.values.update("emphasis_negative", emphasis_negative)
+            self.b_prompt.values.update("edit", edit)
 
         return offset
     
@@ -866,8 +688,10 @@ class B_UI_Prompt(B_UI):
         gr_markdown_update = gr.Markdown
         gr_prompt_container_update = gr.Row
         gr_prompt_update = gr.Textbox
+        gr_emphasis_update = gr.Number
         gr_prompt_negative_container_update = gr.Row
         gr_prompt_negative_update = gr.Textbox
+        gr_emphasis_negative_update = gr.Number
         gr_slider_update = gr.Slider
         gr_negative_update = gr.Checkbox
         gr_button_remove_update = gr.Button
@@ -876,26 +700,32 @@ class B_UI_Prompt(B_UI):
             gr_markdown_update = self.gr_markdown.update
             gr_prompt_container_update = self.gr_prompt_container.update
             gr_prompt_update = self.gr_prompt.update
+            gr_emphasis_update = self.gr_emphasis.update
             gr_prompt_negative_container_update = self.gr_prompt_negative_container.update
             gr_prompt_negative_update = self.gr_prompt_negative.update
+            gr_emphasis_negative_update = self.gr_emphasis_negative.update
             gr_slider_update = self.gr_slider.update
             gr_negative_update = self.gr_negative.update
             gr_button_remove_update = self.gr_button_remove.update
         
         meta, values, name, visible, enabled_button_remove = self.getUpdateValues()
 
+        if not visible and B_Session._current.get() is not None:
+            # Contents of a hidden panel are brought up to date by the update that shows it again
+            return [B_Session.getUpdate(self.gr_container, gr_container_update, { "visible": visible })] + [gr.update() for _ in range(10)]
+
         return [
-            gr_container_update(visible = visible)
-            , gr_markdown_update(value = name, visible = meta.name_visible)
-            , gr_prompt_container_update(visible = meta.prompt_visible)
-            , gr_prompt_update(value = values.prompt.value, interactive = meta.prompt_enable)
-            , values.emphasis.value
-            , gr_prompt_negative_container_update(visible = meta.prompt_negative_visible)
-            , gr_prompt_negative_update(value = values.prompt_negative.value, interactive = meta.prompt_negative_enable)
-            , values.emphasis_negative.value
-            , gr_slider_update(visible = meta.prompt_edit_visible, value = values.edit.value, step = B_Prompt.Values.Defaults.edit_step)
-            , gr_negative_update(visible = meta.negative_visible, value = values.negative.value)
-            , gr_button_remove_update(interactive = enabled_button_remove)
+            B_Session.getUpdate(self.gr_container, gr_container_update, { "visible": visible })
+            , B_Session.getUpdate(self.gr_markdown, gr_markdown_update, { "value": name, "visible": meta.name_visible })
+            , B_Session.getUpdate(self.gr_prompt_container, gr_prompt_container_update, { "visible": meta.prompt_visible })
+            , B_Session.getUpdate(self.gr_prompt, gr_prompt_update, { "interactive": meta.prompt_enable }, { "value": values.prompt.value })
+            , B_Session.getUpdate(self.gr_emphasis, gr_emphasis_update, {}, { "value": values.emphasis.value })
+            , B_Session.getUpdate(self.gr_prompt_negative_container, gr_prompt_negative_container_update, { "visible": meta.prompt_negative_visible })
+            , B_Session.getUpdate(self.gr_prompt_negative, gr_prompt_negative_update, { "interactive": meta.prompt_negative_enable }, { "value": values.prompt_negative.value })
+            , B_Session.getUpdate(self.gr_emphasis_negative, gr_emphasis_negative_update, {}, { "value": values.emphasis_negative.value })
+            , B_Session.getUpdate(self.gr_slider, gr_slider_update, { "visible": meta.prompt_edit_visible, "step": B_Prompt.Values.Defaults.edit_step }, { "value": values.edit.value })
+            , B_Session.getUpdate(self.gr_negative, gr_negative_update, { "visible": meta.negative_visible }, { "value": values.negative.value })
+            , B_Session.getUpdate(self.gr_button_remove, gr_button_remove_update, { "interactive": enabled_button_remove })
         ]
     
     def getUpdateValues(self) -> tuple[B_Prompt.Meta, B_Prompt.Values, str, bool, bool]:
@@ -916,14 +746,160 @@ class B_UI_Prompt(B_UI):
                 , False
             )
     
-    def applyPresetMapping(self, args: dict[str, str], additive: bool):
+    def compilePresetMapping(self, args: dict[str, str]) -> typing.Any:
+        return B_Prompt.Values.compilePatch(args)
+    
+    def applyPresetPatch(self, patch: typing.Any, additive: bool) -> None:
         if self.b_prompt is None:
             return
-        self.b_prompt.values.updateFromArgs(args, not additive)
+        self.b_prompt.values.applyPatch(patch, not additive)
+    
+    def getPrompts(self) -> list[B_Prompt]:
+        return [self.b_prompt] if self.b_prompt is not None else []
+
+class B_UI_Prompt_Group(B_UI):
+    """Prompts of a compact container: toggle chips and one prompt UI shared by them, instead of a prompt UI each"""
+    #!
+    @staticmethod
+    def _fromArgs(args: dict[str, str], name: str = "Prompts"):
+        return B_UI_Prompt_Group(name)
+
+    def __init__(self, name: str = "Prompts", b_ui_prompts: list[B_UI_Prompt] = None):
+        super().__init__(name)
+
+        # Still registered by name (as preset targets), never built
+        self.b_ui_prompts = b_ui_prompts if b_ui_prompts is not None else []
+        self.b_prompt_map: dict[int, B_Prompt] = {} # By prompt id
+
+        self.gr_chips: typing.Any = None
+        self.gr_edit: typing.Any = None
+
+        self.b_prompt_ui = B_UI_Prompt(f"{self.name} (Prompt)")
+
+    def init(self) -> None:
+        for b_ui in self.b_ui_prompts:
+            b_ui.init()
+
+        for b_prompt in self.getPrompts():
+            self.b_prompt_map[b_prompt.id] = b_prompt
+
+        # Prompt UI
+        self.b_prompt_ui.init()
+
+    def build(self) -> None:
+        names = [b_prompt.name for b_prompt in self.getPrompts()]
+
+        self.gr_chips = gr.CheckboxGroup(
+            label = self.name
+            , choices = names
+            , value = self.getSelectedNames()
+        )
+        self.gr_edit = gr.Radio(
+            label = "Edit"
+            , choices = names
+            , value = None
+        )
+
+        # Prompt UI
+        self.b_prompt_ui.build()
+
+        #! register on map
+        B_UI_Map.addBuilt(self, self.b_ui_prompts)
+
+    def bind(self, gr_prompt: typing.Any, gr_prompt_negative: typing.Any) -> None:
+        # Self
+        # - Toggle
+        def _fnToggle(choices: list[str]):
+            B_Session.setInputValues([self.gr_chips], [choices])
+            selected_ids: set[int] = set(map(B_Symbols.get, choices))
+            for b_prompt in self.getPrompts():
+                B_Prompt_Map.update(b_prompt, b_prompt.id not in selected_ids)
+            return self.b_prompt_ui.getOutputUpdate() + B_Prompt_Map.buildPromptUpdate()
+        self.gr_chips.input(
+            fn = B_Session.wrap(_fnToggle, self.name)
+            , inputs = self.gr_chips
+            , outputs = self.b_prompt_ui.getOutput() + [gr_prompt, gr_prompt_negative]
+        )
+
+        # - Show prompt ui
+        def _fnEdit(choice: str | None):
+            B_Session.setInputValues([self.gr_edit], [choice])
+            self.b_prompt_ui.b_prompt = self.b_prompt_map.get(B_Symbols.get(choice)) if choice is not None else None
+            if self.b_prompt_ui.b_prompt is not None:
+                B_Prompt_Map.touch(self.b_prompt_ui.b_prompt)
+            return self.b_prompt_ui.getOutputUpdate()
+        self.gr_edit.input(
+            fn = B_Session.wrap(_fnEdit, self.name)
+            , inputs = self.gr_edit
+            , outputs = self.b_prompt_ui.getOutput()
+        )
+
+        # Prompt UI
+        self.b_prompt_ui.outputs_override = [self.gr_chips] + self.b_prompt_ui.getOutput()
+        def _fnUpdatesOverride():
+            return [self.getChipsUpdate()] + self.b_prompt_ui.getOutputUpdate()
+        self.b_prompt_ui.fn_updates_override = _fnUpdatesOverride
+
+        self.b_prompt_ui.bind(gr_prompt, gr_prompt_negative)
+
+    def getGrForWebUI(self) -> list[typing.Any]:
+        return [self.gr_chips, self.gr_edit] + self.b_prompt_ui.getGrForWebUI()
+
+    def reset(self, clear: bool = False) -> None:
+        for b_ui in self.b_ui_prompts:
+            b_ui.reset(clear)
+
+        self.b_prompt_ui.b_prompt = None
+
+    def update(self, inputValues: tuple) -> int:
+        return self.b_prompt_ui.update(inputValues)
+
+    def getInput(self) -> list[typing.Any]:
+        return self.b_prompt_ui.getInput()
+
+    def getOutput(self) -> list[typing.Any]:
+        return [self.gr_chips, self.gr_edit] + self.b_prompt_ui.getOutput()
+
+    def getOutputUpdate(self) -> list:
+        return [self.getChipsUpdate(), self.getEditUpdate()] + self.b_prompt_ui.getOutputUpdate()
+
+    def getChipsUpdate(self):
+        gr_chips_update = gr.CheckboxGroup
+        if is_gradio_3:
+            gr_chips_update = self.gr_chips.update
+
+        return B_Session.getUpdate(self.gr_chips, gr_chips_update, {}, { "value": self.getSelectedNames() })
+
+    def getEditUpdate(self):
+        gr_edit_update = gr.Radio
+        if is_gradio_3:
+            gr_edit_update = self.gr_edit.update
+
+        b_prompt = self.b_prompt_ui.b_prompt
+        return B_Session.getUpdate(self.gr_edit, gr_edit_update, {}, { "value": b_prompt.name if b_prompt is not None else None })
+
+    def getSelectedNames(self) -> list[str]:
+        return [b_prompt.name for b_prompt in self.getPrompts() if B_Prompt_Map.isSelected(b_prompt)]
+
+    def getChildren(self) -> list[B_UI]:
+        return self.b_ui_prompts
+    
+    def copyForRender(self) -> "B_UI_Prompt_Group":
+        b_ui = super().copyForRender()
+        b_ui.b_prompt_ui = self.b_prompt_ui.copyForRender()
+        return b_ui
+
+    def getPrompts(self) -> list[B_Prompt]:
+        b_prompts: list[B_Prompt] = []
+        for b_ui in self.b_ui_prompts:
+            b_prompts += b_ui.getPrompts()
+        return b_prompts
 
 class B_UI_Dropdown(B_UI):
     #_choice_empty: str = "-"
     _choice_random_count_max: int = 5
+    _choice_buttons_max: int = 32 # Selection cap (and buttons) of dropdowns offering more choices, without --max_choices
+    _choice_meta: dict[int, B_Prompt.Meta] = {} # Interned meta -> interned meta of a choice
 
     @staticmethod
     def _fromArgs(args: dict[str, str], name: str = "Dropdown"):
@@ -934,6 +910,9 @@ class B_UI_Dropdown(B_UI):
             , args.get(B_Prompt.Values.Keys.prefix, B_Prompt.Values.Defaults.prompt)
             , args.get(B_Prompt.Values.Keys.postfix, B_Prompt.Values.Defaults.prompt)
             , int(args.get("scale", 0))
+            , int(args.get("random_min", 0))
+            , int(args.get("random_max", B_UI_Dropdown._choice_random_count_max))
+            , max_choices = int(args.get("max_choices", 0))
         )
     
     @staticmethod
@@ -973,7 +952,10 @@ class B_UI_Dropdown(B_UI):
             , prefix = B_Prompt.Values.Defaults.prompt
             , postfix = B_Prompt.Values.Defaults.prompt
             , scale: int = 1
+            , random_min: int = 0
+            , random_max: int = _choice_random_count_max
             , b_prompts: list[B_Prompt] = None
+            , max_choices: int = 0
         ):
         super().__init__(name)
 
@@ -982,23 +964,60 @@ class B_UI_Dropdown(B_UI):
         self.prefix = prefix
         self.postfix = postfix
         self.scale = scale if scale > 0 else 1
+        self.random_min = max(0, random_min)
+        self.random_max = random_max
+        self.max_choices = max(0, max_choices)
 
         self.choice_list: list[B_Prompt] = []
+        self.choice_weights: dict[int, float] = {} # By prompt id
+        self.choice_sampler: B_Sampler = None
+        self.choice_span: tuple[int, B_Prompt, B_Prompt] = None # Layout version, first and last choice in the assembly order
         if b_prompts is not None:
             for b_prompt in b_prompts:
                 self.addChoice(b_prompt)
         
-        self.choice_map: dict[str, B_Prompt] = {}
-        self.choice_preset_map: dict[str, B_UI_Preset] = {}
+        self.choice_map: dict[int, B_Prompt] = {} # By prompt id
+        self.choice_preset_map: dict[int, B_UI_Preset] = {}
+
+        # Entries of a file (CHOICES --type FILE), selected by index and assembled in the place of the CHOICES line
+        self._choice_file: B_Choice_File = None
+        self.choice_file_path: str = None
+        self.choice_file_page_size: int = B_Choice_File.page_size
+        self.choice_file_lock = threading.Lock()
+        self.choice_entries: B_Prompt_Entries = None
+        self.choice_indexes: dict[str, int] = {} # Entry -> index, of the entries offered or looked up so far
+        self._choice_search: tuple[str, int] = ("", 1) # Query and page
         
         self.gr_dropdown: typing.Any = None
         self.gr_remove: typing.Any = None
+        self.gr_search: typing.Any = None
+        self.gr_page: typing.Any = None
 
+        # Buttons of the selected choices (in choice order), a fixed number rebound as the selection changes
         self.gr_buttons_container: typing.Any = None
         self.gr_buttons: list[typing.Any] = []
         
         self.b_prompt_ui = B_UI_Prompt(f"{self.name} (Prompt)")
     
+    @property
+    def choice_file(self) -> B_Choice_File:
+        """File of the choices as last read, kept by the layout dropdown for the copies rendered from it"""
+        return self.origin._choice_file
+    
+    @choice_file.setter
+    def choice_file(self, choice_file: B_Choice_File):
+        self.origin._choice_file = choice_file
+    
+    @property
+    def choice_search(self) -> tuple[str, int]:
+        """Search of the file entries shown, per session"""
+        return B_Prompt_State.getView(self.uid, self._choice_search)
+    
+    @choice_search.setter
+    def choice_search(self, choice_search: tuple[str, int]):
+        if not B_Prompt_State.setView(self.uid, choice_search):
+            self._choice_search = choice_search
+    
     def init(self) -> None:
         # Self
         # - sort choices
@@ -1007,37 +1026,58 @@ class B_UI_Dropdown(B_UI):
         
         # - build map
         for b_prompt in self.choice_list:
-            self.choice_map[b_prompt.name] = b_prompt
+            self.choice_map[b_prompt.id] = b_prompt
+        
+        # - cap the selection to the buttons built (one per selected choice)
+        if self.max_choices == 0 and (self.choice_file is not None or len(self.choice_list) > B_UI_Dropdown._choice_buttons_max):
+            self.max_choices = B_UI_Dropdown._choice_buttons_max
+            printWarning(type(self), self.name, f"Selection capped to {self.max_choices} choices -> set --max_choices to change it")
         
         # - apply default choices #!
         for k in self.b_prompts_applied_default:
-            b_prompt = self.choice_map[k]
+            b_prompt = self.getChoice(k)
+            if b_prompt is None:
+                printWarning(type(self), self.name, f"Default choice not found -> '{k}'")
+                continue
             b_prompt.values.updateFromArgs(self.b_prompts_applied_default[k])
             B_Prompt_Map.update(b_prompt)
         
         # Prompt UI
         self.b_prompt_ui.init()
+
+        #! register on map
+        B_UI_Map.add(self)
     
     def build(self) -> None:
         with gr.Column(scale = self.scale):
             # Self
+            if self.choice_file is not None:
+                with gr.Row():
+                    self.gr_search = gr.Textbox(
+                        label = f"Search {self.name} ({len(self.choice_file)} entries)"
+                        , max_lines = 1
+                    )
+                    self.gr_page = gr.Number(label = self.getChoicePageLabel(), value = 1, precision = 0, minimum = 1)
+            
             self.gr_dropdown = gr.Dropdown(
                 label = self.name
-                , choices = list(map(lambda b_prompt: b_prompt.name, self.choice_list))
+                , choices = self.getChoiceNames()
                 , multiselect = True
                 , value = list(self.b_prompts_applied_default.keys())
                 , allow_custom_value = False
+                , **({ "max_choices": self.max_choices } if self.max_choices > 0 else {})
             )
             
             self.gr_buttons_container = gr.Row(variant = "panel", visible = self.initButtonContainerVisible())
             with self.gr_buttons_container:
-                for b_prompt in self.choice_list:
+                b_prompts_selected = self.getButtonChoices()
+                for i in range(self.getButtonCount()):
                     self.gr_buttons.append(
                         gr.Button(
-                            value = b_prompt.name
+                            value = b_prompts_selected[i].name if i < len(b_prompts_selected) else ""
                             , variant = "primary"
                             , size = "sm"
-                            , visible = B_Prompt_Map.isSelected(b_prompt)
+                            , visible = i < len(b_prompts_selected)
                         )
                     )
 
@@ -1045,31 +1085,39 @@ class B_UI_Dropdown(B_UI):
             self.b_prompt_ui.build()
 
         #! register on map
-        B_UI_Map.add(self)
+        B_UI_Map.addBuilt(self)
     
     def bind(self, gr_prompt: typing.Any, gr_prompt_negative: typing.Any) -> None:
         # Self
-        b_ui_names_presets: set[str] = set()
+        b_ui_presets: dict[B_UI, None] = {}
         for b_ui_preset in self.choice_preset_map.values():
             for k in b_ui_preset.mappings:
-                b_ui_names_presets.add(k)
+                b_ui = B_UI_Map.getBuilt(k)
+                if b_ui is not None:
+                    b_ui_presets[b_ui] = None
         
         inputs_presets: list[typing.Any] = []
         outputs_presets: list = []
-        for k in b_ui_names_presets:
-            inputs_presets += B_UI_Map._map[k].getInput()
-            outputs_presets += B_UI_Map._map[k].getOutput()
+        for b_ui in b_ui_presets:
+            inputs_presets += b_ui.getInput()
+            outputs_presets += b_ui.getOutput()
         
         def _updateSelections(choices: str | list[str], *input_values_presets):
             selected_choices: list[str] = choices if issubclass(type(choices), list) else [choices]
+            selected_ids: set[int] = set(map(B_Symbols.get, selected_choices))
+            B_Session.setInputValues([self.gr_dropdown], [choices])
             for b_prompt in self.choice_list:
-                B_Prompt_Map.update(b_prompt, b_prompt.name not in selected_choices)
+                B_Prompt_Map.update(b_prompt, b_prompt.id not in selected_ids)
+            if self.choice_entries is not None:
+                self.choice_entries.setSelected(
+                    i for i in (self.getChoiceIndex(choice) for choice in selected_choices if B_Symbols.get(choice) not in self.choice_map) if i >= 0
+                )
 
             offset_presets: int = 0
-            for k in b_ui_names_presets:
-                offset_presets += B_UI_Map._map[k].update(input_values_presets[offset_presets:])
+            for b_ui in b_ui_presets:
+                offset_presets += b_ui.update(input_values_presets[offset_presets:])
             
-            for k in selected_choices:
+            for k in selected_ids:
                 preset = self.choice_preset_map.get(k)
                 if preset is not None:
                     preset.apply()
@@ -1078,28 +1126,46 @@ class B_UI_Dropdown(B_UI):
                 self.b_prompt_ui.b_prompt = None
             
             updates: list = [self.getPromptButtonContainerUpdate()] + self.getPromptButtonUpdates() + self.b_prompt_ui.getOutputUpdate()
-            for k in b_ui_names_presets:
-                updates += B_UI_Map._map[k].getOutputUpdate()
+            for b_ui in b_ui_presets:
+                updates += b_ui.getOutputUpdate()
             updates += B_Prompt_Map.buildPromptUpdate()
             return updates
         self.gr_dropdown.input(
-            fn = _updateSelections
+            fn = B_Session.wrap(_updateSelections, self.name)
             , inputs = [self.gr_dropdown] + inputs_presets
             , outputs = [self.gr_buttons_container] + self.gr_buttons + self.b_prompt_ui.getOutput() + outputs_presets + [gr_prompt, gr_prompt_negative]
         )
 
+        # - Search file entries (a new query starts on its first page)
+        if self.choice_file is not None:
+            def _fnSearch(query: str, page: int):
+                B_Session.setInputValues([self.gr_search, self.gr_page], [query, page])
+                query_prior, page_prior = self.choice_search
+                self.choice_search = query, (int(page) if page is not None else page_prior) if query == query_prior else 1
+                self.choice_search = query, self.getChoicePage()[1]
+                return [self.getChoicesUpdate(), self.getChoicePageUpdate()]
+            for gr_trigger in (self.gr_search, self.gr_page):
+                gr_trigger.input(
+                    fn = B_Session.wrap(_fnSearch, self.name)
+                    , inputs = [self.gr_search, self.gr_page]
+                    , outputs = [self.gr_dropdown, self.gr_page]
+                )
+
         # - Show/hide prompt ui
         if len(self.gr_buttons) > 0:
             outputs_prompt_ui = self.b_prompt_ui.getOutput()
             def _fnSelect(k: str):
-                if self.b_prompt_ui.b_prompt is not None and self.b_prompt_ui.b_prompt.name == k:
+                i = B_Symbols.get(k)
+                if self.b_prompt_ui.b_prompt is not None and self.b_prompt_ui.b_prompt.id == i:
                     self.b_prompt_ui.b_prompt = None
                 else:
-                    self.b_prompt_ui.b_prompt = self.choice_map.get(k)
+                    self.b_prompt_ui.b_prompt = self.getChoice(k)
+                    if self.b_prompt_ui.b_prompt is not None:
+                        B_Prompt_Map.touch(self.b_prompt_ui.b_prompt)
                 return self.b_prompt_ui.getOutputUpdate()
             for gr_button in self.gr_buttons:
                 gr_button.click(
-                    fn = _fnSelect
+                    fn = B_Session.wrap(_fnSelect, self.name)
                     , inputs = gr_button
                     , outputs = outputs_prompt_ui
                 )
@@ -1108,7 +1174,7 @@ class B_UI_Dropdown(B_UI):
         self.b_prompt_ui.outputs_override = [self.gr_dropdown, self.gr_buttons_container] + self.gr_buttons + self.b_prompt_ui.getOutput()
         def _fnUpdatesOverride():
             self.b_prompt_ui.b_prompt = None #!
-            return [self.initChoicesSelected(), self.getPromptButtonContainerUpdate()] + self.getPromptButtonUpdates() + self.b_prompt_ui.getOutputUpdate()
+            return [self.getChoicesUpdate(), self.getPromptButtonContainerUpdate()] + self.getPromptButtonUpdates() + self.b_prompt_ui.getOutputUpdate()
         self.b_prompt_ui.fn_updates_override = _fnUpdatesOverride
 
         self.b_prompt_ui.bind(gr_prompt, gr_prompt_negative)
@@ -1117,7 +1183,16 @@ class B_UI_Dropdown(B_UI):
         return [self.gr_dropdown] + self.gr_buttons + self.b_prompt_ui.getGrForWebUI()
     
     def reset(self, clear: bool = False) -> None:
-        for b_prompt in self.choice_list:
+        b_prompts = self.choice_list
+        if self.choice_entries is not None:
+            # Every entry of the file made a prompt (its values may have changed), those by default included
+            self.choice_entries.setSelected(())
+            if not clear:
+                for k in self.b_prompts_applied_default:
+                    self.getChoice(k)
+            b_prompts = b_prompts + list(self.choice_entries.entries.values())
+        
+        for b_prompt in b_prompts:
             if not clear:
                 b_prompt.reset()
                 b_prompt_args = self.b_prompts_applied_default.get(b_prompt.name)
@@ -1133,23 +1208,57 @@ class B_UI_Dropdown(B_UI):
     def update(self, inputValues: tuple) -> int:
         return self.b_prompt_ui.update(inputValues)
     
-    def randomize(self) -> None:
-        if len(self.choice_list) > 0:
-            choices: list[str] = list(self.choice_map.keys())
-            choices_selected: list[str] = []
-            
-            c_max = len(choices)
-            if self._choice_random_count_max > 0 and self._choice_random_count_max < c_max:
-                c_max = self._choice_random_count_max
-            
-            r = random.randint(0, c_max)
-            if r > 0:
-                for c in range(r):
-                    i = random.randint(0, len(choices) - 1)
-                    choices_selected.append(choices.pop(i))
-            
-            for b_prompt in self.choice_map.values():
-                B_Prompt_Map.update(b_prompt, b_prompt.name not in choices_selected)
+    def randomize(self, rng: random.Random = None) -> None:
+        if len(self.choice_list) == 0 and (self.choice_file is None or len(self.getChoiceFile()) == 0):
+            return
+        
+        if rng is None:
+            rng = random.Random()
+        
+        if self.choice_file is not None:
+            self.randomizeFile(rng)
+            return
+        
+        if self.choice_sampler is None:
+            self.choice_sampler = B_Sampler([self.choice_weights.get(b_prompt.id, 1) for b_prompt in self.choice_list])
+        
+        c_max = len(self.choice_sampler)
+        if self.random_max > 0 and self.random_max < c_max:
+            c_max = self.random_max
+        if self.max_choices > 0 and self.max_choices < c_max:
+            c_max = self.max_choices
+        c_min = min(self.random_min, c_max)
+        
+        # Only the choices drawn and those selected before are visited
+        choices_drawn = [self.choice_list[i] for i in self.choice_sampler.sampleDistinct(rng, rng.randint(c_min, c_max))]
+        ids_drawn = set(b_prompt.id for b_prompt in choices_drawn)
+        for b_prompt in self.getChoicesSelected():
+            if b_prompt.id not in ids_drawn:
+                B_Prompt_Map.update(b_prompt, True)
+        for b_prompt in choices_drawn:
+            if not B_Prompt_Map.isSelected(b_prompt):
+                B_Prompt_Map.update(b_prompt)
+    
+    def randomizeFile(self, rng: random.Random) -> None:
+        """Uniform over the choices of the layout and the entries of the file (weights don't apply), entries are drawn by index"""
+        count_list = len(self.choice_list)
+        count = count_list + len(self.getChoiceFile())
+        c_max = count
+        if self.random_max > 0 and self.random_max < c_max:
+            c_max = self.random_max
+        if self.max_choices > 0 and self.max_choices < c_max:
+            c_max = self.max_choices
+        c_min = min(self.random_min, c_max)
+        
+        drawn = rng.sample(range(count), rng.randint(c_min, c_max))
+        
+        selected_ids: set[int] = set(self.choice_list[i].id for i in drawn if i < count_list)
+        for b_prompt in self.choice_list:
+            selected = b_prompt.id in selected_ids
+            if selected != B_Prompt_Map.isSelected(b_prompt):
+                B_Prompt_Map.update(b_prompt, not selected)
+        
+        self.choice_entries.setSelected(i - count_list for i in drawn if i >= count_list)
     
     def getInput(self) -> list[typing.Any]:
         return self.b_prompt_ui.getInput()
@@ -1158,55 +1267,97 @@ class B_UI_Dropdown(B_UI):
         return [self.gr_dropdown, self.gr_buttons_container] + self.gr_buttons + self.b_prompt_ui.getOutput()
     
     def getOutputUpdate(self) -> list:
-        return [self.initChoicesSelected(), self.getPromptButtonContainerUpdate()] + self.getPromptButtonUpdates() + self.b_prompt_ui.getOutputUpdate()
+        return [self.getChoicesUpdate(), self.getPromptButtonContainerUpdate()] + self.getPromptButtonUpdates() + self.b_prompt_ui.getOutputUpdate()
+    
+    def getChoicesUpdate(self):
+        gr_dropdown_update = gr.Dropdown
+        if is_gradio_3:
+            gr_dropdown_update = self.gr_dropdown.update
+        
+        props = { "choices": self.getChoiceNames() } if self.choice_file is not None else {}
+        return B_Session.getUpdate(self.gr_dropdown, gr_dropdown_update, props, { "value": self.initChoicesSelected() })
+    
+    def getChoicePageUpdate(self):
+        gr_page_update = gr.Number
+        if is_gradio_3:
+            gr_page_update = self.gr_page.update
+        
+        _, page, pages = self.getChoicePage()
+        return B_Session.getUpdate(self.gr_page, gr_page_update, { "label": self.getChoicePageLabel(pages) }, { "value": page })
     
     def getPromptButtonContainerUpdate(self):
         gr_buttons_container_update = gr.Row
         if is_gradio_3:
             gr_buttons_container_update = self.gr_buttons_container.update
         
-        return gr_buttons_container_update(visible = self.initButtonContainerVisible())
+        return B_Session.getUpdate(self.gr_buttons_container, gr_buttons_container_update, { "visible": self.initButtonContainerVisible() })
     
     def getPromptButtonUpdates(self) -> list:
+        """Each button shows the selected choice of its index, a hidden one keeps its last value"""
         updates = []
-        i: int = 0
-        for b_prompt in self.choice_list:
+        b_prompts_selected = self.getButtonChoices()
+        for i, gr_button in enumerate(self.gr_buttons):
             gr_button_update = gr.Button
             if is_gradio_3:
-                gr_button_update = self.gr_buttons[i].update
+                gr_button_update = gr_button.update
             
-            updates.append(gr_button_update(visible = B_Prompt_Map.isSelected(b_prompt)))
-            i += 1
+            props = { "value": b_prompts_selected[i].name, "visible": True } if i < len(b_prompts_selected) else { "visible": False }
+            updates.append(B_Session.getUpdate(gr_button, gr_button_update, props))
         return updates
     
+    def getButtonCount(self) -> int:
+        """As many as choices can be selected (see init)"""
+        if self.max_choices > 0:
+            return self.max_choices
+        return len(self.choice_list)
+    
+    def getButtonChoices(self) -> list[B_Prompt]:
+        b_prompts_selected: list[B_Prompt] = []
+        for b_prompt in self.getChoices():
+            if B_Prompt_Map.isSelected(b_prompt):
+                b_prompts_selected.append(b_prompt)
+                if len(b_prompts_selected) >= self.getButtonCount():
+                    break
+        return b_prompts_selected
+    
     def initChoicesSelected(self):
         choices_selected: list[str] = []
-        for b_prompt in self.choice_list:
+        for b_prompt in self.getChoices():
             if B_Prompt_Map.isSelected(b_prompt):
                 choices_selected.append(b_prompt.name)
         return choices_selected
     
     def initButtonContainerVisible(self):
-        return any(map(lambda b_prompt: B_Prompt_Map.isSelected(b_prompt), self.choice_list)) #! optimize?
+        return any(map(lambda b_prompt: B_Prompt_Map.isSelected(b_prompt), self.getChoices())) #! optimize?
     
-    def addChoice(self, item: B_Prompt):
-        if len(item.values.prefix.value) == 0:
-            item.values.prefix.reinit(self.prefix)
-        if len(item.values.postfix.value) == 0:
-            item.values.postfix.reinit(self.postfix)
-        
-        item.meta.name_visible = False
-        item.meta.prompt_enable = True
-        item.meta.prompt_negative_enable = True
-        
+    def addChoice(self, item: B_Prompt, weight: float = 1):
+        self.initChoice(item, weight)
         self.choice_list.append(item)
     
+    def initChoice(self, item: B_Prompt, weight: float = 1):
+        if weight != 1:
+            self.choice_weights[item.id] = max(0, weight)
+        
+        if len(item.values.prefix.value) == 0 and len(self.prefix) > 0:
+            item.values.stored("prefix").reinit(self.prefix)
+        if len(item.values.postfix.value) == 0 and len(self.postfix) > 0:
+            item.values.stored("postfix").reinit(self.postfix)
+        
+        meta = B_UI_Dropdown._choice_meta.get(id(item.meta))
+        if meta is None:
+            meta = copy.copy(item.meta)
+            meta.name_visible = False
+            meta.prompt_enable = True
+            meta.prompt_negative_enable = True
+            meta = B_UI_Dropdown._choice_meta[id(item.meta)] = meta.interned()
+        item.meta = meta
+    
     def addChoicePresetMapping(self, target_name: str, target_args: dict[str, str]):
         b_prompt = self.choice_list[-1]
-        preset = self.choice_preset_map.get(b_prompt.name, None)
+        preset = self.choice_preset_map.get(b_prompt.id, None)
         if preset is None:
             preset = B_UI_Preset(f"{self.name}_{b_prompt.name} (PRESET)", True)
-            self.choice_preset_map[b_prompt.name] = preset
+            self.choice_preset_map[b_prompt.id] = preset
         preset.addMapping(target_name, target_args)
     
     def addChoices(self, args: dict[str, str]):
@@ -1217,65 +1368,308 @@ class B_UI_Dropdown(B_UI):
             case "COLOR":
                 postfix = args.get(B_Prompt.Values.Keys.postfix, "")
                 b_prompt_list = self._buildColorChoicesList(postfix)
+            case "FILE":
+                if self.choice_file is not None:
+                    printWarning(type(self), self.name, "Only one CHOICES --type FILE per SELECT")
+                    return
+                path = args.get("path", "")
+                if len(path) == 0:
+                    printWarning(type(self), self.name, "No CHOICES file path specified")
+                    return
+                
+                # Relative to the folder of the layout
+                self.choice_file_path = os.path.join(b_path_base, b_folder_name_scripts, b_folder_name_script_config, path)
+                self.choice_file = B_Choice_File.get(self.choice_file_path)
+                self.choice_file_page_size = int(args.get("page_size", B_Choice_File.page_size))
+                if self.choice_file is not None:
+                    self.choice_entries = B_Prompt_Entries(f"{self.name} (File)", lambda i: self.choice_file.getEntry(i), self.prefix, self.postfix)
+                    self.choice_entries.fn_init = self.initChoice
             case "":
                 printWarning(type(self), self.name, f"No CHOICES type specified")
             case _:
                 printWarning(type(self), self.name, f"Invalid CHOICES type -> '{special_type}'")
         
         if b_prompt_list is not None:
+            weight = float(args.get("w", 1))
             for b_prompt in b_prompt_list:
-                self.addChoice(b_prompt)
+                self.addChoice(b_prompt, weight)
+    
+    def getChoice(self, name: str) -> B_Prompt | None:
+        """Choice by name; an entry of the file is made a prompt (to be shown or edited, it isn't ordered) the first time"""
+        b_prompt = self.choice_map.get(B_Symbols.get(name))
+        if b_prompt is not None or self.choice_entries is None:
+            return b_prompt
+        
+        i = self.getChoiceIndex(name)
+        return self.choice_entries.getEntry(i) if i >= 0 else None
+    
+    def getChoiceIndex(self, name: str) -> int:
+        """Index of an entry of the file, -1 if not in it; the file is only searched for entries not offered yet"""
+        self.getChoiceFile()
+        i = self.choice_indexes.get(name)
+        if i is None:
+            i = self.choice_file.find(name)
+            if i < 0:
+                return -1
+            self.choice_indexes[name] = i
+        
+        if B_Prompt_Map.get(name) is not None:
+            printWarning(type(self), self.name, f"File entry is the name of another prompt -> '{name}'")
+            return -1
+        return i
+    
+    def getChoicesSelected(self) -> list[B_Prompt]:
+        """Choices of the layout selected, looked up among the selected prompts they span in the assembly order"""
+        if self.choice_span is None or self.choice_span[0] != B_Prompt_Map._layout_version:
+            b_prompts_ordered = sorted((b_prompt for b_prompt in self.choice_list if B_Prompt_Map._order[b_prompt.id] >= 0), key = lambda b_prompt: B_Prompt_Map._order[b_prompt.id])
+            self.choice_span = B_Prompt_Map._layout_version, b_prompts_ordered[0] if len(b_prompts_ordered) > 0 else None, b_prompts_ordered[-1] if len(b_prompts_ordered) > 0 else None
+        
+        _, b_prompt_first, b_prompt_last = self.choice_span
+        if b_prompt_first is None:
+            return []
+        return [b_prompt for b_prompt in B_Prompt_Map.getSelectionBetween(b_prompt_first, b_prompt_last) if self.choice_map.get(b_prompt.id) is b_prompt]
+    
+    def getChoiceFile(self) -> B_Choice_File:
+        """The file of the choices as it is now (read again if it changed since, dropping the entries selected by index), the last one read if it can't be"""
+        choice_file = B_Choice_File.get(self.choice_file_path)
+        if choice_file is not None and choice_file is not self.choice_file:
+            with self.choice_file_lock:
+                if choice_file is not self.choice_file:
+                    self.choice_file = choice_file
+                    self.choice_indexes.clear()
+                    self.choice_entries.reload()
+        return self.choice_file
+    
+    def getChoices(self) -> list[B_Prompt]:
+        """Choices of the layout, then the entries of the file selected"""
+        if self.choice_entries is None:
+            return self.choice_list
+        return self.choice_list + [self.choice_entries.getEntry(i) for i in self.choice_entries.getSelected()]
+    
+    def getChoicePage(self) -> tuple[list[str], int, int]:
+        query, page = self.choice_search
+        choice_file = self.getChoiceFile()
+        indexes, page, pages = choice_file.getPageIndexes(query, page, self.choice_file_page_size)
+        entries: list[str] = []
+        for i in indexes:
+            entry = choice_file.getEntry(i)
+            self.choice_indexes[entry] = i
+            entries.append(entry)
+        return entries, page, pages
+    
+    def getChoicePageLabel(self, pages: int = None) -> str:
+        if pages is None:
+            pages = self.getChoicePage()[2]
+        return f"Page (of {pages})"
+    
+    def getChoiceNames(self) -> list[str]:
+        """Choices offered: those of the layout, then the entries of the file selected and those of the search page"""
+        names = [b_prompt.name for b_prompt in self.choice_list]
+        if self.choice_file is None:
+            return names
+        
+        entries = self.getChoicePage()[0]
+        for i in self.choice_entries.getSelected():
+            entry = self.choice_file.getEntry(i)
+            self.choice_indexes[entry] = i
+            names.append(entry)
+        names += entries
+        return list(dict.fromkeys(names))
     
     #!!!
-    def applyPresetMapping(self, args: dict[str, str], additive: bool):
+    def compilePresetMapping(self, args: dict[str, str]) -> typing.Any:
         valueMap = B_UI_Dropdown._fromArgsValue(args)
-        for b_prompt in self.choice_list:
+        b_prompts = self.choice_list
+        if self.choice_entries is not None:
+            b_prompts = b_prompts + [b_prompt for b_prompt in map(self.getChoice, valueMap) if isinstance(b_prompt, B_Prompt_Entry)]
+        patch: list[tuple[B_Prompt, bool, tuple | None]] = []
+        for b_prompt in b_prompts:
             b_prompt_value_args = valueMap.get(b_prompt.name)
-            if b_prompt_value_args is not None:
-                b_prompt.values.updateFromArgs(b_prompt_value_args, not additive)
-            B_Prompt_Map.update(b_prompt, b_prompt_value_args is None)
+            patch.append((
+                b_prompt
+                , b_prompt_value_args is not None
+                , B_Prompt.Values.compilePatch(b_prompt_value_args) if b_prompt_value_args is not None else None
+            ))
+        return patch
+    
+    def applyPresetPatch(self, patch: typing.Any, additive: bool) -> None:
+        for b_prompt, selected, b_prompt_patch in patch:
+            b_prompt.values.applyPatch(b_prompt_patch, not additive)
+            B_Prompt_Map.update(b_prompt, not selected)
+        
+        # Only the entries of the file it names
+        if self.choice_entries is not None:
+            self.choice_entries.setSelected(b_prompt.index for b_prompt, selected, _ in patch if selected and isinstance(b_prompt, B_Prompt_Entry))
+    
+    def getPrompts(self) -> list[B_Prompt]:
+        return self.choice_list + [self.choice_entries] if self.choice_entries is not None else list(self.choice_list)
+    
+    def copyForRender(self) -> "B_UI_Dropdown":
+        b_ui = super().copyForRender()
+        b_ui.gr_buttons = []
+        b_ui.b_prompt_ui = self.b_prompt_ui.copyForRender()
+        return b_ui
 
 class B_UI_Container(B_UI, ABC):
-    def __init__(self, name: str, build_button_reset: bool = False, build_button_random: bool = False, children: list[B_UI] = None):
+    _renders: dict[int, tuple[int, int, range]] = {} # As B_Session.renders, without a session
+    _gr_random_seed: typing.Any = None # Seed of the randomize buttons (set by B_UI_Master)
+    _lazy_warned = False
+
+    @staticmethod
+    def initDeferredChildren(b_ui_list: list[B_UI], reloadable: bool = False) -> None:
+        is_first = True
+        for b_ui in b_ui_list:
+            if isinstance(b_ui, B_UI_Container):
+                b_ui.initDeferred(is_first, reloadable)
+                is_first = False
+    
+    @staticmethod
+    def canDefer() -> bool:
+        return hasattr(gr, "render")
+    
+    @staticmethod
+    def getRenders() -> dict[int, tuple[int, int, range]]:
+        session = B_Session._current.get()
+        return session.renders if session is not None else B_UI_Container._renders
+    
+    def initLazy(self) -> bool:
+        """Whether the content may be built on first open, warned once where it can't (Gradio 3)"""
+        if self.lazy == 0:
+            return False
+        if B_UI_Container.canDefer():
+            return True
+        if not B_UI_Container._lazy_warned:
+            B_UI_Container._lazy_warned = True
+            printWarning(type(self), self.name, "Lazy containers require gr.render (Gradio 4) -> built on startup")
+        return False
+    
+    def __init__(self, name: str, build_button_reset: bool = False, build_button_random: bool = False, children: list[B_UI] = None, lazy: int = 0, compact: bool = False):
         super().__init__(name)
 
         self.build_button_reset = build_button_reset
         self.build_button_random = build_button_random
+        self.lazy = lazy
+        self.compact = compact
 
         self.children = children if children is not None else []
 
+        self.deferred = False
+        self.gr_prompt_targets: tuple[typing.Any, typing.Any] = None
+        self.version: int = 0
+
         self.gr_container: typing.Any = None
+        self.gr_deferred: typing.Any = None
         self.gr_reset: typing.Any = None
         self.gr_random: typing.Any = None
     
     def init(self) -> None:
+        if self.compact:
+            self.initCompact()
+        
+        B_UI_Container.initDeferredChildren(self.children)
         for b_ui in self.children:
             b_ui.init()
     
+    def initCompact(self) -> None:
+        """Group the prompt UIs among the children into one B_UI_Prompt_Group, placed where the first of them was"""
+        b_ui_prompts = [b_ui for b_ui in self.children if type(b_ui) is B_UI_Prompt]
+        if len(b_ui_prompts) == 0:
+            return
+        
+        i = self.children.index(b_ui_prompts[0])
+        self.children = [b_ui for b_ui in self.children if type(b_ui) is not B_UI_Prompt]
+        self.children.insert(i, B_UI_Prompt_Group(f"{self.name} (Prompts)", b_ui_prompts))
+    
+    def initDeferred(self, is_first: bool, reloadable: bool = False) -> None:
+        """Decide whether the content is built on startup or, for lazy containers, on first open (requires gr.render)"""
+        self.deferred = False
+    
+    def initReloadable(self, is_first: bool) -> bool:
+        """With hot_reload, always render the content so it can be rebuilt in place (prewarmed unless lazy)"""
+        if not hot_reload or not B_UI_Container.canDefer():
+            return False
+        
+        self.deferred = True
+        if self.lazy == 0 or is_first:
+            self.lazy = 2
+        return True
+    
+    def adopt(self, b_ui_container: "B_UI_Container") -> None:
+        """Take over the content of a re-parsed copy of this container, rendered again on the next version change"""
+        self.children = b_ui_container.children
+        self.build_button_reset = b_ui_container.build_button_reset
+        self.build_button_random = b_ui_container.build_button_random
+        self.compact = b_ui_container.compact
+        self.version += 1
+    
     def build(self) -> None:
         self.gr_container = self.buildContainer()
         with self.gr_container:
-            for b_ui in self.children:
-                b_ui.build()
+            if not self.deferred:
+                self.buildContent()
+                return
+            
+            # Content is rendered per session once the container is first opened (or prewarmed after page load),
+            # and again whenever gr_deferred is bumped (as an output of events of the layout around it changing what it shows);
+            # events acting on all built B_UIs are wired to each render instead (see B_UI_Map.addAction)
+            self.gr_deferred = gr.Number(value = 0, visible = False)
+            B_UI_Map.addBuiltDeferred(self, self.getDescendants())
+            triggers = [self.getOpenEvent()]
+            if self.lazy > 1:
+                from gradio.context import Context
+                triggers.append(Context.root_block.load)
+            def _open():
+                return self.getRenderUpdate() if not self.isRendered() else gr.update()
+            gr.on(
+                triggers = triggers
+                , fn = B_Session.wrap(_open, self.name)
+                , outputs = self.gr_deferred
+            )
             
-            if self.build_button_reset or self.build_button_random:
-                def _buildReset():
-                    self.gr_reset = gr.Button(f"Reset {self.name}")
-                def _buildRandomize():
-                    self.gr_random = gr.Button(f"Randomize {self.name}")
+            @gr.render(triggers = [self.gr_deferred.change])
+            def _render():
+                from gradio.context import Context, LocalContext
+                request = LocalContext.request.get() if hasattr(LocalContext, "request") else None
+                with B_Session.use(request.session_hash if request is not None else None) as session:
+                    with session.lock if session is not None else contextlib.nullcontext():
+                        # Built into a copy of its own, the components of a session never land on the layout shared by all
+                        b_ui_render = self.copyForRender()
+                        gr_id_first = Context.id
+                        b_ui_render.buildContent()
+                        if self.gr_prompt_targets is not None:
+                            b_ui_render.bindContent(*self.gr_prompt_targets)
+                            b_ui_render.bindActions(*self.gr_prompt_targets)
+                        self.setRendered(b_ui_render, range(gr_id_first, Context.id))
+    
+    def buildContent(self) -> None:
+        for b_ui in self.children:
+            b_ui.build()
+        
+        if self.build_button_reset or self.build_button_random:
+            def _buildReset():
+                self.gr_reset = gr.Button(f"Reset {self.name}")
+            def _buildRandomize():
+                self.gr_random = gr.Button(f"Randomize {self.name}")
 
-                B_UI_Separator._build()
-                
-                if self.build_button_reset and self.build_button_random:
-                    with gr.Row():
-                        _buildRandomize()
-                        _buildReset()
-                elif self.build_button_random:
+            B_UI_Separator._build()
+            
+            if self.build_button_reset and self.build_button_random:
+                with gr.Row():
                     _buildRandomize()
-                else:
-                    _buildReset()  
+                    _buildReset()
+            elif self.build_button_random:
+                _buildRandomize()
+            else:
+                _buildReset()  
     
     def bind(self, gr_prompt: typing.Any, gr_prompt_negative: typing.Any) -> None:
+        if self.deferred:
+            self.gr_prompt_targets = gr_prompt, gr_prompt_negative
+            return
+        
+        self.bindContent(gr_prompt, gr_prompt_negative)
+    
+    def bindContent(self, gr_prompt: typing.Any, gr_prompt_negative: typing.Any) -> None:
         # Children
         for b_ui in self.children:
             b_ui.bind(gr_prompt, gr_prompt_negative)
@@ -1283,30 +1677,64 @@ class B_UI_Container(B_UI, ABC):
         # Self
         # - Reset
         if self.build_button_reset:
-            def _reset():
+            inputs_reset = self.getContentInput()
+            def _reset(*inputValues):
+                B_Session.setInputValues(inputs_reset, inputValues)
                 for b_ui in self.children:
                     b_ui.reset()
                 
-                return B_Prompt_Map.buildPromptUpdate() + self.getOutputUpdate()
+                return B_Prompt_Map.buildPromptUpdate() + self.getContentOutputUpdate()
             self.gr_reset.click(
-                fn = _reset
-                , outputs = [gr_prompt, gr_prompt_negative] + self.getOutput()
+                fn = B_Session.wrap(_reset, self.name)
+                , inputs = inputs_reset
+                , outputs = [gr_prompt, gr_prompt_negative] + self.getContentOutput()
             )
         
         # - Randomize
         if self.build_button_random:
+            inputs_random = self.getContentInput()
+            gr_random_seed = B_UI_Container._gr_random_seed
             def _randomize(*currentValues):
-                self.updateRandom(currentValues)
-                return B_Prompt_Map.buildPromptUpdate() + self.getOutputUpdate()
+                seed = None
+                if gr_random_seed is not None:
+                    *currentValues, seed = currentValues
+                self.updateContent(currentValues)
+                self.randomize(random.Random(int(seed) if seed is not None and seed >= 0 else None))
+                return B_Prompt_Map.buildPromptUpdate() + self.getContentOutputUpdate()
             self.gr_random.click(
-                fn = _randomize
-                , inputs = self.getInput()
-                , outputs = [gr_prompt, gr_prompt_negative] + self.getOutput()
+                fn = B_Session.wrap(_randomize, self.name)
+                , inputs = inputs_random + ([gr_random_seed] if gr_random_seed is not None else [])
+                , outputs = [gr_prompt, gr_prompt_negative] + self.getContentOutput()
             )
     
+    def bindActions(self, gr_prompt: typing.Any, gr_prompt_negative: typing.Any) -> None:
+        """Wire the events acting on all built B_UIs (global buttons, presets) to this render of the content too, reading its inputs and updating it in place"""
+        for gr_trigger, fn_action, inputs, consume, uids in B_UI_Map._actions:
+            if uids is None or self.uid in uids:
+                self.bindAction(gr_trigger, fn_action, inputs, consume, gr_prompt, gr_prompt_negative)
+    
+    def bindAction(self, gr_trigger: typing.Any, fn_action: typing.Callable, inputs: list[typing.Any], consume: bool, gr_prompt: typing.Any, gr_prompt_negative: typing.Any) -> None:
+        # The listener on startup components runs the action as well: actions give the same state whichever runs first
+        inputs_content = self.getContentInput()
+        def _fnAction(*inputValues):
+            if consume:
+                self.updateContent(inputValues[len(inputs):])
+            else:
+                B_Session.setInputValues(inputs_content, inputValues[len(inputs):])
+            fn_action(*inputValues[:len(inputs)])
+            return self.getContentOutputUpdate() + B_Prompt_Map.buildPromptUpdate()
+        gr_trigger.click(
+            fn = B_Session.wrap(_fnAction, self.name)
+            , inputs = inputs + inputs_content
+            , outputs = self.getContentOutput() + [gr_prompt, gr_prompt_negative]
+        )
+    
     def getGrForWebUI(self) -> list[typing.Any]:
         gr_list: list[typing.Any] = []
 
+        if self.deferred:
+            return gr_list
+
         if self.build_button_random:
             gr_list.append(self.gr_random)
         if self.build_button_reset:
@@ -1322,40 +1750,124 @@ class B_UI_Container(B_UI, ABC):
             b_ui.reset(clear)
     
     def update(self, inputValues: tuple) -> int:
+        return self.updateContent(inputValues) if not self.deferred else 0
+    
+    def updateContent(self, inputValues: tuple) -> int:
         offset: int = 0
         for b_ui in self.children:
             offset += b_ui.update(inputValues[offset:])
         return offset
     
-    def randomize(self) -> None:
+    def randomize(self, rng: random.Random = None) -> None:
+        if rng is None:
+            rng = random.Random()
         for b_ui in self.children:
-            b_ui.randomize()
+            b_ui.randomize(rng)
+    
+    def randomizeTagged(self, rng: random.Random) -> None:
+        """Randomize the containers within (or being) this one that offer a randomize button"""
+        if self.build_button_random:
+            self.randomize(rng)
+            return
+        
+        for b_ui in self.children:
+            if isinstance(b_ui, B_UI_Container):
+                b_ui.randomizeTagged(rng)
     
     def getInput(self) -> list[typing.Any]:
+        return self.getContentInput() if not self.deferred else []
+    
+    def getContentInput(self) -> list[typing.Any]:
         gr_inputs: list[typing.Any] = []
         for b_ui in self.children:
             gr_inputs += b_ui.getInput()
         return gr_inputs
     
     def getOutput(self) -> list[typing.Any]:
+        return self.getContentOutput() if not self.deferred else [self.gr_deferred]
+    
+    def getContentOutput(self) -> list[typing.Any]:
         gr_outputs: list[typing.Any] = []
         for b_ui in self.children:
             gr_outputs += b_ui.getOutput()
         return gr_outputs
     
     def getOutputUpdate(self) -> list:
+        if self.deferred:
+            return [self.getRenderUpdate() if self.isRendered() else gr.update()]
+        return self.getContentOutputUpdate()
+    
+    def getContentOutputUpdate(self) -> list:
         gr_updates = []
         for b_ui in self.children:
             gr_updates += b_ui.getOutputUpdate()
         return gr_updates
     
+    def isRendered(self) -> bool:
+        """Whether the deferred content was rendered in the page of the current session"""
+        return self.uid in B_UI_Container.getRenders()
+    
+    def getRenderUpdate(self, stale_only: bool = False):
+        """Update of gr_deferred rendering the content (again, showing the current state) in the page of the current session;
+        with stale_only, only if rendered there in an older version"""
+        renders = B_UI_Container.getRenders()
+        count, version, gr_ids = renders.get(self.uid, (0, -1, range(0)))
+        if stale_only and (count == 0 or version == self.version):
+            return gr.update()
+        renders[self.uid] = count + 1, version, gr_ids
+
+        gr_deferred_update = gr.Number
+        if is_gradio_3:
+            gr_deferred_update = self.gr_deferred.update
+        return B_Session.getUpdate(self.gr_deferred, gr_deferred_update, { "value": count + 1 })
+    
+    def setRendered(self, b_ui_render: "B_UI_Container", gr_ids: range) -> None:
+        """Record a render in the page of the current session, replacing the components of the one before (and of the deferred content it held)"""
+        renders = B_UI_Container.getRenders()
+        count, _, gr_ids_prior = renders.get(self.uid, (1, 0, range(0)))
+        B_Session.forget(gr_ids_prior)
+        for b_ui in b_ui_render.getDescendants():
+            if isinstance(b_ui, B_UI_Container) and b_ui.deferred:
+                # Rendered again from scratch on its next open
+                _, _, gr_ids_nested = renders.pop(b_ui.uid, (0, 0, range(0)))
+                B_Session.forget(gr_ids_nested)
+        renders[self.uid] = count, self.version, gr_ids
+    
+    def getDescendants(self) -> list[B_UI]:
+        """The B_UIs within, at any depth"""
+        b_ui_list: list[B_UI] = []
+        for b_ui in self.getChildren():
+            b_ui_list.append(b_ui)
+            if isinstance(b_ui, B_UI_Container):
+                b_ui_list += b_ui.getDescendants()
+            else:
+                b_ui_list += b_ui.getChildren()
+        return b_ui_list
+    
     def addChild(self, item: B_UI):
         self.children.append(item)
     
+    def getChildren(self) -> list[B_UI]:
+        return self.children
+    
+    def copyForRender(self) -> "B_UI_Container":
+        b_ui = super().copyForRender()
+        b_ui.children = [b_ui_child.copyForRender() for b_ui_child in self.children]
+        return b_ui
+    
+    def getPrompts(self) -> list[B_Prompt]:
+        b_prompts: list[B_Prompt] = []
+        for b_ui in self.children:
+            b_prompts += b_ui.getPrompts()
+        return b_prompts
+    
     @abstractmethod
     def buildContainer(self) -> typing.Any:
         pass
 
+    def getOpenEvent(self) -> typing.Any:
+        return None
+
 class B_UI_Container_Tab(B_UI_Container):
     @staticmethod
     def _fromArgs(args: dict[str, str], name: str = "Tab"):
@@ -1363,13 +1875,23 @@ class B_UI_Container_Tab(B_UI_Container):
             name
             , bool(int(args.get("build_button_reset", 1)))
             , bool(int(args.get("build_button_random", 1)))
+            , lazy = int(args.get("lazy", lazy_containers))
+            , compact = bool(int(args.get("compact", compact_containers)))
         )
     
-    def __init__(self, name: str = "Tab", build_button_reset: bool = True, build_button_random: bool = True, children: list[B_UI] = None):
-        super().__init__(name, build_button_reset, build_button_random, children)
+    def __init__(self, name: str = "Tab", build_button_reset: bool = True, build_button_random: bool = True, children: list[B_UI] = None, lazy: int = 0, compact: bool = False):
+        super().__init__(name, build_button_reset, build_button_random, children, lazy, compact)
+    
+    def initDeferred(self, is_first: bool, reloadable: bool = False) -> None:
+        if reloadable and self.initReloadable(is_first):
+            return
+        self.deferred = not is_first and self.initLazy()
     
     def buildContainer(self) -> typing.Any:
         return gr.Tab(self.name)
+    
+    def getOpenEvent(self) -> typing.Any:
+        return self.gr_container.select
 
 class B_UI_Container_Row(B_UI_Container):
     @staticmethod
@@ -1412,15 +1934,25 @@ class B_UI_Container_Accordion(B_UI_Container):
             , bool(int(args.get("open", 0)))
             , bool(int(args.get("build_button_reset", 0)))
             , bool(int(args.get("build_button_random", 0)))
+            , lazy = int(args.get("lazy", lazy_containers))
+            , compact = bool(int(args.get("compact", compact_containers)))
         )
     
-    def __init__(self, name: str = "Accordion", init_open: bool = False, build_button_reset: bool = False, build_button_random: bool = False, children: list[B_UI] = None):
-        super().__init__(name, build_button_reset, build_button_random, children)
+    def __init__(self, name: str = "Accordion", init_open: bool = False, build_button_reset: bool = False, build_button_random: bool = False, children: list[B_UI] = None, lazy: int = 0, compact: bool = False):
+        super().__init__(name, build_button_reset, build_button_random, children, lazy, compact)
 
         self.init_open = init_open
     
+    def initDeferred(self, is_first: bool, reloadable: bool = False) -> None:
+        if reloadable and self.initReloadable(is_first):
+            return
+        self.deferred = not self.init_open and self.initLazy()
+    
     def buildContainer(self) -> typing.Any:
         return gr.Accordion(label = self.name, open = self.init_open)
+    
+    def getOpenEvent(self) -> typing.Any:
+        return self.gr_container.expand
 
 class B_UI_Container_Group(B_UI_Container):
     @staticmethod
@@ -1429,149 +1961,491 @@ class B_UI_Container_Group(B_UI_Container):
             name
             , bool(int(args.get("build_button_reset", 0)))
             , bool(int(args.get("build_button_random", 0)))
+            , compact = bool(int(args.get("compact", compact_containers)))
         )
     
-    def __init__(self, name: str = "Group", build_button_reset: bool = False, build_button_random: bool = False, children: list[B_UI] = None):
-        super().__init__(name, build_button_reset, build_button_random, children)
+    def __init__(self, name: str = "Group", build_button_reset: bool = False, build_button_random: bool = False, children: list[B_UI] = None, compact: bool = False):
+        super().__init__(name, build_button_reset, build_button_random, children, compact = compact)
     
     def buildContainer(self) -> typing.Any:
         return gr.Group()
 
-class B_Prompt_Map():
-    _map: dict[str, tuple[B_Prompt, bool]] = {}
+class B_UI_Map():
+    _map: list[B_UI | None] = [] # By id (see B_Symbols)
+    _map_built: list[B_UI | None] = [] # By id
+    _built: list[B_UI] = [] # In build order (the order of _inputs and _outputs)
+    _built_deferred: list[B_UI] = [] # Deferred containers, their content built per render
+    _actions: list[tuple[typing.Any, typing.Callable, list[typing.Any], bool, set[int] | None]] = [] # See addAction
+    _inputs: list[typing.Any] = []
+    _outputs: list[typing.Any] = []
+    _deferred: bool = False
+    _version: int = 0 # Bumped whenever B_UIs are added/removed (compiled presets refer to them)
+    _owners: list[B_UI | None] = [] # By prompt id
+    _owners_version: int = -1
     
     @staticmethod
-    def add(b_prompt: B_Prompt):
-        if b_prompt.name in B_Prompt_Map._map:
-            printWarning(B_Prompt_Map, "add()", f"Duplicate name -> '{b_prompt.name}'")
-        B_Prompt_Map._map[b_prompt.name] = b_prompt, False
+    def clear():
+        B_UI_Map._version += 1
+        B_UI_Map._map = []
+        B_UI_Map._map_built = []
+        B_UI_Map._built = []
+        B_UI_Map._built_deferred = []
+        B_UI_Map._actions = []
+        B_UI_Map._inputs = []
+        B_UI_Map._outputs = []
+        B_UI_Map._deferred = False
     
     @staticmethod
-    def update(b_prompt: B_Prompt | None, remove: bool = False):
-        if b_prompt is None:
-            return
-        B_Prompt_Map._map[b_prompt.name] = b_prompt, not remove
+    def add(b_ui: B_UI):
+        if B_Symbols.place(B_UI_Map._map, b_ui.id, b_ui) is not None:
+            printWarning(B_UI_Map, "add()", f"Duplicate name -> '{b_ui.name}'")
+        B_UI_Map._version += 1
     
     @staticmethod
-    def get(b_prompt_name: str) -> B_Prompt | None:
-        mapping = B_Prompt_Map._map.get(b_prompt_name)
-        return mapping[0] if mapping is not None else None
+    def remove(b_ui: B_UI):
+        """Unregister a B_UI and everything within it"""
+        if B_UI_Map.getById(b_ui.id) is b_ui:
+            B_UI_Map._map[b_ui.id] = None
+            B_UI_Map._version += 1
+        for b_ui_child in b_ui.getChildren():
+            B_UI_Map.remove(b_ui_child)
     
     @staticmethod
-    def isSelected(b_prompt: B_Prompt | None):
-        return b_prompt is not None and B_Prompt_Map._map[b_prompt.name][1]
+    def get(name: str) -> B_UI | None:
+        return B_Symbols.lookup(B_UI_Map._map, B_Symbols.get(name))
     
     @staticmethod
-    def buildPromptUpdate() -> list[str]:
-        prompt: str = ""
-        prompt_negative: str = ""
-
-        for b_prompt, selected in B_Prompt_Map._map.values():
-            if not selected:
-                continue
-            
-            b_prompt_positive, b_prompt_negative = b_prompt.build()
-            prompt = B_Prompt.Fn.added(prompt, b_prompt_positive)
-            prompt_negative = B_Prompt.Fn.added(prompt_negative, b_prompt_negative)
-        
-        return [prompt, prompt_negative]
-
-class B_UI_Map():
-    _map: dict[str, B_UI] = {}
-    _inputs: list[typing.Any] = []
-    _outputs: list[typing.Any] = []
+    def getById(i: int) -> B_UI | None:
+        return B_Symbols.lookup(B_UI_Map._map, i)
     
     @staticmethod
-    def add(b_ui: B_UI):
-        if b_ui.name in B_UI_Map._map:
-            printWarning(B_UI_Map, "add()", f"Duplicate name -> '{b_ui.name}'")
-        B_UI_Map._map[b_ui.name] = b_ui
+    def getBuilt(i: int) -> B_UI | None:
+        return B_Symbols.lookup(B_UI_Map._map_built, i)
+    
+    @staticmethod
+    def getAll() -> list[B_UI]:
+        return [b_ui for b_ui in B_UI_Map._map if b_ui is not None]
+    
+    @staticmethod
+    def getOwners() -> list[B_UI | None]:
+        """Prompt id -> B_UI holding it"""
+        if B_UI_Map._owners_version != B_UI_Map._version:
+            version = B_UI_Map._version
+            owners: list[B_UI | None] = []
+            for b_ui in B_UI_Map._map:
+                if b_ui is None:
+                    continue
+                for b_prompt in b_ui.getPrompts():
+                    B_Symbols.place(owners, b_prompt.id, b_ui)
+            B_UI_Map._owners, B_UI_Map._owners_version = owners, version
+        return B_UI_Map._owners
+    
+    @staticmethod
+    def resetChanged(ids_excluded: typing.Container[int] = ()) -> set[B_UI]:
+        """Reset the B_UIs holding prompts changed since their last reset (the others still show their initial values), returns them"""
+        b_ui_reset: set[B_UI] = set()
+        owners = B_UI_Map.getOwners()
+        for i in B_Prompt_Map.getTouched():
+            b_ui = B_Symbols.lookup(owners, i)
+            if b_ui is not None and b_ui not in b_ui_reset and b_ui.id not in ids_excluded:
+                b_ui.reset() #!
+                B_Prompt_Map.untouch(b_ui.getPrompts())
+                b_ui_reset.add(b_ui)
+        return b_ui_reset
+    
+    @staticmethod
+    def addBuilt(b_ui: B_UI, b_ui_list_shown: list[B_UI] = ()):
+        """Register the components of a B_UI built on startup (and of the B_UIs shown through them, not built themselves);
+        deferred containers build theirs after startup, outside of the listeners wired to these"""
+        if B_UI_Map._deferred:
+            return
+        B_Symbols.place(B_UI_Map._map_built, b_ui.id, b_ui)
+        B_UI_Map.addShown(b_ui, b_ui_list_shown)
+        B_UI_Map._built.append(b_ui)
         B_UI_Map._inputs += b_ui.getInput()
         B_UI_Map._outputs += b_ui.getOutput()
     
+    @staticmethod
+    def addBuiltDeferred(b_ui: B_UI, b_ui_list_shown: list[B_UI] = ()):
+        if B_UI_Map._deferred:
+            return
+        B_Symbols.place(B_UI_Map._map_built, b_ui.id, b_ui)
+        B_UI_Map.addShown(b_ui, b_ui_list_shown)
+        B_UI_Map._built_deferred.append(b_ui)
+    
+    @staticmethod
+    def addAction(gr_trigger: typing.Any, fn_action: typing.Callable, inputs: list[typing.Any], consume: bool, uids: set[int] = None):
+        """Register a click acting on all built B_UIs (or on the deferred containers of uids only), wired again to each render of deferred content:
+        fn_action takes the values of inputs, after the content read its own (consumed, or only recorded if not consume)"""
+        B_UI_Map._actions.append((gr_trigger, fn_action, inputs, consume, uids))
+    
+    @staticmethod
+    def addShown(b_ui: B_UI, b_ui_list_shown: list[B_UI]):
+        for b_ui_shown in b_ui_list_shown:
+            B_Symbols.place(B_UI_Map._map_built, b_ui_shown.id, b_ui)
+    
     @staticmethod
     def getInput():
         inputs = []
-        for b_ui in B_UI_Map._map.values():
+        for b_ui in B_UI_Map._built:
             inputs += b_ui.getInput()
         return inputs
     
     @staticmethod
     def getOutput():
         outputs = []
-        for b_ui in B_UI_Map._map.values():
+        for b_ui in B_UI_Map._built:
             outputs += b_ui.getOutput()
         return outputs
     
     @staticmethod
     def consumeInputValues(inputValues: tuple):
         offset = 0
-        for b_ui in B_UI_Map._map.values():
+        for b_ui in B_UI_Map._built:
             offset += b_ui.update(inputValues[offset:])
     
     @staticmethod
     def getOutputUpdates():
         updates = []
-        for b_ui in B_UI_Map._map.values():
+        for b_ui in B_UI_Map._built:
             updates += b_ui.getOutputUpdate()
         return updates
 
-class B_UI_Master():
+class B_Prompt_Matrix():
+    """Lazy cartesian product over dropdown choices and prompt values, declared one axis per line:
+    SELECT <dropdown> [--v <choices>] [--none 1], EDIT <prompt> [--r <stops> | --steps <count>], EMPHASIS <prompt> [--sp <values>] [--sn <values>]"""
+
+    class Axis(ABC):
+        def __init__(self, name: str):
+            self.name = name
+        
+        @abstractmethod
+        def __len__(self) -> int:
+            pass
+
+        @abstractmethod
+        def apply(self, i: int) -> None:
+            pass
+        
+        @abstractmethod
+        def save(self) -> None:
+            pass
+        
+        @abstractmethod
+        def restore(self) -> None:
+            pass
+    
+    class Axis_Select(Axis):
+        def __init__(self, name: str, choices: list[B_Prompt | None]):
+            super().__init__(name)
+
+            self.choices = choices
+            self.saved: list[bool] = []
+        
+        def __len__(self) -> int:
+            return len(self.choices)
+        
+        def apply(self, i: int) -> None:
+            choice = self.choices[i]
+            for b_prompt in self.choices:
+                if b_prompt is not None and b_prompt is not choice:
+                    B_Prompt_Map.update(b_prompt, True)
+            B_Prompt_Map.update(choice)
+        
+        def save(self) -> None:
+            self.saved = [B_Prompt_Map.isSelected(b_prompt) for b_prompt in self.choices]
+        
+        def restore(self) -> None:
+            for b_prompt, selected in zip(self.choices, self.saved):
+                B_Prompt_Map.update(b_prompt, not selected)
+    
+    class Axis_Value(Axis):
+        def __init__(self, name: str, b_prompt: B_Prompt, b_value: B_Value, values: list):
+            super().__init__(name)
+
+            self.b_prompt = b_prompt
+            self.b_value = b_value
+            self.values = values
+            self.saved: tuple[typing.Any, bool] = None
+        
+        def __len__(self) -> int:
+            return len(self.values)
+        
+        def apply(self, i: int) -> None:
+            self.b_value.update(self.values[i])
+            B_Prompt_Map.update(self.b_prompt)
+        
+        def save(self) -> None:
+            self.saved = self.b_value.value, B_Prompt_Map.isSelected(self.b_prompt)
+        
+        def restore(self) -> None:
+            self.b_value.update(self.saved[0])
+            B_Prompt_Map.update(self.b_prompt, not self.saved[1])
+    
     @staticmethod
-    def readLine(l: str) -> tuple[str, str, dict[str, str]]:
-        #! TODO: Fix empty str l_name
-        l = l.strip()
-        
-        l_type: str = l
-        l_name: str = None
-        l_args: dict[str, str] = {}
-        
-        if len(l) > 0:
-            index = l.find(" ")
-            if index != -1:
-                l_type = l[:index]
-            
-            l = l[len(l_type) + 1:]
-            
-            l_arg_index = l.find("--")
-            if l_arg_index == -1:
-                l_name = l
-            elif l_arg_index > 0:
-                l_name = l[:l_arg_index - 1 if l_arg_index > -1 else len(l)]
-                l = l[len(l_name) + 1:]
-            
-            l_args = {}
-            for l_arg in l.split("--")[1:]:
-                l_arg_name = l_arg[:l_arg.index(" ")]
-                l_arg_value = l_arg[len(l_arg_name) + 1:].strip()
-                l_args[l_arg_name] = l_arg_value
+    def _fromArgsList(args: dict[str, str], key: str, fn_parse: typing.Callable[[str], typing.Any]) -> list | None:
+        value = args.get(key)
+        if value is None:
+            return None
+        return [fn_parse(v.strip()) for v in value.split(",") if len(v.strip()) > 0]
+    
+    @staticmethod
+    def fromText(text: str):
+        axes: list[B_Prompt_Matrix.Axis] = []
+
+        line_number: int = 0
+        for l in text.splitlines():
+            line_number += 1
+
+            l_type, l_name, l_args = B_Layout_Lexer.readLine(l, line_number)
+            if len(l_type) == 0 or l_type.startswith("#"):
+                continue
             
-        return l_type, l_name, l_args
+            try:
+                match l_type:
+                    case "SELECT":
+                        b_ui = B_UI_Map.get(l_name)
+                        if not isinstance(b_ui, B_UI_Dropdown):
+                            printWarning(B_Prompt_Matrix, f"fromText() @{line_number}", f"Dropdown not found -> '{l_name}'")
+                            continue
+                        
+                        names = B_Prompt_Matrix._fromArgsList(l_args, "v", str)
+                        choices: list[B_Prompt | None] = b_ui.getChoices()
+                        if names is not None:
+                            choices = [b_prompt for b_prompt in choices if b_prompt.name in names]
+                            if b_ui.choice_entries is not None:
+                                choices += [b_prompt for b_prompt in map(b_ui.getChoice, names) if isinstance(b_prompt, B_Prompt_Entry) and b_prompt not in choices]
+                        if bool(int(l_args.get("none", 0))):
+                            choices = [None] + choices
+                        axes.append(B_Prompt_Matrix.Axis_Select(l_name, choices))
+                    
+                    case "EDIT" | "EMPHASIS":
+                        b_prompt = B_Prompt_Map.get(l_name)
+                        if b_prompt is None:
+                            printWarning(B_Prompt_Matrix, f"fromText() @{line_number}", f"Prompt not found -> '{l_name}'")
+                            continue
+                        
+                        if l_type == "EDIT":
+                            values = B_Prompt_Matrix._fromArgsList(l_args, B_Prompt.Values.Keys.edit, int)
+                            if values is None:
+                                steps = max(2, int(l_args.get("steps", 3)))
+                                edit_range = B_Prompt.Values.Defaults.edit_max - B_Prompt.Values.Defaults.edit_min
+                                values = [B_Prompt.Values.Defaults.edit_min + round(edit_range * i / (steps - 1)) for i in range(steps)]
+                            axes.append(B_Prompt_Matrix.Axis_Value(l_name, b_prompt, b_prompt.values.stored("edit"), values))
+                        else:
+                            values = B_Prompt_Matrix._fromArgsList(l_args, B_Prompt.Values.Keys.emphasis, float)
+                            if values is not None:
+                                axes.append(B_Prompt_Matrix.Axis_Value(l_name, b_prompt, b_prompt.values.stored("emphasis"), values))
+                            values = B_Prompt_Matrix._fromArgsList(l_args, B_Prompt.Values.Keys.emphasis_negative, float)
+                            if values is not None:
+                                axes.append(B_Prompt_Matrix.Axis_Value(f"{l_name} (N)", b_prompt, b_prompt.values.stored("emphasis_negative"), values))
+                    
+                    case _:
+                        printWarning(B_Prompt_Matrix, f"fromText() @{line_number}", f"Invalid axis type -> '{l_type}'")
+            except ValueError as e:
+                printWarning(B_Prompt_Matrix, f"fromText() @{line_number}", f"Invalid value ({e})")
+        
+        axes = [axis for axis in axes if len(axis) > 0]
+        return B_Prompt_Matrix(axes) if len(axes) > 0 else None
+    
+    def __init__(self, axes: list[Axis]):
+        self.axes = axes
+
+        self.total: int = 1
+        for axis in axes:
+            self.total *= len(axis)
+    
+    def count(self, start: int = 0, stride: int = 1, cap: int = 0) -> int:
+        count = max(0, -(-(self.total - start) // stride))
+        return min(count, cap) if cap > 0 else count
+    
+    def apply(self, index: int) -> None:
+        # Mixed radix decode, last axis varies fastest
+        for axis in reversed(self.axes):
+            index, i = divmod(index, len(axis))
+            axis.apply(i)
+    
+    def generate(self, start: int = 0, stride: int = 1, cap: int = 0) -> typing.Iterator[tuple[int, tuple[list[str], list[str]]]]:
+        """Yield (index, (prompt fragments, negative prompt fragments)) per combination, restoring the prompts touched once exhausted or closed"""
+        for axis in self.axes:
+            axis.save()
+        
+        try:
+            for index in itertools.islice(range(start, self.total, stride), cap if cap > 0 else None):
+                self.apply(index)
+                yield index, B_Prompt_Map.buildPromptFragments()
+        finally:
+            for axis in reversed(self.axes):
+                axis.restore()
 
+class B_UI_Master():
+    _block_types: tuple[str, ...] = ("SELECT", "GROUP", "TAB", "ROW", "COLUMN", "ACCORDION")
+    _section_types: dict[type, str] = {
+        B_UI_Dropdown: "SELECT"
+        , B_UI_Container_Group: "GROUP"
+        , B_UI_Container_Tab: "TAB"
+        , B_UI_Container_Row: "ROW"
+        , B_UI_Container_Column: "COLUMN"
+        , B_UI_Container_Accordion: "ACCORDION"
+    }
+
+    @staticmethod
+    def readLine(l: str, line_number: int = 0) -> tuple[str, str, dict[str, str]]:
+        return B_Layout_Lexer.readLine(l, line_number)
+    
+    @staticmethod
+    def readLines(path: str) -> list[tuple[int, str, str, dict[str, str]]]:
+        if use_layout_cache:
+            return B_Layout_Cache.read(path, B_Layout_Lexer.tokenize)
+        
+        with open(path, "rb") as file:
+            return B_Layout_Lexer.tokenize(file.read())
+    
+    @staticmethod
+    def readStat(path: str) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    @staticmethod
+    def splitLayoutBlocks(records: list[tuple[int, str, str, dict[str, str]]]) -> list[list[tuple[int, str, str, dict[str, str]]]]:
+        """Group the records of a layout into its top level items, each from its opening line to its END"""
+        blocks: list[list[tuple[int, str, str, dict[str, str]]]] = []
+        block: list[tuple[int, str, str, dict[str, str]]] = []
+
+        depth = 0
+        in_set = False
+        for record in records:
+            l_type = record[1]
+            block.append(record)
+
+            if l_type == "END":
+                if in_set:
+                    in_set = False
+                elif depth > 0:
+                    depth -= 1
+            elif l_type == "SET":
+                in_set = True
+            elif l_type in B_UI_Master._block_types:
+                depth += 1
+            
+            if depth == 0 and not in_set:
+                blocks.append(block)
+                block = []
+        
+        if len(block) > 0:
+            blocks.append(block)
+        
+        return blocks
+    
+    @staticmethod
+    def getBlockSignature(block: list[tuple[int, str, str, dict[str, str]]]) -> tuple:
+        """Content of a block regardless of where it sits in the file"""
+        return tuple((l_type, l_name, tuple(l_args.items())) for _, l_type, l_name, l_args in block if l_type != "#")
+    
+    @staticmethod
+    def getBlockKey(signature: tuple) -> tuple[str, str] | None:
+        return signature[0][:2] if len(signature) > 0 else None
+    
+    @staticmethod
+    def getSectionName(b_ui: B_UI) -> str | None:
+        """Startup profiler section of a top level item, None for single prompts"""
+        l_type = B_UI_Master._section_types.get(type(b_ui))
+        return f"{l_type} {b_ui.name}" if l_type is not None else None
+    
+    @staticmethod
+    def getGrCounts() -> tuple[int, int] | None:
+        """Gradio components and event listeners created so far"""
+        from gradio.context import Context
+        if Context.root_block is None:
+            return None
+        listeners = getattr(Context.root_block, "dependencies", None)
+        if listeners is None:
+            listeners = Context.root_block.fns
+        return Context.id, len(listeners)
+    
     def __init__(self, layout: list[B_UI] = None):
         self.path_script_config = os.path.join(b_path_base, b_folder_name_scripts, b_folder_name_script_config)
         self.path_layout = os.path.join(self.path_script_config, b_file_name_layout)
         self.path_presets = os.path.join(self.path_script_config, b_file_name_presets)
 
-        self.layout = (layout if layout is not None else []) + self.parseLayout()
-        self.presets = self.parsePresets() if show_presets else []
-
-        for b_ui in self.layout + self.presets:
-            b_ui.init()
+        # Hot reload: top level items of the layout with the prompts registered while parsing them, in file order
+        self.layout_ids_prior: list[int] = []
+        self.layout_blocks: list[tuple[tuple, list[B_UI], list[int]]] = [] # Signature, B_UIs, ids of the prompts added
+        self.layout_stat: tuple[int, int] = None
+        self.presets_stat: tuple[int, int] = None
+        self.reload_lock = threading.Lock()
+
+        if B_Startup.enabled:
+            B_Startup.fn_count = self.getGrCounts
+
+        if hot_reload:
+            if not B_UI_Container.canDefer():
+                printWarning(type(self), "__init__()", "hot_reload requires gr.render (Gradio 4), ignored")
+            self.layout_stat = self.readStat(self.path_layout)
+            self.presets_stat = self.readStat(self.path_presets)
+        with B_Startup.section("parseLayout"):
+            # Parsed per top level item when profiling too, to time each
+            if hot_reload or B_Startup.enabled:
+                self.layout = (layout if layout is not None else []) + self.parseLayoutBlocks(self.readLines(self.path_layout))
+            else:
+                self.layout = (layout if layout is not None else []) + self.parseLayout()
+        with B_Startup.section("parsePresets"):
+            self.presets = self.parsePresets() if show_presets else []
+        with B_Startup.section("resolve"):
+            B_Prompt_Map.resolve()
+
+        with B_Startup.section("init"):
+            B_UI_Container.initDeferredChildren(self.layout, True)
+            for b_ui in self.layout + self.presets:
+                with B_Startup.section(self.getSectionName(b_ui)):
+                    b_ui.init()
+        B_Prompt_Map.untouch() #! initial values are what a reset restores
         
         #! validate
 
         self.gr_prompt: typing.Any = None
         self.gr_prompt_negative: typing.Any = None
+        self.gr_session: typing.Any = None
         self.gr_apply: typing.Any = None
         self.gr_remove: typing.Any = None
         self.gr_clear: typing.Any = None
         self.gr_reset: typing.Any = None
         self.gr_prepend_prompts: typing.Any = None
         self.gr_use_break: typing.Any = None
+        self.gr_token_budget: typing.Any = None
+        self.gr_normalize: typing.Any = None
+        self.gr_tokens: typing.Any = None
+        self.gr_vary_prompt: typing.Any = None
+        self.gr_random_seed: typing.Any = None
+        self.gr_matrix: typing.Any = None
+        self.gr_matrix_start: typing.Any = None
+        self.gr_matrix_stride: typing.Any = None
+        self.gr_matrix_cap: typing.Any = None
         self.gr_clear_config: typing.Any
+        self.gr_reload: typing.Any = None
+        self.gr_reload_timer: typing.Any = None
+        self.gr_event_stats: typing.Any = None
+    
+    def parseLayoutBlocks(self, records: list[tuple[int, str, str, dict[str, str]]]) -> list[B_UI]:
+        layout: list[B_UI] = []
+
+        self.layout_ids_prior = list(B_Prompt_Map._ids)
+        self.layout_blocks = []
+        for block in self.splitLayoutBlocks(records):
+            signature = self.getBlockSignature(block)
+            key = self.getBlockKey(signature)
+            mark = len(B_Prompt_Map._ids)
+            with B_Startup.section(f"{key[0]} {key[1]}" if key is not None and key[0] in self._block_types else None):
+                b_ui_list = self.parseLayout(block)
+            self.layout_blocks.append((signature, b_ui_list, list(B_Prompt_Map._ids[mark:])))
+            layout += b_ui_list
+        
+        return layout
     
-    def parseLayout(self) -> list[B_UI]:
+    def parseLayout(self, records: list[tuple[int, str, str, dict[str, str]]] = None) -> list[B_UI]:
         layout: list[B_UI] = []
         
         stack_containers: list[B_UI_Container] = []
@@ -1580,9 +2454,9 @@ class B_UI_Master():
 
         skip = 0
 
-        def _buildPrompt(item: B_Prompt):
+        def _buildPrompt(item: B_Prompt, args: dict[str, str]):
             if len(stack_dropdowns) > 0:
-                stack_dropdowns[-1].addChoice(item)
+                stack_dropdowns[-1].addChoice(item, float(args.get("w", 1)))
                 return
             
             _build(B_UI_Prompt(item.name, item))
@@ -1594,137 +2468,127 @@ class B_UI_Master():
             
             layout.append(item)
         
-        with open(self.path_layout) as file_layout:
-            line_number: int = 0
+        if records is None:
+            records = self.readLines(self.path_layout)
+        
+        for line_number, l_type, l_name, l_args in records:
+            if l_type == "#":
+                printGeneral(f"# LAYOUT - commented out line @{line_number}")
+                continue
+            
+            if l_type == "END":
+                if skip == 0:
+                    if dropdown_choice_has_preset:
+                        dropdown_choice_has_preset = False
+                        continue
 
-            for l in file_layout:
-                line_number += 1
+                    if len(stack_dropdowns) > 0:
+                        item_dropdown = stack_dropdowns.pop()
+                        _build(item_dropdown)
+                        continue
+                    
+                    if len(stack_containers) > 0:
+                        item_container = stack_containers.pop()
+                        _build(item_container)
+                        continue
 
-                if l.lstrip().startswith("#"):
-                    printGeneral(f"# LAYOUT - commented out line @{line_number}")
                     continue
                 
-                l_type, l_name, l_args = self.readLine(l)
-                
-                if len(l_type) == 0:
-                    continue
-                    
-                if l_type == ".":
-                    break
+                skip -= 1
                 
-                if l_type == "END":
-                    if skip == 0:
-                        if dropdown_choice_has_preset:
-                            dropdown_choice_has_preset = False
-                            continue
+                continue
+            
+            ignore: bool = skip > 0
+            if l_args.get("x", "") == "1":
+                if not ignore:
+                    ignore = b_tagged_ignore
+            
+            match l_type:
+                case "SINGLE":
+                    if ignore:
+                        continue
 
-                        if len(stack_dropdowns) > 0:
-                            item_dropdown = stack_dropdowns.pop()
-                            _build(item_dropdown)
-                            continue
-                        
-                        if len(stack_containers) > 0:
-                            item_container = stack_containers.pop()
-                            _build(item_container)
-                            continue
+                    _buildPrompt(B_Prompt_Single._fromArgs(l_name, l_args), l_args)
+                
+                case "DUAL":
+                    if ignore:
+                        continue
 
+                    _buildPrompt(B_Prompt_Dual._fromArgs(l_name, l_args), l_args)
+                
+                case "EDIT":
+                    if ignore:
                         continue
                     
-                    skip -= 1
-                    
-                    continue
-                
-                ignore: bool = skip > 0
-                if l_args.get("x", "") == "1":
-                    if not ignore:
-                        ignore = b_tagged_ignore
+                    _buildPrompt(B_Prompt_Edit._fromArgs(l_name, l_args), l_args)
                 
-                match l_type:
-                    case "SINGLE":
-                        if ignore:
-                            continue
-
-                        _buildPrompt(B_Prompt_Single._fromArgs(l_name, l_args))
-                    
-                    case "DUAL":
-                        if ignore:
-                            continue
-
-                        _buildPrompt(B_Prompt_Dual._fromArgs(l_name, l_args))
-                    
-                    case "EDIT":
-                        if ignore:
-                            continue
-                        
-                        _buildPrompt(B_Prompt_Edit._fromArgs(l_name, l_args))
-                    
-                    case "EDIT_LINK":
-                        if ignore:
-                            continue
-                        
-                        _buildPrompt(B_Prompt_Edit_Link._fromArgs(l_name, l_args))
+                case "EDIT_LINK":
+                    if ignore:
+                        continue
                     
-                    case "SELECT":
-                        if ignore:
-                            skip += 1
-                            continue
-                        
-                        stack_dropdowns.append(B_UI_Dropdown._fromArgs(l_args, l_name))
+                    _buildPrompt(B_Prompt_Edit_Link._fromArgs(l_name, l_args), l_args)
+                
+                case "SELECT":
+                    if ignore:
+                        skip += 1
+                        continue
                     
-                    case "CHOICES":
-                        if ignore:
-                            continue
+                    stack_dropdowns.append(B_UI_Dropdown._fromArgs(l_args, l_name))
+                
+                case "CHOICES":
+                    if ignore:
+                        continue
 
-                        stack_dropdowns[-1].addChoices(l_args) #!
-                    
-                    case "SET":
-                        dropdown_choice_has_preset = True
-                        stack_dropdowns[-1].addChoicePresetMapping(l_name, l_args)
-                    
-                    case "GROUP":
-                        if ignore:
-                            skip += 1
-                            continue
+                    stack_dropdowns[-1].addChoices(l_args) #!
+                
+                case "SET":
+                    dropdown_choice_has_preset = True
+                    stack_dropdowns[-1].addChoicePresetMapping(l_name, l_args)
+                
+                case "GROUP":
+                    if ignore:
+                        skip += 1
+                        continue
 
-                        stack_containers.append(B_UI_Container_Group._fromArgs(l_args, l_name))
+                    stack_containers.append(B_UI_Container_Group._fromArgs(l_args, l_name))
+                
+                case "TAB":
+                    if ignore:
+                        skip += 1
+                        continue
                     
-                    case "TAB":
-                        if ignore:
-                            skip += 1
-                            continue
-                        
-                        stack_containers.append(B_UI_Container_Tab._fromArgs(l_args, l_name))
+                    stack_containers.append(B_UI_Container_Tab._fromArgs(l_args, l_name))
+                
+                case "ROW":
+                    if ignore:
+                        skip += 1
+                        continue
                     
-                    case "ROW":
-                        if ignore:
-                            skip += 1
-                            continue
-                        
-                        stack_containers.append(B_UI_Container_Row._fromArgs(l_args, l_name))
+                    stack_containers.append(B_UI_Container_Row._fromArgs(l_args, l_name))
+                
+                case "COLUMN":
+                    if ignore:
+                        skip += 1
+                        continue
                     
-                    case "COLUMN":
-                        if ignore:
-                            skip += 1
-                            continue
-                        
-                        stack_containers.append(B_UI_Container_Column._fromArgs(l_args, l_name))
+                    stack_containers.append(B_UI_Container_Column._fromArgs(l_args, l_name))
+                
+                case "ACCORDION":
+                    if ignore:
+                        skip += 1
+                        continue
                     
-                    case "ACCORDION":
-                        if ignore:
-                            skip += 1
-                            continue
-                        
-                        stack_containers.append(B_UI_Container_Accordion._fromArgs(l_args, l_name))
+                    stack_containers.append(B_UI_Container_Accordion._fromArgs(l_args, l_name))
+                
+                case "SEPARATOR":
+                    if ignore:
+                        continue
                     
-                    case "SEPARATOR":
-                        if ignore:
-                            continue
-                        
-                        _build(B_UI_Separator._fromArgs(l_args))
+                    _build(B_UI_Separator._fromArgs(l_args))
 
-                    case _:
-                        printWarning(type(self), "parseLayout()", f"Invalid layout type -> '{l_type}'")
-        
+                case _:
+                    printWarning(type(self), "parseLayout()", f"Invalid layout type -> '{l_type}'")
+    
         return layout
     
     def parsePresets(self) -> list[B_UI_Preset]:
@@ -1732,41 +2596,110 @@ class B_UI_Master():
         
         preset_current: B_UI_Preset = None
         
-        with open(self.path_presets) as file_presets:
-            line_number: int = 0
-
-            for l in file_presets:
-                line_number += 1
-
-                if l.lstrip().startswith("#"):
-                    printGeneral(f"# PRESETS - commented out line @{line_number}")
-                    continue
-
-                l_type, l_name, l_args = self.readLine(l)
-                
-                if len(l_type) == 0:
-                    continue
-                    
-                if l_type == ".":
-                    break
+        for line_number, l_type, l_name, l_args in self.readLines(self.path_presets):
+            if l_type == "#":
+                printGeneral(f"# PRESETS - commented out line @{line_number}")
+                continue
+            
+            if l_type == "END":
+                presets.append(preset_current)
+                preset_current = None
+                continue
+            
+            match l_type:
+                case "PRESET":
+                    preset_current = B_UI_Preset._fromArgs(l_args, l_name)
                 
-                if l_type == "END":
-                    presets.append(preset_current)
-                    preset_current = None
-                    continue
+                case "SET":
+                    preset_current.addMapping(l_name, l_args)
                 
-                match l_type:
-                    case "PRESET":
-                        preset_current = B_UI_Preset._fromArgs(l_args, l_name)
-                    
-                    case "SET":
-                        preset_current.addMapping(l_name, l_args)
-                    
-                    case _:
-                        printWarning(type(self), "parsePresets()", f"Invalid preset type -> '{l_type}'")
-        
+                case _:
+                    printWarning(type(self), "parsePresets()", f"Invalid preset type -> '{l_type}'")
+    
         return presets
     
+    def reload(self) -> bool:
+        """Re-parse the layout/presets files changed on disk, rebuilding only the changed top level containers"""
+        changed = False
+        # Layout and initial values are shared by all sessions
+        with self.reload_lock, B_Prompt_State.use(None):
+            stat = self.readStat(self.path_layout)
+            if stat != self.layout_stat:
+                self.layout_stat = stat
+                changed = self.reloadLayout() or changed
+            
+            stat = self.readStat(self.path_presets)
+            if show_presets and stat != self.presets_stat:
+                self.presets_stat = stat
+                changed = self.reloadPresets() or changed
+        return changed
+    
+    def reloadLayout(self) -> bool:
+        t = time.perf_counter()
+
+        blocks = self.splitLayoutBlocks(self.readLines(self.path_layout))
+        signatures = [self.getBlockSignature(block) for block in blocks]
+        
+        # Only content changes of rendered top level containers can be applied without rebuilding the whole UI
+        if len(signatures) != len(self.layout_blocks) or any(self.getBlockKey(signature) != self.getBlockKey(self.layout_blocks[i][0]) for i, signature in enumerate(signatures)):
+            printWarning(type(self), "reloadLayout()", "Top level items were added, removed or renamed -> Reload UI to apply")
+            return False
+        
+        changed = [i for i, signature in enumerate(signatures) if signature != self.layout_blocks[i][0]]
+        for i in changed:
+            b_ui_list = self.layout_blocks[i][1]
+            l_args = blocks[i][0][3]
+            if len(b_ui_list) != 1 or not isinstance(b_ui_list[0], B_UI_Container) or b_ui_list[0].gr_deferred is None or (b_tagged_ignore and l_args.get("x", "") == "1"):
+                printWarning(type(self), "reloadLayout()", f"Not a rendered top level TAB/ACCORDION -> '{self.getBlockKey(signatures[i])[1]}' (Reload UI to apply)")
+                return False
+        
+        if len(changed) == 0:
+            return False
+        
+        for i in changed:
+            b_ui_container: B_UI_Container = self.layout_blocks[i][1][0]
+
+            # Keep selections of prompts that are still there
+            selections = {b_prompt.id: B_Prompt_Map.isSelected(b_prompt) for b_prompt in b_ui_container.getPrompts()}
+            for b_ui in b_ui_container.getChildren():
+                B_UI_Map.remove(b_ui)
+            for b_prompt in b_ui_container.getPrompts():
+                B_Prompt_Map.remove(b_prompt)
+            
+            mark = len(B_Prompt_Map._ids)
+            b_ui_container.adopt(self.parseLayout(blocks[i])[0])
+            b_ui_container.init()
+            B_UI_Map.addShown(b_ui_container, b_ui_container.getDescendants())
+            
+            for b_prompt in b_ui_container.getPrompts():
+                selected = selections.get(b_prompt.id)
+                if selected is not None:
+                    B_Prompt_Map.update(b_prompt, not selected)
+            
+            self.layout_blocks[i] = signatures[i], [b_ui_container], list(B_Prompt_Map._ids[mark:])
+        
+        ids = list(self.layout_ids_prior)
+        for _, _, block_ids in self.layout_blocks:
+            ids += block_ids
+        B_Prompt_Map.reorder(ids)
+        B_Prompt_Map.resolve()
+        
+        printGeneral(f"Layout reloaded -> {', '.join(self.layout_blocks[i][1][0].name for i in changed)} ({(time.perf_counter() - t) * 1000:.0f} ms)")
+        return True
+    
+    def reloadPresets(self) -> bool:
+        presets = self.parsePresets()
+        if [(preset.name, preset.additive) for preset in presets] != [(preset.name, preset.additive) for preset in self.presets]:
+            printWarning(type(self), "reloadPresets()", "Presets were added, removed, renamed or made (non-)additive -> Reload UI to apply")
+            return False
+        
+        for preset, preset_new in zip(self.presets, presets):
+            preset.mappings = preset_new.mappings
+            preset.plan = None
+        
+        printGeneral("Presets reloaded")
+        return True
+    
     def build(self):
         # PRESETS
         if show_presets:
@@ -1782,13 +2715,16 @@ class B_UI_Master():
         # LAYOUT
         B_UI_Separator._build()
         for b_ui in self.layout:
-            b_ui.build()
+            with B_Startup.section(self.getSectionName(b_ui)):
+                b_ui.build()
         
         # MAIN
         B_UI_Separator._build()
         prompt = B_Prompt_Map.buildPromptUpdate()
         self.gr_prompt = gr.Textbox(label = "Final Prompt", value = prompt[0])
         self.gr_prompt_negative = gr.Textbox(label = "Final Negative Prompt", value = prompt[1])
+        self.gr_tokens = gr.Markdown(value = self.getTokensInfo(prompt[0], prompt[1], False))
+        self.gr_session = gr.Textbox(value = "", visible = False)
         B_UI_Separator._build()
         with gr.Row():
             self.gr_apply = gr.Button("Apply All")
@@ -1806,8 +2742,32 @@ class B_UI_Master():
                 label = "Use BREAK?"
                 , value = True
             )
+            self.gr_token_budget = gr.Checkbox(label = f"Place BREAKs by token count? ({B_Tokens.chunk_size} per chunk)")
+            self.gr_normalize = gr.Checkbox(label = "Remove duplicate tags?")
+            self.gr_vary_prompt = gr.Checkbox(label = "Randomize prompt per image?")
+            self.gr_random_seed = gr.Number(label = "Randomize button seed (-1 = random)", value = -1, precision = 0)
+            B_UI_Container._gr_random_seed = self.gr_random_seed
+            B_UI_Separator._build()
+            self.gr_matrix = gr.Textbox(
+                label = "Prompt matrix"
+                , lines = 3
+                , placeholder = "SELECT <dropdown> [--v <choices>] [--none 1]\nEDIT <prompt> [--r <stops> | --steps <count>]\nEMPHASIS <prompt> [--sp <values>] [--sn <values>]"
+            )
+            with gr.Row():
+                self.gr_matrix_start = gr.Number(label = "Matrix start index", value = 0, precision = 0, minimum = 0)
+                self.gr_matrix_stride = gr.Number(label = "Matrix stride", value = 1, precision = 0, minimum = 1)
+                self.gr_matrix_cap = gr.Number(label = "Matrix cap (0 = all)", value = 0, precision = 0, minimum = 0)
             B_UI_Separator._build()
             self.gr_clear_config = gr.Button("Clear config")
+            if hot_reload and B_UI_Container.canDefer():
+                self.gr_reload = gr.Button("Reload layout")
+                if hasattr(gr, "Timer"):
+                    self.gr_reload_timer = gr.Timer(hot_reload_interval)
+            if event_stats:
+                self.gr_event_stats = gr.Button("Save event stats")
+        
+        # Anything built from here on is rendered by a deferred container
+        B_UI_Map._deferred = True
     
     def bind(self) -> None:
         # - Presets
@@ -1816,56 +2776,111 @@ class B_UI_Master():
 
         # - Layout
         for b_ui in self.layout:
-            b_ui.bind(self.gr_prompt, self.gr_prompt_negative)
+            with B_Startup.section(self.getSectionName(b_ui)):
+                b_ui.bind(self.gr_prompt, self.gr_prompt_negative)
         
         # - Self
+        # -- Session of the prompt state run() reads (any change of it changes the prompt sooner or later)
+        def _fnSession(request: gr.Request):
+            return request.session_hash if request is not None else ""
+        self.gr_prompt.change(
+            fn = B_Events.wrap(_fnSession)
+            , outputs = self.gr_session
+        )
+        
+        # -- Sessions are dropped once their page is closed, where Gradio tells (Gradio 4)
+        from gradio.context import Context
+        if Context.root_block is not None and hasattr(Context.root_block, "unload"):
+            def _fnUnload(request: gr.Request):
+                B_Session.drop(request.session_hash if request is not None else None)
+            Context.root_block.unload(_fnUnload)
+
+        def _fnNormalize(normalize: bool):
+            B_Prompt_Map.setNormalize(normalize)
+            return B_Prompt_Map.buildPromptUpdate()
+        self.gr_normalize.change(
+            fn = B_Session.wrap(_fnNormalize)
+            , inputs = self.gr_normalize
+            , outputs = [self.gr_prompt, self.gr_prompt_negative]
+        )
+
+        def _fnTokens(prompt: str, prompt_negative: str, token_budget: bool):
+            return self.getTokensInfo(prompt, prompt_negative, token_budget)
+        for gr_trigger in (self.gr_prompt, self.gr_prompt_negative, self.gr_token_budget):
+            gr_trigger.change(
+                fn = B_Session.wrap(_fnTokens)
+                , inputs = [self.gr_prompt, self.gr_prompt_negative, self.gr_token_budget]
+                , outputs = self.gr_tokens
+            )
+
         inputs = B_UI_Map._inputs
         outputs = B_UI_Map._outputs + [self.gr_prompt, self.gr_prompt_negative]
 
+        # -- Global actions (wired to the content of deferred containers as it renders, see B_UI_Map.addAction)
         #!
-        def _fnApply(*inputValues):
+        def _fnApplyAction(*inputValues):
             B_UI_Map.consumeInputValues(inputValues)
-            for b_ui in B_UI_Map._map.values():
+            b_ui_list: list[B_UI] = list(B_UI_Map._built)
+            for b_ui in B_UI_Map._built_deferred:
+                b_ui_list += b_ui.getDescendants() # Content of deferred containers too, rendered or not
+            for b_ui in b_ui_list:
                 if type(b_ui) is B_UI_Prompt and b_ui.b_prompt is not None:
                     B_Prompt_Map.update(b_ui.b_prompt)
+                elif type(b_ui) is B_UI_Prompt_Group:
+                    for b_prompt in b_ui.getPrompts():
+                        B_Prompt_Map.update(b_prompt)
+        def _fnApply(*inputValues):
+            _fnApplyAction(*inputValues)
             return B_UI_Map.getOutputUpdates() + B_Prompt_Map.buildPromptUpdate()
         self.gr_apply.click(
-            fn = _fnApply
+            fn = B_Session.wrap(_fnApply)
             , inputs = inputs
             , outputs = outputs
         )
+        B_UI_Map.addAction(self.gr_apply, _fnApplyAction, inputs, True)
 
         #!
-        def _fnRemove(*inputValues):
+        def _fnRemoveAction(*inputValues):
             B_UI_Map.consumeInputValues(inputValues)
-            for b_prompt, selected in B_Prompt_Map._map.values():
-                B_Prompt_Map.update(b_prompt, True)
+            B_Prompt_Map.deselectAll()
+        def _fnRemove(*inputValues):
+            _fnRemoveAction(*inputValues)
             return B_UI_Map.getOutputUpdates() + B_Prompt_Map.buildPromptUpdate()
         self.gr_remove.click(
-            fn = _fnRemove
+            fn = B_Session.wrap(_fnRemove)
             , inputs = inputs
             , outputs = outputs
         )
+        B_UI_Map.addAction(self.gr_remove, _fnRemoveAction, inputs, True)
 
         #!
-        def _fnReset():
-            for b_ui in B_UI_Map._map.values():
-                b_ui.reset()
+        def _fnResetAction(*inputValues):
+            B_Session.setInputValues(inputs, inputValues)
+            B_UI_Map.resetChanged()
+        def _fnReset(*inputValues):
+            _fnResetAction(*inputValues)
             return B_UI_Map.getOutputUpdates() + B_Prompt_Map.buildPromptUpdate()
         self.gr_reset.click(
-            fn = _fnReset
+            fn = B_Session.wrap(_fnReset)
+            , inputs = inputs
             , outputs = outputs
         )
+        B_UI_Map.addAction(self.gr_reset, _fnResetAction, inputs, False)
 
         #!
-        def _fnClear():
-            for b_ui in B_UI_Map._map.values():
+        def _fnClearAction(*inputValues):
+            B_Session.setInputValues(inputs, inputValues)
+            for b_ui in B_UI_Map.getAll():
                 b_ui.reset(True)
+        def _fnClear(*inputValues):
+            _fnClearAction(*inputValues)
             return B_UI_Map.getOutputUpdates() + B_Prompt_Map.buildPromptUpdate()
         self.gr_clear.click(
-            fn = _fnClear
+            fn = B_Session.wrap(_fnClear)
+            , inputs = inputs
             , outputs = outputs
         )
+        B_UI_Map.addAction(self.gr_clear, _fnClearAction, inputs, False)
         
         #! Would be better if the original config file dump function is used somehow:
         def _fnClearConfigFile():
@@ -1888,19 +2903,54 @@ class B_UI_Master():
                 file_config.truncate()
             return gr_clear_config_update(interactive = False)
         self.gr_clear_config.click(
-            fn = _fnClearConfigFile
+            fn = B_Events.wrap(_fnClearConfigFile)
             , outputs = self.gr_clear_config
         )
+
+        # - Hot reload
+        if self.gr_reload is not None:
+            b_ui_reloadable = [b_ui for b_ui in self.layout if isinstance(b_ui, B_UI_Container) and b_ui.gr_deferred is not None]
+            def _fnReload():
+                self.reload()
+
+                # Sessions render again the containers they last saw in an older version
+                return [b_ui.getRenderUpdate(True) for b_ui in b_ui_reloadable]
+            triggers = [self.gr_reload.click]
+            if self.gr_reload_timer is not None:
+                triggers.append(self.gr_reload_timer.tick)
+            gr.on(
+                triggers = triggers
+                , fn = B_Session.wrap(_fnReload)
+                , outputs = [b_ui.gr_deferred for b_ui in b_ui_reloadable]
+            )
+    
+        # - Event stats
+        if self.gr_event_stats is not None:
+            def _fnSaveEventStats():
+                paths = B_Events.export(os.path.join(self.path_script_config, "event_stats"))
+                printGeneral(f"Event stats saved -> {', '.join(paths)}")
+            self.gr_event_stats.click(fn = _fnSaveEventStats)
     
     def ui(self) -> list[typing.Any]:
-        self.build()
-        self.bind()
+        with B_Startup.section("build"):
+            self.build()
+        with B_Startup.section("bind"):
+            self.bind()
+        B_Startup.finish(os.path.join(self.path_script_config, b_file_name_startup_baseline), startup_profile > 1)
 
         gr_list: list[typing.Any] = [
             self.gr_prompt
             , self.gr_prompt_negative
             , self.gr_prepend_prompts
             , self.gr_use_break
+            , self.gr_token_budget
+            , self.gr_normalize
+            , self.gr_vary_prompt
+            , self.gr_matrix
+            , self.gr_matrix_start
+            , self.gr_matrix_stride
+            , self.gr_matrix_cap
+            , self.gr_session
             , self.gr_apply
             , self.gr_remove
             , self.gr_clear
@@ -1912,6 +2962,41 @@ class B_UI_Master():
             gr_list += b_ui.getGrForWebUI()
         
         return gr_list
+    
+    @staticmethod
+    def getFragments(prompt: str, fragments: list[str]) -> list[str]:
+        """Fragments of a final prompt unless it was edited by hand, which then is one fragment"""
+        if ", ".join(fragments) == prompt:
+            return fragments
+        return [prompt] if len(prompt) > 0 else []
+    
+    def getTokensInfo(self, prompt: str, prompt_negative: str, token_budget: bool) -> str:
+        fragments = B_Prompt_Map.buildPromptFragments() if token_budget else ([], [])
+        infos: list[str] = []
+        for label, text, text_fragments in (("Tokens", prompt, fragments[0]), ("Negative", prompt_negative, fragments[1])):
+            tokens, chunks = B_Tokens.measure(text)
+            info = f"{label}: {tokens} ({chunks} chunk{'s' if chunks != 1 else ''}"
+            if token_budget:
+                info += f", {B_Tokens.pack(self.getFragments(text, text_fragments))[1]} packed"
+            infos.append(info + ")")
+        return " · ".join(infos)
+    
+    def sample(self, count: int, seed: int = None) -> list[tuple[list[str], list[str]]]:
+        """Build prompt fragments for independently randomized layouts, leaving the current selections untouched (sample i is seeded with seed + i)"""
+        samples: list[tuple[list[str], list[str]]] = []
+        
+        selection = B_Prompt_Map.getSelection()
+        try:
+            for i in range(count):
+                rng = random.Random(seed + i if seed is not None else None)
+                for b_ui in self.layout:
+                    if isinstance(b_ui, B_UI_Container):
+                        b_ui.randomizeTagged(rng)
+                samples.append(B_Prompt_Map.buildPromptFragments())
+        finally:
+            B_Prompt_Map.setSelection(selection)
+        
+        return samples
 
 #: Webui script
 class Script(scripts.Script):
@@ -1926,6 +3011,40 @@ class Script(scripts.Script):
     def ui(self, is_img2img):
         return self.b_ui_master.ui()
 
+    @staticmethod
+    def combine(
+            prompt_webui: str
+            , prompt_negative_webui: str
+            , prompts: list[str]
+            , prompts_negative: list[str]
+            , prepend: bool
+            , use_break: bool
+            , token_budget: bool = False
+        ) -> tuple[str, str]:
+
+        return (
+            Script.combineFragments(prompt_webui, prompts, prepend, use_break, token_budget)
+            , Script.combineFragments(prompt_negative_webui, prompts_negative, prepend, use_break, token_budget)
+        )
+    
+    @staticmethod
+    def combineFragments(prompt_webui: str, prompts: list[str], prepend: bool, use_break: bool, token_budget: bool) -> str:
+        if token_budget:
+            # Chunk boundaries only between fragments (and between the webui prompt and these if use_break)
+            prompts_webui = [prompt_webui] if len(prompt_webui) > 0 else []
+            fragments = prompts + prompts_webui if prepend else prompts_webui + prompts
+            boundary = len(prompts) if prepend else len(prompts_webui)
+            return B_Tokens.pack(fragments, (boundary,) if use_break else ())[0]
+        
+        prompt_a, prompt_b = prompt_webui, ", ".join(prompts)
+        if prepend:
+            prompt_a, prompt_b = prompt_b, prompt_a
+        
+        if use_break and len(prompt_a) > 0 and len(prompt_b) > 0:
+            prompt_a = B_Prompt.Fn.added(prompt_a, break_prompt, use_space=False)
+        
+        return B_Prompt.Fn.added(prompt_a, prompt_b, use_space=False)
+
     def run(
             self
             , p
@@ -1933,22 +3052,132 @@ class Script(scripts.Script):
             , prompt_negative: str
             , prepend: bool
             , use_break: bool
+            , token_budget: bool
+            , normalize: bool
+            , vary_prompt: bool
+            , matrix: str
+            , matrix_start: int
+            , matrix_stride: int
+            , matrix_cap: int
+            , session: str
             , *outputValues
         ):
 
-        prompt_a, prompt_b, prompt_negative_a, prompt_negative_b = p.prompt, prompt, p.negative_prompt, prompt_negative
-        if prepend:
-            prompt_a, prompt_b, prompt_negative_a, prompt_negative_b = prompt_b, prompt_a, prompt_negative_b, prompt_negative_a
-        
-        if use_break:
-            if (len(prompt_a) > 0 and len(prompt_b) > 0):
-                prompt_a = B_Prompt.Fn.added(prompt_a, break_prompt, use_space=False)
-            if (len(prompt_negative_a) > 0 and len(prompt_negative_b) > 0):
-                prompt_negative_a = B_Prompt.Fn.added(prompt_negative_a, break_prompt, use_space=False)
-
-        p.prompt = B_Prompt.Fn.added(prompt_a, prompt_b, use_space=False)
-        p.negative_prompt = B_Prompt.Fn.added(prompt_negative_a, prompt_negative_b, use_space=False)
+        # Randomize/enumerate a copy of the prompt state of the session, which may keep changing meanwhile
+        with B_Session.use(session) as b_session:
+            if b_session is not None and b_session.expired:
+                raise RuntimeError("B Prompt builder: the prompt state of this page expired, reload the page")
+            with B_Prompt_State.use(b_session.state.fork() if b_session is not None else B_Prompt_State._shared.fork()):
+                B_Prompt_Map.setNormalize(normalize)
+                return self.runState(p, prompt, prompt_negative, prepend, use_break, token_budget, vary_prompt, matrix, matrix_start, matrix_stride, matrix_cap)
+    
+    def runState(
+            self
+            , p
+            , prompt: str
+            , prompt_negative: str
+            , prepend: bool
+            , use_break: bool
+            , token_budget: bool
+            , vary_prompt: bool
+            , matrix: str
+            , matrix_start: int
+            , matrix_stride: int
+            , matrix_cap: int
+        ):
+        b_prompt_matrix = B_Prompt_Matrix.fromText(matrix) if len(matrix.strip()) > 0 else None
+        if b_prompt_matrix is not None:
+            # Cleared Number fields come as None
+            start = max(0, int(matrix_start or 0))
+            stride = max(1, int(matrix_stride or 1))
+            cap = max(0, int(matrix_cap or 0))
+            return self.runMatrix(p, b_prompt_matrix, start, stride, cap, prepend, use_break, token_budget)
+
+        if not vary_prompt:
+            fragments, fragments_negative = B_Prompt_Map.buildPromptFragments()
+            p.prompt, p.negative_prompt = self.combine(
+                p.prompt
+                , p.negative_prompt
+                , B_UI_Master.getFragments(prompt, fragments)
+                , B_UI_Master.getFragments(prompt_negative, fragments_negative)
+                , prepend
+                , use_break
+                , token_budget
+            )
+        else:
+            # One prompt per image: the webui expands list prompts into p.all_prompts / p.all_negative_prompts
+            # - seeded like the images (seed + i) so a generation can be reproduced from its seed
+            fix_seed(p)
+            prompts: list[str] = []
+            prompts_negative: list[str] = []
+            for prompt_sample, prompt_negative_sample in self.b_ui_master.sample(p.batch_size * p.n_iter, int(p.seed)):
+                prompt_combined, prompt_negative_combined = self.combine(p.prompt, p.negative_prompt, prompt_sample, prompt_negative_sample, prepend, use_break, token_budget)
+                prompts.append(prompt_combined)
+                prompts_negative.append(prompt_negative_combined)
+            p.prompt, p.negative_prompt = prompts, prompts_negative
         
         proc = process_images(p)
         
         return proc
+    
+    def runMatrix(self, p, b_prompt_matrix: B_Prompt_Matrix, start: int, stride: int, cap: int, prepend: bool, use_break: bool, token_budget: bool):
+        """Process the matrix in batch sized chunks pulled from its generator, all with the same seed; only the last matrix_images_kept images are returned"""
+        fix_seed(p)
+
+        batch_size = max(1, p.batch_size)
+        count = b_prompt_matrix.count(start, stride, cap)
+        printGeneral(f"Prompt matrix: {count} of {b_prompt_matrix.total} combinations from index {start}")
+        shared.state.job_count = -(-count // batch_size)
+
+        proc = None
+        processed = 0
+        index_next = start
+        generator = b_prompt_matrix.generate(start, stride, cap)
+        try:
+            while not shared.state.interrupted:
+                chunk = list(itertools.islice(generator, batch_size))
+                if len(chunk) == 0:
+                    break
+                
+                prompts: list[str] = []
+                prompts_negative: list[str] = []
+                for index, (prompt_combination, prompt_negative_combination) in chunk:
+                    prompt_combined, prompt_negative_combined = self.combine(p.prompt, p.negative_prompt, prompt_combination, prompt_negative_combination, prepend, use_break, token_budget)
+                    prompts.append(prompt_combined)
+                    prompts_negative.append(prompt_negative_combined)
+                    index_next = index + stride
+                
+                p_chunk = copy.copy(p)
+                p_chunk.n_iter = 1
+                p_chunk.batch_size = len(chunk)
+                p_chunk.prompt, p_chunk.negative_prompt = prompts, prompts_negative
+                p_chunk.seed = [p.seed] * len(chunk)
+                
+                proc_chunk = process_images(p_chunk)
+                processed += len(chunk)
+                if proc is None:
+                    proc = proc_chunk
+                else:
+                    for k in ("images", "all_prompts", "all_negative_prompts", "all_seeds", "all_subseeds", "infotexts"):
+                        if hasattr(proc, k) and hasattr(proc_chunk, k):
+                            getattr(proc, k).extend(getattr(proc_chunk, k))
+                
+                # Older images would otherwise all stay in memory until the run ends
+                if matrix_images_kept > 0:
+                    for k in ("images", "all_prompts", "all_negative_prompts", "all_seeds", "all_subseeds", "infotexts"):
+                        values = getattr(proc, k, None)
+                        if values is not None and len(values) > matrix_images_kept:
+                            del values[:-matrix_images_kept]
+        finally:
+            generator.close()
+        
+        if matrix_images_kept > 0 and processed > matrix_images_kept:
+            printGeneral(f"Prompt matrix: {processed} combinations processed, the last {matrix_images_kept} returned")
+        if index_next < b_prompt_matrix.total:
+            printGeneral(f"Prompt matrix: resume from index {index_next}")
+        
+        if proc is None:
+            p.prompt, p.negative_prompt = self.combine(p.prompt, p.negative_prompt, *B_Prompt_Map.buildPromptFragments(), prepend, use_break, token_budget)
+            proc = process_images(p)
+        
+        return proc
@@ -0,0 +1,23 @@
+"""Tests of the prompt builder core (lib_b_prompt_builder), which runs without gradio or the webui
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+path_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if path_root not in sys.path:
+    sys.path.insert(0, path_root)
+
+from lib_b_prompt_builder import B_Prompt_Map, B_Tokens
+
+@pytest.fixture(autouse = True)
+def promptMap():
+    """Every test starts from an empty prompt map, and token counts are estimated (no tokenizer download)"""
+    B_Prompt_Map.clear()
+    B_Tokens.setTokenizer(None)
+    yield
+    B_Prompt_Map.clear()
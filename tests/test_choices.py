@@ -0,0 +1,49 @@
+import os
+import random
+
+from lib_b_prompt_builder import B_Choice_File
+
+def writeChoices(tmp_path, text: str) -> str:
+    path = os.path.join(tmp_path, "choices.txt")
+    with open(path, "w", encoding = "utf8", newline = "") as file:
+        file.write(text)
+    return path
+
+def test_entriesSkipBlanksAndComments(tmp_path):
+    choice_file = B_Choice_File.get(writeChoices(tmp_path, "\ufeffRed\r\n\n  # comment\n  Dark Green  \nBlue"))
+    assert len(choice_file) == 3
+    assert [choice_file.getEntry(i) for i in range(3)] == ["Red", "Dark Green", "Blue"]
+    assert choice_file.find("Dark Green") == 1
+    assert choice_file.find("Red") == 0
+    assert choice_file.find("comment") == -1
+    assert choice_file.find("Green") == -1
+
+def test_searchAndPages(tmp_path):
+    choice_file = B_Choice_File.get(writeChoices(tmp_path, "".join(f"entry {i}\n" for i in range(25)) + "# entry 99\n"))
+    assert list(choice_file.search("ENTRY 1")) == [1] + list(range(10, 20))
+    assert list(choice_file.search("entry 1")) == list(choice_file.search("entry 1")) # Cached
+    assert list(choice_file.search("entry 12")) == [12]
+    assert list(choice_file.search("99")) == []
+
+    entries, page, pages = choice_file.getPage("", 9, 10)
+    assert (page, pages) == (3, 3)
+    assert entries == [f"entry {i}" for i in range(20, 25)]
+
+def test_readAgainOnceChanged(tmp_path):
+    path = writeChoices(tmp_path, "a\nb\n")
+    choice_file = B_Choice_File.get(path)
+    assert B_Choice_File.get(path) is choice_file
+
+    writeChoices(tmp_path, "a\nb\nc\n")
+    os.utime(path, ns = (0, choice_file.stat[0] + 1))
+    choice_file_changed = B_Choice_File.get(path)
+    assert choice_file_changed is not choice_file
+    assert len(choice_file_changed) == 3
+
+def test_missingFile(tmp_path):
+    assert B_Choice_File.get(os.path.join(tmp_path, "missing.txt")) is None
+
+def test_sampleDistinctEntries(tmp_path):
+    choice_file = B_Choice_File.get(writeChoices(tmp_path, "a\nb\nc\n"))
+    entries = choice_file.sample(random.Random(0), 5)
+    assert sorted(entries) == ["a", "b", "c"]
@@ -0,0 +1,16 @@
+import importlib.util
+import os
+
+from conftest import path_root
+
+def loadBenchmark():
+    spec = importlib.util.spec_from_file_location("bench_b_prompt_builder", os.path.join(path_root, "benchmarks", "bench_b_prompt_builder.py"))
+    bench = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bench)
+    return bench
+
+def test_importWithoutUiModules():
+    bench = loadBenchmark()
+    results, loaded = bench.benchmarkImport(3)
+    assert loaded == []
+    assert results["import lib_b_prompt_builder"]["ms"] <= bench.import_time_max_ms
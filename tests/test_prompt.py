@@ -0,0 +1,109 @@
+from lib_b_prompt_builder import (
+    B_Symbols
+    , B_Prompt_Single
+    , B_Prompt_Dual
+    , B_Prompt_Edit
+    , B_Prompt_Edit_Link
+    , B_Prompt_Entries
+    , B_Prompt_State
+    , B_Prompt_Map
+)
+
+def select(*b_prompts):
+    for b_prompt in b_prompts:
+        B_Prompt_Map.update(b_prompt)
+
+def test_assemblyFollowsLayoutOrder():
+    a = B_Prompt_Single("A", "cat", 1.2)
+    b = B_Prompt_Dual("B", "dog", 1, "blurry", 1)
+    c = B_Prompt_Single("C", "bird", negative = True)
+    assert B_Prompt_Map.buildPromptUpdate() == ["", ""]
+
+    select(c, b, a)
+    assert B_Prompt_Map.buildPromptUpdate() == ["(cat:1.2), dog", "blurry, bird"]
+
+    B_Prompt_Map.update(b, True)
+    assert B_Prompt_Map.buildPromptUpdate() == ["(cat:1.2)", "bird"]
+
+def test_assemblyRebuildsChangedValues():
+    a = B_Prompt_Single("A", "cat")
+    select(a)
+    assert B_Prompt_Map.buildPromptUpdate() == ["cat", ""]
+
+    a.values.update("prompt", "kitten")
+    B_Prompt_Map.invalidate(a)
+    assert B_Prompt_Map.buildPromptUpdate() == ["kitten", ""]
+
+def test_referencesAndLinksFollowTheirDependencies():
+    a = B_Prompt_Single("A", "cat", 1.2)
+    c = B_Prompt_Single("C", "${A} on a mat")
+    e = B_Prompt_Edit("E", "male", "female", 35)
+    l = B_Prompt_Edit_Link("L", "E", "slim", "muscular")
+    B_Prompt_Map.resolve()
+    select(a, c, e, l)
+    assert B_Prompt_Map.buildPromptUpdate()[0] == "(cat:1.2), (cat:1.2) on a mat, [male:female:0.65], [slim:muscular:0.65]"
+    assert B_Prompt_Map.getDependents(a.id) == [c.id]
+    assert B_Prompt_Map.getDependents(e.id) == [l.id]
+
+    a.values.update("prompt", "kitten")
+    B_Prompt_Map.invalidate(a)
+    e.values.update("edit", 80)
+    B_Prompt_Map.invalidate(e)
+    assert B_Prompt_Map.buildPromptUpdate()[0] == "(kitten:1.2), (kitten:1.2) on a mat, [male:female:0.2], [slim:muscular:0.2]"
+
+def test_cyclicReferencesAreLeftAsText():
+    x = B_Prompt_Single("X", "${Y}")
+    y = B_Prompt_Single("Y", "${X}")
+    B_Prompt_Map.resolve()
+    select(x, y)
+    assert B_Prompt_Map.buildPromptUpdate()[0] == "${X}, ${X}"
+
+def test_forkedStatesKeepTheirOwnSelection():
+    a = B_Prompt_Single("A", "cat")
+    b = B_Prompt_Single("B", "dog")
+    select(a)
+
+    state = B_Prompt_State._shared.fork()
+    with B_Prompt_State.use(state):
+        select(b)
+        B_Prompt_Map.update(a, True)
+        assert B_Prompt_Map.buildPromptUpdate() == ["dog", ""]
+
+    assert B_Prompt_Map.buildPromptUpdate() == ["cat", ""]
+    assert B_Prompt_Map.getSelection() == [a]
+
+def test_selectionBetweenSkipsUnselected():
+    b_prompts = [B_Prompt_Single(f"P{i}", f"p{i}") for i in range(6)]
+    select(b_prompts[0], b_prompts[2], b_prompts[3], b_prompts[5])
+    assert B_Prompt_Map.getSelectionBetween(b_prompts[1], b_prompts[4]) == [b_prompts[2], b_prompts[3]]
+
+def test_reorderKeepsSelections():
+    a = B_Prompt_Single("A", "cat")
+    b = B_Prompt_Single("B", "dog")
+    select(a, b)
+    B_Prompt_Map.reorder([b.id, a.id])
+    assert B_Prompt_Map.buildPromptUpdate() == ["dog, cat", ""]
+
+def test_entriesAssembleInTheirPlace():
+    a = B_Prompt_Single("A", "first")
+    entries = B_Prompt_Entries("Entries", ["red", "green", "blue"].__getitem__, postfix = "thing")
+    z = B_Prompt_Single("Z", "last")
+    select(z, a)
+    entries.setSelected([2, 0])
+    assert B_Prompt_Map.buildPromptUpdate() == ["first, red thing, blue thing, last", ""]
+    assert [b_prompt.name for b_prompt in B_Prompt_Map.getSelection()] == ["A", "red", "blue", "Z"]
+
+    entries.reload()
+    assert entries.getSelected() == ()
+    assert B_Prompt_Map.buildPromptUpdate() == ["first, last", ""]
+
+def test_normalizeDropsDuplicateTags():
+    select(B_Prompt_Single("A", "cat, dog"), B_Prompt_Single("B", "(Cat:1.3), bird"))
+    B_Prompt_Map.setNormalize(True)
+    assert B_Prompt_Map.buildPromptUpdate() == ["(cat:1.3), dog, bird", ""]
+
+def test_duplicateNamesKeepTheLastPrompt():
+    B_Prompt_Single("A", "cat")
+    a = B_Prompt_Single("A", "dog")
+    assert B_Prompt_Map.get("A") is a
+    assert B_Prompt_Map.getById(B_Symbols.intern("A")) is a
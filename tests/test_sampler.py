@@ -0,0 +1,38 @@
+import collections
+import random
+
+from lib_b_prompt_builder import B_Sampler
+
+def test_zeroWeightsAreNeverDrawn():
+    sampler = B_Sampler([0, 1, 0, 2])
+    rng = random.Random(1)
+    assert len(sampler) == 2
+    assert {sampler.sample(rng) for _ in range(1000)} == {1, 3}
+
+def test_sampleFollowsWeights():
+    sampler = B_Sampler([1, 3])
+    rng = random.Random(2)
+    counts = collections.Counter(sampler.sample(rng) for _ in range(20000))
+    assert 0.72 < counts[1] / 20000 < 0.78
+
+def test_sampleDistinct():
+    sampler = B_Sampler([1] * 100)
+    for k in (0, 1, 10, 60, 100, 150):
+        indexes = sampler.sampleDistinct(random.Random(k), k)
+        assert len(indexes) == min(k, 100)
+        assert len(set(indexes)) == len(indexes)
+
+def test_sampleDistinctSkewedWeights():
+    sampler = B_Sampler([1000] + [0.001] * 50)
+    indexes = sampler.sampleDistinct(random.Random(3), 10)
+    assert len(set(indexes)) == 10
+    assert 0 in indexes
+
+def test_sameSeedSameDraw():
+    sampler = B_Sampler([1, 2, 3, 4, 5])
+    assert sampler.sampleDistinct(random.Random(7), 2) == sampler.sampleDistinct(random.Random(7), 2)
+
+def test_empty():
+    sampler = B_Sampler([])
+    assert len(sampler) == 0
+    assert sampler.sampleDistinct(random.Random(0), 3) == []
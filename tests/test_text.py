@@ -0,0 +1,44 @@
+"""Tags, tokens and layout lexer: the text stages of parsing and assembly"""
+
+from lib_b_prompt_builder import B_Tags, B_Tokens, B_Layout_Lexer
+
+def test_tagsSplitAtTopLevelCommas():
+    assert B_Tags.split("a, (b, c:1.2), [d, e], f\\, g,") == ["a", "(b, c:1.2)", "[d, e]", "f\\, g"]
+
+def test_tagsParseEmphasis():
+    assert B_Tags.parse("(cat:1.2)") == ("cat", 1.2)
+    assert B_Tags.parse("cat") == ("cat", 1.0)
+    assert B_Tags.parse("[cat:dog:0.5]") == ("[cat:dog:0.5]", 1.0)
+
+def test_tagsNormalized():
+    assert B_Tags.normalized(["cat, dog", "(Cat:1.3), bird", "dog"]) == ["(cat:1.3), dog", "bird"]
+    assert B_Tags.normalized(["(cat:0.5), dog", "cat"]) == ["(cat:0.5), dog"]
+
+def test_tokensEstimated():
+    assert B_Tokens.count("a cat") == 2
+    assert B_Tokens.count("(cat:1.2)") == 1
+    assert B_Tokens.measure("") == (0, 1)
+    assert B_Tokens.measure("a cat BREAK a dog") == (4, 2)
+
+def test_tokensPackFillsChunks():
+    assert B_Tokens.pack(["a cat", "a dog"]) == ("a cat, a dog", 1)
+    assert B_Tokens.pack(["a cat", "a dog"], {1}) == ("a cat BREAK a dog", 2)
+
+    fragment = ", ".join(["word"] * 40) # 79 tokens, two chunks each
+    prompt, chunks = B_Tokens.pack([fragment, fragment])
+    assert prompt == f"{fragment} BREAK {fragment}"
+    assert chunks == 4
+
+def test_lexerReadLine():
+    assert B_Layout_Lexer.readLine("\tSINGLE Some Prompt --pp cat --sp 1.2\n") == ("SINGLE", "Some Prompt", {"pp": "cat", "sp": "1.2"})
+    assert B_Layout_Lexer.readLine("END") == ("END", "", {})
+    assert B_Layout_Lexer.readLine("   ") == ("", None, {})
+    assert B_Layout_Lexer.readLine("ROW --x 1") == ("ROW", None, {"x": "1"})
+
+def test_lexerDuplicateArgumentKeepsTheLast(capsys):
+    assert B_Layout_Lexer.readLine("SINGLE P --pp x --pp y", 3) == ("SINGLE", "P", {"pp": "y"})
+    assert "@3:19: Duplicate argument -> 'pp'" in capsys.readouterr().out
+
+def test_lexerTokenize():
+    lines = B_Layout_Lexer.tokenize(b"TAB T\n# SINGLE Commented\n\nSINGLE P --pp x\nEND\n.\nSINGLE After\n")
+    assert lines == [(1, "TAB", "T", {}), (2, "#", None, {}), (4, "SINGLE", "P", {"pp": "x"}), (5, "END", "", {})]